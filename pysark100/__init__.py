@@ -7,10 +7,13 @@ Provides automated frequency sweeps, data collection, and visualization capabili
 """
 
 import math
-import serial
-from tqdm import tqdm
-from pysark100.collector import Sark100Collector
+import time
+import numpy as np
+from pysark100.collector import CollectorResult, Sark100Collector
+from pysark100.transport import open_device
+from pysark100.protocol import LineReader, first_lines, parse_block, split_sweep
 from pysark100.bands import bands, generate_band_frequencies
+from pysark100.stats import ScanStats
 
 try:
     from pysark100._version import __version__
@@ -20,109 +23,346 @@ except ImportError:
 __all__ = ["sark100", "sark100Scan", "bands", "generate_band_frequencies"]
 
 
-class sark100Scan:
+class sark100Scan(CollectorResult):
     """
     Handles a frequency sweep from the SARK100 device, collects and manages measurement data.
     """
     data_values = ['swr', 'r', 'x', 'z']
 
-    def __init__(self, parent, start, end, step=1000, progress=True):
+    def __init__(self, parent, start, end, step=1000, progress=True, sink=None, batch_size=4096):
         self.device = parent.device
-        self.data = Sark100Collector()
+        self.port = parent.port
+        self.reader = parent.reader
+        # Timings and counters are added to the device's ScanStats
+        self.stats = parent.stats
+        self.stats.count("scans")
+        total = math.ceil(((end - start) / step))
+        if sink is not None:
+            from pysark100.sink import open_sink
+            sink = open_sink(sink)
+        self.data = Sark100Collector(capacity=total + 1, sink=sink, batch_size=batch_size, stats=self.stats)
         self.step = step
         self.start = start
         self.cur_freq = start
         self.end = end + step
         self.progress = progress
+        self.finished = False
+        # The Error line or timeout which ended the sweep early, if any
+        self.error = None
+        # Lines which could not be parsed; their frequencies are left out
+        self.malformed = 0
+        # A SweepCache the sweep is added to once it completes cleanly
+        self.cache = None
         if self.progress:
-            total = math.ceil(((end - start) / step))
+            from tqdm import tqdm
             self.pbar = tqdm(total=total)
 
         self.device.write(f"scan {start} {end} {step}\r\n".encode())
 
     def _ensure_full(self):
-        while self.cur_freq < self.end:
-            try:
-                self.__next__()
-            except StopIteration:
-                break
+        # Take everything the port has buffered at once and parse it as one block.
+        # Malformed lines are counted in self.malformed and their frequency skipped.
+        try:
+            while not self.finished and self.cur_freq < self.end:
+                block, read_time = self._timed_read(self.reader.read_block)
+                if not block:
+                    self._stop(None)
+                    break
+                data, terminator, rest = split_sweep(block)
+                remaining = (self.end - self.cur_freq) // self.step
+                if data.count(b"\n") > remaining:
+                    # More lines than the sweep has points, drop the overrun
+                    data, _ = first_lines(data, remaining)
+                self._add_block(data, read_time)
+                if terminator is not None:
+                    self.reader.unread(rest)
+                    self._stop(terminator)
+        finally:
+            # Whatever was read reaches the sink, even if the sweep failed part way
+            self.data.flush()
+
+        # Consume the trailing End so it isn't read as the reply to the next command
+        if not self.finished:
+            self._read_data()
+        self.data.close()
 
-    def get_dataframe(self):
-        self._ensure_full()
-        return self.data.df
+    def _timed_read(self, read):
+        # Call a reader method, adding the time it spent outside the port to the read phase
+        stats = self.stats
+        waited = stats.time["device"]
+        started = time.perf_counter()
+        result = read()
+        elapsed = time.perf_counter() - started
+        stats.add("read", elapsed - (stats.time["device"] - waited))
+        return result, elapsed
 
-    def plot(self, *args, **kwargs):
-        self._ensure_full()
-        self.data.plot(*args, **kwargs)
+    def _add_block(self, data, read_time=0.0):
+        stats = self.stats
+        started = time.perf_counter()
+        values, good = parse_block(data)
+        elapsed = time.perf_counter() - started
+        stats.add("parse", elapsed)
+        count = len(values)
+        if not count:
+            return
+        stats.observe("parse", elapsed)
+        stats.observe("sample_latency", read_time / count, count)
+        freqs = self.cur_freq + self.step * np.arange(count, dtype=np.int64)
+        self.data.add_values(freqs[good], values[good])
+        malformed = count - int(np.count_nonzero(good))
+        self.malformed += malformed
+        stats.count("samples", count - malformed)
+        stats.count("malformed", malformed)
+        self.cur_freq += count * self.step
+        if self.progress:
+            self.pbar.update(count)
+            self.pbar.set_postfix({"Freqency": self.cur_freq})
 
-    def plot_interactive(self, *args, **kwargs):
-        self._ensure_full()
-        self.data.plot_interactive(*args, **kwargs)
+    def _stop(self, terminator):
+        # The sweep is over: terminator is "End", the device's Error line, or None after a timeout
+        self.finished = True
+        if terminator == "End":
+            self.cur_freq += self.step
+            if self.progress:
+                self.pbar.close()
+            if self.cache is not None and not self.malformed and self.data.sink is None:
+                self.cache.put(self.port, self.start, self.end - self.step, self.step, self.data)
+            return
+        self.error = terminator or "Timeout waiting for the SARK100"
+        self.stats.count("errors" if terminator else "timeouts")
+        print(self.error)
 
-    def plot_pyqtgraph(self, *args, **kwargs):
-        self._ensure_full()
-        self.data.plot_pyqtgraph(*args, **kwargs)
+    def plot_live(self, *args, **kwargs):
+        """
+        Open a PyQtGraph window now and plot the sweep as it arrives.
+        See pysark100.live.plot_live for the options.
+        """
+        from pysark100.live import plot_live
+        return plot_live(self, *args, **kwargs)
 
     def __iter__(self):
         return self
 
-    def __next__(self):
+    def _read_data(self):
+        """
+        Read the next measurement line from the device.
+        Returns the raw "swr,r,x,z" string, or None once the sweep has finished.
+        """
+        stats = self.stats
+        waited = stats.time["device"]
+        started = time.perf_counter()
         while True:
-            data = self.device.readline().decode('utf-8').strip()
+            raw = self.reader.readline()
+            data = raw.decode('utf-8', 'replace').strip()
 
             # If we're run over just stop the Iteration
             if self.cur_freq > self.end:
-                raise StopIteration
+                return None
+
+            # Nothing arrived before the serial timeout, the device has stopped sending
+            if not raw:
+                self._stop(None)
+                return None
 
             # We skip responses we don't care about
             if data in ["Start", "", ">>"]:
                 continue
 
-            # The SARK100 has said it's ended it's data
-            if data == "End":
-                self.cur_freq += self.step
-                if self.progress:
-                    self.pbar.close()
-                raise StopIteration
-
-            # The SARK100 has said there's been an error, so raise an error
-            if "Error" in data:
-                print(data)
-                raise StopIteration
+            # The SARK100 has ended its data or reported an error
+            if data == "End" or "Error" in data:
+                self._stop(data)
+                return None
 
             # We've got data, break out of our loop
             break
 
+        elapsed = time.perf_counter() - started
+        stats.add("read", elapsed - (stats.time["device"] - waited))
+        stats.observe("sample_latency", elapsed)
+
         if self.progress:
             self.pbar.update(1)
             self.pbar.set_postfix({"Freqency": self.cur_freq})
 
-        self.data.add_measurement(self.cur_freq, data)
-        self.cur_freq += self.step
-        return dict(zip(self.data_values, data.split(",")))
+        return data
+
+    def __next__(self):
+        while True:
+            data = self._read_data()
+            if data is None:
+                self.data.close()
+                raise StopIteration
+
+            started = time.perf_counter()
+            try:
+                values = self.data.parse_measurement(data)
+            except ValueError:
+                # Count it and move on, the line still stood for this frequency
+                self.malformed += 1
+                self.stats.count("malformed")
+                self.cur_freq += self.step
+                continue
+
+            self.stats.add("parse", time.perf_counter() - started)
+            self.stats.count("samples")
+            self.data.add_values((self.cur_freq,), (values,))
+            self.cur_freq += self.step
+            return dict(zip(self.data_values, data.split(",")))
 
 
 class sark100:
     """
     Main interface to the SARK100 device. Handles connection and scan commands.
     """
-    def __init__(self, port='/dev/ttyUSB0'):
-        self.device = serial.Serial(
-            port=port,  # Replace with your port name (e.g., 'COM1' on Windows)
-            baudrate=57600,
-            bytesize=8,
-            timeout=5,
-            stopbits=serial.STOPBITS_ONE
-        )
-
-    def scan(self, start, end, step=1000, progress=False):
+    def __init__(self, port='/dev/ttyUSB0', cache=None, capture=None):
+        # port may be a serial device, a sim:// or replay:// URL or an already opened transport
+        self.port = port
+        # With a capture path the session is recorded for replay, see pysark100.capture
+        self.capture = None
+        if capture is not None:
+            from pysark100.capture import CaptureWriter
+            self.capture = CaptureWriter(capture, port=port, version=__version__)
+        self.device = self._open()
+        # Timings and counters of every sweep on this device, see pysark100.stats
+        self.stats = ScanStats()
+        self.reader = LineReader(self.device, self.stats)
+        # Completed sweeps reused by scan(), see pysark100.cache.SweepCache; True for the defaults
+        if cache is True:
+            from pysark100.cache import SweepCache
+            cache = SweepCache()
+        self.cache = cache
+
+    def _open(self):
+        device = open_device(self.port)
+        if self.capture is not None:
+            from pysark100.capture import RecordingTransport
+            device = RecordingTransport(device, self.capture)
+        return device
+
+    def reconnect(self):
+        """
+        Close and reopen the port, e.g. after a USB reset. Transports handed
+        in already opened, and replays, which hold the whole recorded
+        session, are kept as they are.
+        """
+        if not isinstance(self.port, str) or self.port.startswith("replay://"):
+            return
+        try:
+            self.device.close()
+        except OSError:
+            pass
+        self.device = self._open()
+        self.reader = LineReader(self.device, self.stats)
+        self.stats.count("reconnects")
+
+    def scan(self, start, end, step=1000, progress=False, adaptive=False, sink=None, batch_size=4096,
+             use_cache=True, **adaptive_options):
+        """
+        Sweep from start to end (Hz) in steps of step Hz.
+
+        With a cache on this device, a range and step lying within a cached
+        sweep are sliced from it without touching the device, and completed
+        sweeps are added to it. use_cache=False always sweeps. Adaptive
+        sweeps and sweeps to a sink bypass the cache.
+
+        With a sink (a .csv, .parquet or .arrow path, or a SweepSink) the
+        measurements are written out every batch_size rows as they arrive
+        instead of being held in memory.
+
+        With adaptive=True a coarse pass is made first and only the regions
+        around SWR minima, X zero crossings and fast changes are rescanned at
+        step; see sark100AdaptiveScan for the tuning options.
+        """
+        if adaptive and sink is not None:
+            raise ValueError("Streaming to a sink is not supported for adaptive scans")
+        if adaptive:
+            from pysark100.adaptive import sark100AdaptiveScan
+            print(f"Adaptively getting data between {start} and {end} refining to a step of {step}.")
+            return sark100AdaptiveScan(self, start, end, step, progress=progress, **adaptive_options)
+
+        cache = self.cache if use_cache and sink is None else None
+        if cache is not None:
+            hit = cache.lookup(self.port, start, end, step)
+            if hit is not None:
+                from pysark100.cache import sark100CachedScan
+                self.stats.count("cache_hits")
+                print(f"Serving {start} to {end} with a step of {step} from a sweep cached {hit[1]:.0f}s ago.")
+                return sark100CachedScan(self, start, end, step, *hit)
+            self.stats.count("cache_misses")
+
         total = math.ceil(((end - start) / step))
         print(f"Getting data between {start} and {end} with a step of {step} for a total of {total} data points.")
-        return sark100Scan(self, start, end, step, progress)
+        scan = sark100Scan(self, start, end, step, progress, sink=sink, batch_size=batch_size)
+        scan.cache = cache
+        return scan
 
-    def scan_band(self, band, buffer_pct=0.15, step=1000, progress=False):
+    def scan_chunked(self, start, end, step=1000, chunk_points=500, retries=3, backoff=0.5, checkpoint=None,
+                     progress=False, on_chunk=None):
+        """
+        Sweep from start to end (Hz) as a series of scan commands of
+        chunk_points points each. Failed chunks are retried with backoff and,
+        with a checkpoint directory, finished chunks are saved so an
+        interrupted sweep resumes from the last completed chunk. See
+        sark100ChunkedScan for the per-chunk status.
+        """
+        from pysark100.chunked import sark100ChunkedScan
+        scan = sark100ChunkedScan(self, start, end, step, chunk_points=chunk_points, retries=retries,
+                                  backoff=backoff, checkpoint=checkpoint, progress=progress, on_chunk=on_chunk)
+        done = sum(c["state"] == "done" for c in scan.chunks)
+        resumed = f", {done} already done" if done else ""
+        print(f"Getting data between {start} and {end} with a step of {step} in {len(scan.chunks)} chunks{resumed}.")
+        return scan
+
+    def scan_averaged(self, start, end, step=1000, sweeps=8, average="clipped", sigma=3.0, block=32,
+                      progress=False):
+        """
+        Sweep from start to end (Hz) `sweeps` times and reduce the sweeps per
+        frequency. The values are the `average` ("clipped", "mean" or
+        "median") and the spread is added in <name>_std columns; see
+        sark100AveragedScan. Sweeps are reduced `block` at a time, so memory
+        doesn't grow with the number of sweeps.
+        """
+        from pysark100.averaging import sark100AveragedScan
+        scan = sark100AveragedScan(self, start, end, step, sweeps=sweeps, average=average, sigma=sigma,
+                                   block=block, progress=progress)
+        print(f"Getting data between {start} and {end} with a step of {step}, averaging {sweeps} sweeps.")
+        return scan
+
+    def scan_band(self, band, buffer_pct=0.15, step=1000, progress=False, adaptive=False, sink=None,
+                  batch_size=4096, use_cache=True, **adaptive_options):
         freq_list = generate_band_frequencies(band, buffer_pct=buffer_pct, step_hz=step)
-        return self.scan(freq_list[0], freq_list[-1], step, progress=progress)
+        return self.scan(freq_list[0], freq_list[-1], step, progress=progress, adaptive=adaptive, sink=sink,
+                         batch_size=batch_size, use_cache=use_cache, **adaptive_options)
+
+    def scan_bands(self, band_names, buffer_pct=0.15, step=1000, progress=False, adaptive=False, **adaptive_options):
+        """
+        Sweep several bands back-to-back on this device. Overlapping or
+        adjacent buffered ranges are merged into one sweep; see
+        sark100MultiBandScan for the per-band results.
+        """
+        from pysark100.multiband import sark100MultiBandScan
+        scan = sark100MultiBandScan(self, band_names, buffer_pct=buffer_pct, step=step, progress=progress,
+                                    adaptive=adaptive, **adaptive_options)
+        print(f"Scanning {', '.join(scan.band_names)} in {len(scan.plan)} sweeps.")
+        return scan
+
+    def monitor(self, start=None, end=None, step=1000, band=None, buffer_pct=0.01, interval=60.0, log=None,
+                **options):
+        """
+        Watch start..end (Hz), or a band with buffer_pct added either side,
+        by sweeping it every `interval` seconds. Changed sweeps and alerts go
+        to the MonitorLog directory `log`; see SweepMonitor for the options.
+        Call run() on the returned monitor to start it.
+        """
+        from pysark100.monitor import SweepMonitor
+        if band is not None:
+            freq_list = generate_band_frequencies(band, buffer_pct=buffer_pct, step_hz=step)
+            start, end = freq_list[0], freq_list[-1]
+        if start is None or end is None:
+            raise ValueError("monitor needs start and end, or a band")
+        return SweepMonitor(self, start, end, step, interval=interval, log=log, **options)
 
     def __end__(self):
         self.device.close()
+        if self.capture is not None:
+            self.capture.close()
@@ -0,0 +1,149 @@
+"""
+Adaptive coarse-to-fine sweeps.
+A coarse pass locates the interesting parts of a range and only those are
+rescanned at the requested step, cutting the number of device round trips.
+"""
+import numpy as np
+from pysark100.collector import CollectorResult, Sark100Collector
+
+
+def refine_regions(df, swr_threshold=2.0, swr_curvature=0.5, x_curvature=25.0, swr_ceiling=10.0):
+    """
+    Find the parts of a coarse sweep worth rescanning at a finer step.
+
+    A coarse point is flagged when SWR crosses swr_threshold next to it (the
+    edges of the matched bandwidth), when it is the lowest SWR of a stretch
+    of points below swr_ceiling, when X changes sign next to it, or when the
+    slope of SWR or X changes there by more than swr_curvature / x_curvature,
+    meaning the coarse points do not describe the curve well. Minima and
+    slope changes are ignored where SWR is above swr_ceiling, far from any
+    usable match, and the small local minima noise makes along a broad
+    resonance are not refined. Each flagged point is widened to its
+    neighbouring coarse points.
+
+    Parameters
+    ----------
+    df : polars.DataFrame
+        Coarse sweep with freq, swr and x columns, sorted by freq
+    swr_threshold : float
+        SWR whose crossings, the 2:1 bandwidth edges by default, are refined
+    swr_curvature : float
+        Second difference of SWR across a coarse point that triggers refinement
+    x_curvature : float
+        Second difference of X in Ohms across a coarse point that triggers refinement
+    swr_ceiling : float
+        SWR above which minima and slope changes are not refined
+
+    Returns
+    -------
+    List[Tuple[int, int]]
+        Merged (start, end) frequency ranges in Hz
+    """
+    n = len(df)
+    if n == 0:
+        return []
+
+    freq = df["freq"].to_numpy()
+    swr = df["swr"].to_numpy()
+    x = df["x"].to_numpy()
+
+    flagged = np.zeros(n, dtype=bool)
+
+    # Steps between neighbours which cross the SWR threshold
+    matched = swr <= swr_threshold
+    edges = matched[:-1] != matched[1:]
+    flagged[:-1] |= edges
+    flagged[1:] |= edges
+
+    # The lowest point of every stretch below the ceiling, including the range edges
+    below = swr <= swr_ceiling
+    if below.any():
+        begins = np.concatenate(([below[0]], below[1:] & ~below[:-1]))
+        lowest = np.minimum.reduceat(np.where(below, swr, np.inf), np.flatnonzero(begins))
+        # Points before the first stretch get index -1 but are not below the ceiling
+        flagged |= below & (swr == lowest[np.cumsum(begins) - 1])
+
+    # Steps between neighbours which cross X = 0
+    crossings = np.sign(x[:-1]) != np.sign(x[1:])
+    flagged[:-1] |= crossings
+    flagged[1:] |= crossings
+
+    # Points where the slope changes quickly
+    bends = np.abs(np.diff(swr, 2)) > swr_curvature
+    bends |= np.abs(np.diff(x, 2)) > x_curvature
+    flagged[1:-1] |= bends & (swr[1:-1] <= swr_ceiling)
+
+    # Widen every flagged point to its neighbours so the refinement brackets it
+    widened = flagged.copy()
+    widened[:-1] |= flagged[1:]
+    widened[1:] |= flagged[:-1]
+    if n == 1:
+        return [(int(freq[0]), int(freq[0]))] if widened[0] else []
+
+    # Contiguous runs of flagged points become the regions to refine
+    edges = np.diff(np.concatenate(([0], widened.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1) - 1
+    return [(int(freq[s]), int(freq[e])) for s, e in zip(starts, ends) if e > s]
+
+
+class sark100AdaptiveScan(CollectorResult):
+    """
+    Coarse-to-fine sweep. A coarse pass is made at step * coarse_factor, then
+    each region returned by refine_regions() is rescanned at step. All passes
+    are merged into one frequency sorted Sark100Collector in `data`.
+
+    The sweep runs when the data is first requested; `passes` records the
+    (start, end, step) of every scan command issued.
+    """
+    def __init__(self, parent, start, end, step=1000, coarse_factor=10, swr_threshold=2.0,
+                 swr_curvature=0.5, x_curvature=25.0, swr_ceiling=10.0, progress=False):
+        from pysark100 import sark100Scan
+
+        self._scan_class = sark100Scan
+        self.parent = parent
+        self.stats = parent.stats
+        self.start = start
+        self.end = end
+        self.step = step
+        self.coarse_step = step * max(1, int(coarse_factor))
+        self.swr_threshold = swr_threshold
+        self.swr_curvature = swr_curvature
+        self.x_curvature = x_curvature
+        self.swr_ceiling = swr_ceiling
+        self.progress = progress
+        self.passes = []
+        self.data = Sark100Collector()
+        self._done = False
+
+    def _run(self, start, end, step):
+        self.passes.append((start, end, step))
+        scan = self._scan_class(self.parent, start, end, step, progress=self.progress)
+        scan._ensure_full()
+        return scan.data
+
+    def _ensure_full(self):
+        if self._done:
+            return
+        self._done = True
+
+        coarse = self._run(self.start, self.end, self.coarse_step)
+        if (self.end - self.start) % self.coarse_step:
+            # The coarse grid stops short of the end, measure it so the tail is covered
+            coarse = Sark100Collector.concat([coarse, self._run(self.end, self.end, self.coarse_step)])
+        regions = refine_regions(
+            coarse.df,
+            swr_threshold=self.swr_threshold,
+            swr_curvature=self.swr_curvature,
+            x_curvature=self.x_curvature,
+            swr_ceiling=self.swr_ceiling
+        )
+        # The ends of each region are coarse points which have been measured already
+        fine = [self._run(lo + self.step, hi - self.step, self.step) for lo, hi in regions
+                if hi - lo > self.step]
+        self.data = Sark100Collector.concat([coarse] + fine)
+
+    def __iter__(self):
+        self._ensure_full()
+        df = self.data.df
+        return iter(df.select(["freq"] + Sark100Collector.value_columns).iter_rows(named=True))
@@ -0,0 +1,264 @@
+"""
+Asyncio interface to the SARK100.
+Mirrors sark100 / sark100Scan for use inside an event loop, so many devices
+can be swept concurrently without a thread per device.
+"""
+import asyncio
+import math
+from pysark100.collector import Sark100Collector
+from pysark100.transport import open_device
+from pysark100.bands import generate_band_frequencies
+
+
+class AsyncTransport:
+    """
+    Non-blocking line reader around a serial.Serial-like device.
+
+    The device is switched to non-blocking reads (timeout=0). Where it exposes
+    a file descriptor the event loop is told to wake when it becomes readable,
+    otherwise in_waiting is polled every poll_interval seconds. While lines
+    are already buffered the reader still yields to the event loop every
+    yield_every lines.
+    """
+    yield_every = 64
+
+    def __init__(self, device, poll_interval=0.005):
+        self.device = device
+        self.device.timeout = 0
+        self.poll_interval = poll_interval
+        self.lock = asyncio.Lock()
+        # Sweeps which were abandoned and whose remaining lines must be skipped
+        self.stale_sweeps = 0
+        self._buffer = bytearray()
+        self._unyielded = 0
+        try:
+            self._fd = device.fileno()
+        except (AttributeError, OSError, ValueError):
+            self._fd = None
+
+    def write(self, data):
+        self.device.write(data)
+
+    async def _wait_readable(self, timeout=None):
+        if self._fd is None:
+            await asyncio.sleep(self.poll_interval if timeout is None else min(self.poll_interval, timeout))
+            return
+        loop = asyncio.get_running_loop()
+        ready = loop.create_future()
+
+        def wake():
+            if not ready.done():
+                ready.set_result(None)
+
+        loop.add_reader(self._fd, wake)
+        timer = loop.call_later(timeout, wake) if timeout is not None else None
+        try:
+            await ready
+        finally:
+            loop.remove_reader(self._fd)
+            if timer is not None:
+                timer.cancel()
+
+    async def readline(self, timeout=None):
+        """
+        Read one line, raising asyncio.TimeoutError if it does not arrive
+        within timeout seconds.
+
+        The timeout is checked here rather than with asyncio.wait_for, which
+        wraps every line in a task and on Python < 3.12 can swallow a
+        cancellation arriving as the line completes.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        while b"\n" not in self._buffer:
+            data = self.device.read(self.device.in_waiting or 1)
+            if data:
+                self._buffer += data
+                continue
+            remaining = None
+            if deadline is not None:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    raise asyncio.TimeoutError()
+            await self._wait_readable(remaining)
+            self._unyielded = 0
+        # When the device has a backlog every line is already buffered and the
+        # reader would never suspend, starving other tasks and cancellation
+        self._unyielded += 1
+        if self._unyielded >= self.yield_every:
+            self._unyielded = 0
+            await asyncio.sleep(0)
+        end = self._buffer.find(b"\n") + 1
+        line = bytes(self._buffer[:end])
+        del self._buffer[:end]
+        return line
+
+    async def skip_stale(self, line_timeout=None):
+        # Read past the rest of any abandoned sweep so its lines aren't taken as ours
+        while self.stale_sweeps:
+            line = await self.readline(line_timeout)
+            data = line.decode("utf-8", "replace").strip()
+            if data == "End" or "Error" in data:
+                self.stale_sweeps -= 1
+
+    def close(self):
+        self.device.close()
+
+
+class async_sark100Scan:
+    """
+    An asynchronous frequency sweep. Iterate with `async for` to receive each
+    measurement as it arrives, or await collect() for the whole sweep.
+    Measurements are added to the same Sark100Collector as a sark100Scan.
+
+    line_timeout bounds the wait for each line and sweep_timeout the whole
+    sweep; either raises asyncio.TimeoutError. A sweep which is cancelled or
+    times out is marked stale so the next sweep on the device skips its lines.
+    Leaving `async for` early does not release the device: use the sweep as
+    `async with`, or await aclose(). Malformed lines are counted in
+    `malformed` and their frequency skipped, as in sark100Scan.
+    """
+    data_values = ['swr', 'r', 'x', 'z']
+
+    def __init__(self, parent, start, end, step=1000, line_timeout=5, sweep_timeout=None):
+        self.transport = parent.transport
+        total = math.ceil(((end - start) / step))
+        self.data = Sark100Collector(capacity=total + 1)
+        self.step = step
+        self.start = start
+        self.cur_freq = start
+        self.end = end + step
+        self.line_timeout = line_timeout
+        self.sweep_timeout = sweep_timeout
+        self.finished = False
+        self.error = None
+        # Lines which could not be parsed; their frequencies are left out
+        self.malformed = 0
+        self._started = False
+        self._deadline = None
+
+    async def _begin(self):
+        loop = asyncio.get_running_loop()
+        if self.sweep_timeout is not None:
+            self._deadline = loop.time() + self.sweep_timeout
+        await self.transport.lock.acquire()
+        try:
+            await self.transport.skip_stale(self.line_timeout)
+        except BaseException:
+            self.transport.lock.release()
+            raise
+        self.transport.write(f"scan {self.start} {self.end - self.step} {self.step}\r\n".encode())
+        self._started = True
+
+    def _finish(self, stale=False):
+        if self.finished:
+            return
+        self.finished = True
+        if stale:
+            self.transport.stale_sweeps += 1
+        if self._started:
+            self.transport.lock.release()
+
+    def _timeout(self):
+        # The per-line timeout, shortened to whatever is left of the sweep timeout
+        if self._deadline is None:
+            return self.line_timeout
+        remaining = max(0.0, self._deadline - asyncio.get_running_loop().time())
+        if self.line_timeout is None:
+            return remaining
+        return min(self.line_timeout, remaining)
+
+    async def _read_data(self):
+        while True:
+            line = await self.transport.readline(self._timeout())
+            data = line.decode('utf-8', 'replace').strip()
+
+            # We skip responses we don't care about
+            if data in ["Start", "", ">>"]:
+                continue
+
+            # The SARK100 has said it's ended it's data
+            if data == "End":
+                return None
+
+            # The SARK100 has reported an error, keep it for the caller
+            if "Error" in data:
+                self.error = data
+                return None
+
+            return data
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.finished:
+            raise StopAsyncIteration
+        while True:
+            try:
+                if not self._started:
+                    await self._begin()
+                data = await self._read_data()
+                values = None if data is None else self.data.parse_measurement(data)
+            except ValueError:
+                # Count it and move on, the line still stood for this frequency
+                self.malformed += 1
+                self.cur_freq += self.step
+                continue
+            except BaseException:
+                # Cancelled, timed out or failed part way, the device is still sending
+                self._finish(stale=self._started)
+                raise
+            break
+
+        if data is None:
+            self._finish()
+            raise StopAsyncIteration
+
+        self.data.add_values((self.cur_freq,), (values,))
+        self.cur_freq += self.step
+        return dict(zip(self.data_values, data.split(",")))
+
+    async def aclose(self):
+        """
+        Stop reading the sweep and release the device. The rest of an
+        unfinished sweep is marked stale and skipped by the next one.
+        """
+        self._finish(stale=self._started)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    async def collect(self):
+        """
+        Run the sweep to the end and return its Sark100Collector.
+        """
+        async for _ in self:
+            pass
+        return self.data
+
+    async def get_dataframe(self):
+        return (await self.collect()).df
+
+
+class async_sark100:
+    """
+    Asyncio interface to a SARK100. Accepts the same ports as sark100.
+    Sweeps on one device are run one after another; sweeps on different
+    devices run concurrently in the same event loop.
+    """
+    def __init__(self, port='/dev/ttyUSB0', poll_interval=0.005):
+        self.transport = AsyncTransport(open_device(port), poll_interval=poll_interval)
+
+    def scan(self, start, end, step=1000, line_timeout=5, sweep_timeout=None):
+        return async_sark100Scan(self, start, end, step, line_timeout=line_timeout, sweep_timeout=sweep_timeout)
+
+    def scan_band(self, band, buffer_pct=0.15, step=1000, line_timeout=5, sweep_timeout=None):
+        freq_list = generate_band_frequencies(band, buffer_pct=buffer_pct, step_hz=step)
+        return self.scan(freq_list[0], freq_list[-1], step, line_timeout=line_timeout, sweep_timeout=sweep_timeout)
+
+    def close(self):
+        self.transport.close()
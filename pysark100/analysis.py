@@ -0,0 +1,315 @@
+"""
+Vectorized antenna analysis of sweep frames.
+Every function works on a frame with the collector columns (freq, swr, r, x,
+z) using whole-column NumPy and Polars operations, so a million-point sweep
+is analysed in milliseconds. Passing `by` (e.g. "sweep_id" for the frames
+returned by SweepStore.query) analyses many sweeps in the same pass.
+"""
+import numpy as np
+import polars as pl
+
+DEFAULT_LIMITS = (2.0, 1.5)
+
+
+def _prepare(df, by):
+    # The frame sorted by sweep and frequency, and for each pair of
+    # neighbouring rows whether they belong to the same sweep, so rows from
+    # different sweeps are never paired. Frames already in order, as
+    # collectors and stored sweeps are, are not sorted again.
+    if isinstance(df, pl.LazyFrame):
+        df = df.collect()
+    n = len(df)
+    if by is None:
+        if not df["freq"].is_sorted():
+            df = df.sort("freq")
+        return df, np.ones(max(n - 1, 0), dtype=bool)
+
+    for _ in range(2):
+        keys = df[by]
+        same = (keys.slice(1) == keys.slice(0, max(n - 1, 0))).fill_null(False).to_numpy()
+        freq = df["freq"].to_numpy()
+        ordered = not np.any(same & (freq[1:] < freq[:-1]))
+        # Each sweep must form one contiguous block
+        if ordered and n - np.count_nonzero(same) == keys.n_unique():
+            break
+        df = df.sort(by, "freq")
+    return df, same
+
+
+def _with_groups(df, by, rows, columns):
+    # Output frame for the given row positions of df, led by the `by` column
+    if by is not None:
+        columns = {by: df[by].gather(rows), **columns}
+    return pl.DataFrame(columns)
+
+
+def reflection(df, z0=50.0):
+    """
+    Add reflection columns computed from R and X against a reference
+    impedance z0, so they can be taken for systems other than 50 Ohms:
+
+    gamma
+        Magnitude of the reflection coefficient |(Z - z0) / (Z + z0)|
+    return_loss
+        -20 log10 |gamma| in dB, infinite at a perfect match
+    mismatch_loss
+        -10 log10 (1 - |gamma|^2) in dB
+
+    Parameters
+    ----------
+    df : polars.DataFrame | polars.LazyFrame
+        Frame with r and x columns
+    z0 : float
+        Reference impedance in Ohms
+
+    Returns
+    -------
+    polars.DataFrame | polars.LazyFrame
+        df with gamma, return_loss and mismatch_loss added
+    """
+    r, x = pl.col("r"), pl.col("x")
+    gamma = (((r - z0) ** 2 + x ** 2) / ((r + z0) ** 2 + x ** 2)).sqrt()
+    return df.with_columns(gamma.alias("gamma")).with_columns(
+        (-20 * pl.col("gamma").log10()).alias("return_loss"),
+        (-10 * (1 - pl.col("gamma") ** 2).log10()).alias("mismatch_loss"),
+    )
+
+
+def resonances(df, by=None):
+    """
+    Find the resonances of a sweep: the frequencies where X crosses zero,
+    linearly interpolated between the neighbouring samples.
+
+    Q is estimated from the impedance slope at each resonance as
+    f0 |dZ/df| / (2 R), which holds for both series (X rising) and parallel
+    (X falling) resonances.
+
+    Parameters
+    ----------
+    df : polars.DataFrame | polars.LazyFrame
+        Frame with the collector columns
+    by : Optional[str]
+        Column identifying separate sweeps, e.g. "sweep_id"
+
+    Returns
+    -------
+    polars.DataFrame
+        One row per resonance: freq, r, swr, slope (dX/df in Ohms per Hz),
+        q and kind ("series" or "parallel")
+    """
+    df, same = _prepare(df, by)
+    freq = df["freq"].to_numpy().astype(np.float64)
+    swr, r, x = (df[c].to_numpy() for c in ("swr", "r", "x"))
+    n = len(df)
+    sign = np.sign(x)
+
+    # Sign changes between neighbours, interpolated
+    crossing = np.flatnonzero(same & (sign[:-1] * sign[1:] < 0))
+    # Samples sitting exactly on zero, once per run of zeros
+    zeros = np.flatnonzero(sign == 0)
+    if len(zeros):
+        first = np.ones(len(zeros), dtype=bool)
+        first[1:] = (np.diff(zeros) != 1) | ~same[zeros[:-1]]
+        zeros = zeros[first]
+
+    at = np.concatenate((crossing, zeros))
+    t = np.concatenate((x[crossing] / (x[crossing] - x[crossing + 1]), np.zeros(len(zeros))))
+    order = np.argsort(at + t, kind="stable")
+    at, t = at[order], t[order]
+
+    # The samples either side used for the slope, kept within the sweep
+    prev_ok = np.concatenate(([False], same))
+    next_ok = np.concatenate((same, [False]))
+    lo = np.where((t == 0) & prev_ok[at], at - 1, at)
+    hi = np.where(next_ok[at], at + 1, at)
+
+    def interp(a):
+        return a[at] + t * (a[np.minimum(at + 1, n - 1)] - a[at])
+
+    f0 = interp(freq)
+    r0 = interp(r)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        span = freq[hi] - freq[lo]
+        slope = (x[hi] - x[lo]) / span
+        r_slope = (r[hi] - r[lo]) / span
+        q = f0 * np.hypot(slope, r_slope) / (2 * r0)
+
+    return _with_groups(df, by, at, {
+        "freq": f0,
+        "r": r0,
+        "swr": interp(swr),
+        "slope": slope,
+        "q": q,
+        "kind": np.where(slope >= 0, "series", "parallel"),
+    })
+
+
+def swr_minima(df, max_swr=None, by=None):
+    """
+    Find the local SWR minima of a sweep. On a flat bottom the first
+    sample is reported.
+
+    Parameters
+    ----------
+    df : polars.DataFrame | polars.LazyFrame
+        Frame with the collector columns
+    max_swr : Optional[float]
+        Only report minima at or below this SWR
+    by : Optional[str]
+        Column identifying separate sweeps, e.g. "sweep_id"
+
+    Returns
+    -------
+    polars.DataFrame
+        One row per minimum with freq, swr, r and x
+    """
+    df, same = _prepare(df, by)
+    swr = df["swr"].to_numpy()
+
+    # Neighbours outside the sweep count as higher
+    prev = np.concatenate(([np.inf], np.where(same, swr[:-1], np.inf)))
+    nxt = np.concatenate((np.where(same, swr[1:], np.inf), [np.inf]))
+    found = (swr < prev) & (swr <= nxt)
+    if max_swr is not None:
+        found &= swr <= max_swr
+
+    rows = np.flatnonzero(found)
+    return _with_groups(df, by, rows, {c: df[c].to_numpy()[rows] for c in ("freq", "swr", "r", "x")})
+
+
+def bandwidths(df, limits=DEFAULT_LIMITS, by=None):
+    """
+    Find every range where SWR is at or below each limit, with the edges
+    interpolated to where SWR crosses the limit.
+
+    Q is estimated from each bandwidth as (f0 / BW) (S - 1) / sqrt(S) for
+    an SWR limit S, taking f0 as the lowest SWR in the range. It is only
+    meaningful for a single resonance matched close to the reference
+    impedance.
+
+    Parameters
+    ----------
+    df : polars.DataFrame | polars.LazyFrame
+        Frame with the collector columns
+    limits : Sequence[float]
+        SWR limits, by default 2:1 and 1.5:1
+    by : Optional[str]
+        Column identifying separate sweeps, e.g. "sweep_id"
+
+    Returns
+    -------
+    polars.DataFrame
+        One row per range and limit: limit, low, high, bandwidth (Hz),
+        min_swr, min_swr_freq, q and complete, false when the range runs
+        off the end of the sweep so the true bandwidth is wider
+    """
+    df, same = _prepare(df, by)
+    freq_hz = df["freq"].to_numpy()
+    freq = freq_hz.astype(np.float64)
+    swr = df["swr"].to_numpy()
+
+    frames = []
+    for limit in limits:
+        below = swr <= limit
+        prev_below = np.concatenate(([False], below[:-1] & same))
+        next_below = np.concatenate((below[1:] & same, [False]))
+        starts = np.flatnonzero(below & ~prev_below)
+        ends = np.flatnonzero(below & ~next_below)
+
+        # An edge is interpolated where the sample before / after is in the same sweep
+        low_open = np.concatenate(([False], same))[starts]
+        high_open = np.concatenate((same, [False]))[ends]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            a = np.maximum(starts - 1, 0)
+            low = np.where(low_open, freq[a] + (limit - swr[a]) * (freq[starts] - freq[a]) / (swr[starts] - swr[a]),
+                           freq[starts])
+            b = np.minimum(ends + 1, len(freq) - 1)
+            high = np.where(high_open, freq[ends] + (limit - swr[ends]) * (freq[b] - freq[ends]) / (swr[b] - swr[ends]),
+                            freq[ends])
+
+        # Lowest sample in each range, the first sample reaching each range's minimum
+        inside = np.flatnonzero(below)
+        blocks = np.searchsorted(inside, starts)
+        values = swr[inside]
+        lowest = np.minimum.reduceat(values, blocks) if len(inside) else values
+        hits = np.flatnonzero(values == np.repeat(lowest, ends - starts + 1))
+        best = inside[hits[np.searchsorted(hits, blocks)]]
+
+        width = high - low
+        with np.errstate(divide="ignore", invalid="ignore"):
+            q = np.where(width > 0, freq[best] / width * (limit - 1) / np.sqrt(limit), np.nan)
+
+        frames.append(_with_groups(df, by, starts, {
+            "limit": np.full(len(starts), float(limit)),
+            "low": low,
+            "high": high,
+            "bandwidth": width,
+            "min_swr": swr[best],
+            "min_swr_freq": freq_hz[best],
+            "q": q,
+            "complete": low_open & high_open,
+        }))
+    return pl.concat(frames)
+
+
+def summary(df, limits=DEFAULT_LIMITS, by=None):
+    """
+    Summarise each sweep in one row: the lowest SWR and its frequency, the
+    return loss there, the resonance nearest to it with its Q, and the
+    width of the range around it at or below each SWR limit, in columns
+    bw_2, bw_1.5 and so on (null where SWR never gets that low).
+
+    Parameters
+    ----------
+    df : polars.DataFrame | polars.LazyFrame
+        Frame with the collector columns
+    limits : Sequence[float]
+        SWR limits for the bandwidth columns
+    by : Optional[str]
+        Column identifying separate sweeps, e.g. "sweep_id"
+
+    Returns
+    -------
+    polars.DataFrame
+        One row per sweep
+    """
+    if isinstance(df, pl.LazyFrame):
+        df = df.collect()
+    grouped = by is not None
+    if not grouped:
+        by = "_sweep"
+        df = df.with_columns(pl.lit(0).alias(by))
+
+    best = (
+        df.group_by(by)
+        .agg(
+            pl.col("swr").min().alias("min_swr"),
+            pl.col("freq").get(pl.col("swr").arg_min()).alias("min_swr_freq"),
+        )
+        .with_columns((20 * ((pl.col("min_swr") + 1) / (pl.col("min_swr") - 1)).log10()).alias("return_loss"))
+        .sort(by)
+    )
+
+    # Nearest resonance to the best match
+    res = resonances(df, by=by).select(
+        by, pl.col("freq").alias("resonance"), pl.col("r").alias("resonance_r"), "q"
+    )
+    out = (
+        best.with_columns(pl.col("min_swr_freq").cast(pl.Float64).alias("_at"))
+        .sort("_at")
+        .join_asof(res.sort("resonance"), left_on="_at", right_on="resonance", by=by, strategy="nearest",
+                   check_sortedness=False)
+        .drop("_at")
+    )
+
+    # Width of the range holding the best match
+    bw = bandwidths(df, limits, by=by)
+    for limit in limits:
+        width = (
+            bw.filter(pl.col("limit") == float(limit))
+            .select(by, "min_swr_freq", pl.col("bandwidth").alias(f"bw_{limit:g}"))
+        )
+        out = out.join(width, on=[by, "min_swr_freq"], how="left")
+
+    out = out.sort(by)
+    return out if grouped else out.drop(by)
@@ -0,0 +1,220 @@
+"""
+Averaging of repeated sweeps.
+The same range is swept several times and the sweeps are reduced per
+frequency to a mean, median, standard deviation and an outlier-rejected mean.
+Sweeps are stacked a block at a time into a (sweeps, frequencies, columns)
+array and reduced in one vectorized pass per block, with running totals
+carried between blocks, so memory does not grow with the number of sweeps.
+"""
+import warnings
+import numpy as np
+from pysark100.collector import CollectorResult, Sark100Collector
+
+AVERAGES = ("clipped", "mean", "median")
+# Scale from the median absolute deviation to the standard deviation of a normal distribution
+MAD_SCALE = 1.4826
+
+
+class SweepAverager:
+    """
+    Streaming per-frequency reduction of sweeps on a fixed grid.
+
+    Sweeps passed to add() are held in a (block, points, 4) array. Each
+    full block is reduced at once:
+
+    - count, mean and sum of squared deviations of every sample, merged
+      into the running totals with Chan's parallel update, for the mean
+      and standard deviation
+    - the block median and its median absolute deviation; samples more
+      than `sigma` robust standard deviations (1.4826 MAD) from the block
+      median are rejected, and the rest are added to the running sum and
+      count of the clipped mean
+    - the block median is kept for the overall median, taken as the median
+      of the block medians. It is exact while all sweeps fit in one block.
+
+    Memory is O(block * points) plus one points-sized array per block for
+    the medians. NaN marks a missing point and is left out everywhere.
+    """
+    def __init__(self, points, sigma=3.0, block=32):
+        if block < 1:
+            raise ValueError("block must be at least 1")
+        self.points = points
+        self.sigma = sigma
+        self.block = block
+        shape = (points, len(Sark100Collector.value_columns))
+        self._stack = np.empty((block,) + shape)
+        self._filled = 0
+        self._count = np.zeros(shape)
+        self._mean = np.zeros(shape)
+        self._m2 = np.zeros(shape)
+        self._kept = np.zeros(shape)
+        self._kept_sum = np.zeros(shape)
+        self._rejected = np.zeros(points, dtype=np.int64)
+        self._medians = []
+        self.sweeps = 0
+
+    def add(self, grid):
+        """
+        Add a sweep as a (points, 4) array, NaN where a point is missing.
+        """
+        self._stack[self._filled] = grid
+        self._filled += 1
+        self.sweeps += 1
+        if self._filled == self.block:
+            self._reduce()
+
+    def _reduce(self):
+        if not self._filled:
+            return
+        stack = self._stack[:self._filled]
+        valid = ~np.isnan(stack)
+        count = valid.sum(axis=0).astype(np.float64)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            total = np.where(valid, stack, 0.0).sum(axis=0)
+            mean = np.where(count > 0, total / count, 0.0)
+            m2 = np.where(valid, (stack - mean) ** 2, 0.0).sum(axis=0)
+
+            # Chan et al.: merge this block's count, mean and M2 into the running ones
+            n = self._count + count
+            delta = mean - self._mean
+            self._mean = np.where(n > 0, self._mean + delta * count / n, 0.0)
+            self._m2 = self._m2 + m2 + np.where(n > 0, delta ** 2 * self._count * count / n, 0.0)
+            self._count = n
+
+        median = self._nanmedian(stack, valid)
+        spread = MAD_SCALE * self._nanmedian(np.abs(stack - median), valid)
+        with np.errstate(invalid="ignore"):
+            # Where most samples agree exactly the spread is zero and any other value is rejected
+            outlier = valid & (np.abs(stack - median) > self.sigma * spread)
+        kept = valid & ~outlier
+        self._kept += kept.sum(axis=0)
+        self._kept_sum += np.where(kept, stack, 0.0).sum(axis=0)
+        self._rejected += outlier.any(axis=2).sum(axis=0)
+        self._medians.append(median)
+        self._filled = 0
+
+    @staticmethod
+    def _nanmedian(stack, valid):
+        # np.nanmedian along the sweeps, without its all-NaN warning
+        if valid.all():
+            return np.median(stack, axis=0)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            return np.nanmedian(stack, axis=0)
+
+    def result(self):
+        """
+        Reduce any sweeps still held and return the per-frequency statistics.
+
+        Returns
+        -------
+        Dict[str, numpy.ndarray]
+            (points, 4) arrays mean, median, std (sample standard deviation)
+            and clipped (mean of the samples kept), (points, 4) count of the
+            samples at each point and (points,) rejected, the number of
+            sweeps which had an outlier at each point. NaN where nothing
+            was measured.
+        """
+        self._reduce()
+        if len(self._medians) == 1:
+            median = self._medians[0]
+        else:
+            medians = np.stack(self._medians)
+            median = self._nanmedian(medians, ~np.isnan(medians))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            measured = self._count > 0
+            return {
+                "mean": np.where(measured, self._mean, np.nan),
+                "median": median,
+                "std": np.where(self._count > 1, np.sqrt(self._m2 / (self._count - 1)),
+                                np.where(measured, 0.0, np.nan)),
+                "clipped": np.where(self._kept > 0, self._kept_sum / self._kept, np.nan),
+                "count": self._count,
+                "rejected": self._rejected,
+            }
+
+
+class sark100AveragedScan(CollectorResult):
+    """
+    `sweeps` sweeps of the same range reduced by a SweepAverager.
+
+    `data` holds one row per frequency measured in any sweep. swr, r, x and
+    z are the chosen `average` ("clipped", "mean" or "median"). The spread
+    columns swr_std, r_std, x_std and z_std hold the standard deviation
+    over all samples. `samples` holds the number of sweeps which measured
+    the point, and `rejected` the number of sweeps with an outlier there.
+    statistics() returns every reduction.
+    """
+    def __init__(self, parent, start, end, step=1000, sweeps=8, average="clipped", sigma=3.0, block=32,
+                 progress=False):
+        from pysark100 import sark100Scan
+
+        if average not in AVERAGES:
+            raise ValueError(f"average must be one of {', '.join(AVERAGES)}")
+        if sweeps < 1:
+            raise ValueError("sweeps must be at least 1")
+        self._scan_class = sark100Scan
+        self.parent = parent
+        self.stats = parent.stats
+        self.start = start
+        self.end = end
+        self.step = step
+        self.sweeps = sweeps
+        self.average = average
+        self.progress = progress
+        self.points = (end - start) // step + 1
+        self.averager = SweepAverager(self.points, sigma=sigma, block=min(block, sweeps))
+        # The Error or timeout of every sweep which ended early
+        self.errors = []
+        self.data = Sark100Collector()
+        self._result = None
+
+    def _ensure_full(self):
+        if self._result is not None:
+            return
+        bar = None
+        if self.progress:
+            from tqdm import tqdm
+            bar = tqdm(total=self.sweeps, unit="sweep")
+        for _ in range(self.sweeps):
+            scan = self._scan_class(self.parent, self.start, self.end, self.step, progress=False)
+            scan._ensure_full()
+            if scan.error is not None:
+                self.errors.append(scan.error)
+            self.averager.add(scan.data.to_grid(self.start, self.step, self.points))
+            if bar is not None:
+                bar.update(1)
+        if bar is not None:
+            bar.close()
+
+        self._result = result = self.averager.result()
+        rows = np.flatnonzero(result["count"].max(axis=1) > 0)
+        freqs = self.start + rows.astype(np.int64) * self.step
+        extra = {f"{c}_std": result["std"][rows, i] for i, c in enumerate(Sark100Collector.value_columns)}
+        extra["samples"] = result["count"][rows].max(axis=1)
+        extra["rejected"] = result["rejected"][rows].astype(np.float64)
+        self.data = Sark100Collector.from_values(freqs, result[self.average][rows], extra)
+
+    def statistics(self):
+        """
+        Every reduction as a Polars DataFrame: freq and, for each of swr, r,
+        x and z, the columns <name>_mean, <name>_median, <name>_std and
+        <name>_clipped, then samples and rejected.
+        """
+        import polars as pl
+
+        self._ensure_full()
+        result = self._result
+        rows = np.flatnonzero(result["count"].max(axis=1) > 0)
+        columns = {"freq": self.start + rows.astype(np.int64) * self.step}
+        for i, c in enumerate(Sark100Collector.value_columns):
+            for name in ("mean", "median", "std", "clipped"):
+                columns[f"{c}_{name}"] = result[name][rows, i]
+        columns["samples"] = result["count"][rows].max(axis=1).astype(np.int64)
+        columns["rejected"] = result["rejected"][rows]
+        return pl.DataFrame(columns)
+
+    def __iter__(self):
+        self._ensure_full()
+        df = self.data.df
+        return iter(df.select(["freq"] + Sark100Collector.value_columns).iter_rows(named=True))
@@ -64,3 +64,143 @@ def generate_band_frequencies(band_name: str, buffer_pct: float = 0.0, step_hz:
 
     frequencies = list(range(buffered_start, buffered_end + 1, step_hz))
     return frequencies
+
+
+class BandIndex:
+    """
+    Sorted interval index over a band plan.
+
+    Umbrella entries which contain other bands (such as "hf") are left out so
+    the remaining bands do not overlap and every frequency maps to at most one
+    band. Entries with the same range are kept once, under the first name. Lookups are vectorized with NumPy and Polars.
+    """
+
+    def __init__(self, plan):
+        import numpy as np
+
+        # Bands sharing a range are one band, named after the first in the plan
+        ranges = {}
+        for name, info in plan.items():
+            ranges.setdefault((info["start"], info["end"]), name)
+        entries = sorted((start, end, name) for (start, end), name in ranges.items())
+        entries = [
+            (start, end, name) for i, (start, end, name) in enumerate(entries)
+            if not any(s >= start and e <= end for j, (s, e, _) in enumerate(entries) if j != i)
+        ]
+        self.starts = np.array([e[0] for e in entries], dtype=np.int64)
+        self.ends = np.array([e[1] for e in entries], dtype=np.int64)
+        self.names = [e[2] for e in entries]
+
+    def __len__(self):
+        return len(self.names)
+
+    def overlapping(self, min_freq, max_freq):
+        """
+        Return (name, start, end) for every band intersecting min_freq..max_freq (Hz).
+        """
+        import numpy as np
+
+        hits = np.flatnonzero((self.ends >= min_freq) & (self.starts <= max_freq))
+        return [(self.names[i], int(self.starts[i]), int(self.ends[i])) for i in hits]
+
+    def frame(self):
+        """
+        The index as a Polars DataFrame with band, band_start and band_end columns.
+        """
+        import polars as pl
+
+        return pl.DataFrame({
+            "band": pl.Series(self.names, dtype=pl.Utf8),
+            "band_start": pl.Series(self.starts, dtype=pl.Int64),
+            "band_end": pl.Series(self.ends, dtype=pl.Int64),
+        })
+
+    def label(self, df):
+        """
+        Add band, band_start and band_end columns to a frame with a freq
+        column, in one as-of join. Rows outside every band get nulls.
+        """
+        import polars as pl
+
+        columns = df.columns
+        labelled = (
+            df.with_row_index("_row")
+            .sort("freq")
+            .join_asof(self.frame(), left_on="freq", right_on="band_start", strategy="backward")
+            .sort("_row")
+        )
+        outside = pl.col("band_end").is_null() | (pl.col("freq") > pl.col("band_end"))
+        return labelled.select(
+            columns + [pl.when(outside).then(None).otherwise(pl.col(c)).alias(c) for c in ("band", "band_start", "band_end")]
+        )
+
+    def summary(self, df, swr_limit=2.0):
+        """
+        Per-band statistics of a collector frame in a single group-by:
+        points, lowest SWR and its frequency, mean SWR, and the fraction of
+        samples in the band with SWR at or below swr_limit (the 2:1 coverage
+        for the default limit).
+        """
+        import polars as pl
+
+        return (
+            self.label(df)
+            .filter(pl.col("band").is_not_null())
+            .group_by("band", "band_start", "band_end")
+            .agg(
+                pl.len().alias("points"),
+                pl.col("swr").min().alias("min_swr"),
+                pl.col("freq").get(pl.col("swr").arg_min()).alias("min_swr_freq"),
+                pl.col("swr").mean().alias("mean_swr"),
+                (pl.col("swr") <= swr_limit).mean().alias("coverage"),
+            )
+            .sort("band_start")
+        )
+
+
+_band_index = None
+
+
+def band_index():
+    """
+    The BandIndex of the current band plan, built once and cached.
+    """
+    global _band_index
+    if _band_index is None:
+        _band_index = BandIndex(bands)
+    return _band_index
+
+
+def load_band_plan(path):
+    """
+    Load a band plan from a file.
+
+    JSON files map band names to {"start": Hz, "end": Hz}, the same layout as
+    the bands dictionary. CSV files have name, start and end columns.
+
+    Returns
+    -------
+    Dict[str, Dict[str, int]]
+        The band plan
+    """
+    import csv
+    import json
+
+    if path.lower().endswith(".json"):
+        with open(path, "r", encoding="utf-8") as fh:
+            raw = json.load(fh)
+        return {name: {"start": int(b["start"]), "end": int(b["end"])} for name, b in raw.items()}
+
+    with open(path, "r", encoding="utf-8", newline="") as fh:
+        return {row["name"]: {"start": int(row["start"]), "end": int(row["end"])} for row in csv.DictReader(fh)}
+
+
+def use_band_plan(plan):
+    """
+    Replace the band plan used across pysark100, e.g. with one returned by
+    load_band_plan() for another region. `bands` is updated in place.
+    """
+    global _band_index
+    bands.clear()
+    bands.update(plan)
+    _band_index = None
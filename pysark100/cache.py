@@ -0,0 +1,154 @@
+"""
+In-memory cache of completed sweeps.
+A scan whose frequency grid lies within a recent sweep of the same device is
+answered by slicing that sweep's buffers, so repeated and narrower requests
+cost no device traffic.
+"""
+import threading
+import time
+from collections import OrderedDict, namedtuple
+import numpy as np
+from pysark100.collector import CollectorResult, Sark100Collector
+
+_Entry = namedtuple("_Entry", "device start last step collector stored")
+
+
+class SweepCache:
+    """
+    Completed sweeps keyed by device, range and step.
+
+    lookup() finds a sweep covering the requested grid: it must start at or
+    before the first requested frequency, reach the last, and have a step
+    dividing the requested step with the requested start on its grid. The
+    freshest such sweep is sliced. Sweeps older than `ttl` seconds are
+    dropped, and the least recently used ones are evicted once more than
+    `max_points` measurements or `max_entries` sweeps are held.
+
+    `counters` holds hits, misses, evictions (for size), expired sweeps and
+    the points served from the cache. A cache may be shared between
+    threads and between several sark100 instances.
+    """
+    def __init__(self, ttl=300.0, max_points=2_000_000, max_entries=None):
+        self.ttl = ttl
+        self.max_points = max_points
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._points = 0
+        self._lock = threading.Lock()
+        self.counters = dict.fromkeys(("hits", "misses", "evictions", "expired", "points_served"), 0)
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def points(self):
+        """
+        Measurements currently held.
+        """
+        return self._points
+
+    def _drop(self, key, counter):
+        entry = self._entries.pop(key)
+        self._points -= len(entry.collector)
+        self.counters[counter] += 1
+
+    def _expire(self, now):
+        if self.ttl is None:
+            return
+        for key in [k for k, e in self._entries.items() if now - e.stored > self.ttl]:
+            self._drop(key, "expired")
+
+    def put(self, device, start, end, step, collector):
+        """
+        Cache a completed sweep of start..end (Hz) in steps of step Hz.
+        Sweeps larger than max_points are not cached. The measurements are
+        copied, so the collector may be changed afterwards.
+        """
+        points = len(collector)
+        if points == 0 or points > self.max_points:
+            return
+        freq, values, _ = collector.buffers()
+        collector = Sark100Collector.from_values(freq, values)
+        last = start + (end - start) // step * step
+        key = (device, start, last, step)
+        with self._lock:
+            now = time.monotonic()
+            if key in self._entries:
+                self._drop(key, "evictions")
+            self._entries[key] = _Entry(device, start, last, step, collector, now)
+            self._points += points
+            self._expire(now)
+            limit = len(self._entries) if self.max_entries is None else self.max_entries
+            while self._entries and (self._points > self.max_points or len(self._entries) > limit):
+                self._drop(next(iter(self._entries)), "evictions")
+
+    def lookup(self, device, start, end, step):
+        """
+        A Sark100Collector of the cached measurements of start..end in steps
+        of step Hz, and the age of the sweep they came from in seconds, or
+        None when no cached sweep covers the request. The collector is a
+        copy which callers are free to change.
+        """
+        last = start + (end - start) // step * step
+        with self._lock:
+            now = time.monotonic()
+            self._expire(now)
+            covering = [
+                key for key, e in self._entries.items()
+                if e.device == device and e.start <= start and last <= e.last and step % e.step == 0
+                if (start - e.start) % e.step == 0
+            ]
+            best = max(covering, key=lambda key: self._entries[key].stored, default=None)
+            if best is None:
+                self.counters["misses"] += 1
+                return None
+            self._entries.move_to_end(best)
+            entry = self._entries[best]
+            self.counters["hits"] += 1
+
+        freq, values, _ = entry.collector.buffers()
+        lo = np.searchsorted(freq, start, side="left")
+        hi = np.searchsorted(freq, last, side="right")
+        freq, values = freq[lo:hi], values[lo:hi]
+        if step != entry.step:
+            keep = (freq - start) % step == 0
+            freq, values = freq[keep], values[keep]
+        with self._lock:
+            self.counters["points_served"] += len(freq)
+        return Sark100Collector.from_values(freq, values), now - entry.stored
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._points = 0
+
+    @property
+    def hit_rate(self):
+        lookups = self.counters["hits"] + self.counters["misses"]
+        return self.counters["hits"] / lookups if lookups else 0.0
+
+    def as_dict(self):
+        """
+        The counters with the hit rate, sweeps and points held.
+        """
+        return {**self.counters, "hit_rate": self.hit_rate, "entries": len(self), "points": self.points}
+
+
+class sark100CachedScan(CollectorResult):
+    """
+    A scan answered from a SweepCache without touching the device. `data`
+    holds the slice of the cached sweep and `age` its age in seconds.
+    """
+    def __init__(self, parent, start, end, step, data, age):
+        self.stats = parent.stats
+        self.start = start
+        self.end = end
+        self.step = step
+        self.data = data
+        self.age = age
+        self.error = None
+        self.finished = True
+
+    def __iter__(self):
+        df = self.data.df
+        return iter(df.select(["freq"] + Sark100Collector.value_columns).iter_rows(named=True))
@@ -0,0 +1,336 @@
+"""
+Capture and replay of serial sessions.
+RecordingTransport writes everything read from the device, with its arrival
+time, and every command sent to a compact binary capture file.
+ReplayTransport plays a capture back to sark100 as if the analyzer were
+attached, either with its original timing or as fast as it can be read.
+
+A capture file starts with the 8 byte magic b"SARKCAP1", a little-endian
+uint32 length and that many bytes of JSON metadata. Records follow, each a
+kind byte (b"R" for data read, b"W" for a command written), the time since
+the capture started as a float64 in seconds, the payload length as a uint32
+and the payload. An empty R record is a read which timed out.
+"""
+import json
+import mmap
+import struct
+import time
+from datetime import datetime, timezone
+import numpy as np
+
+MAGIC = b"SARKCAP1"
+_LENGTH = struct.Struct("<I")
+_RECORD = struct.Struct("<cdI")
+
+
+class CaptureWriter:
+    """
+    Appends records to a capture file. One writer may outlive several
+    transports, e.g. across sark100.reconnect(), so a whole session ends up
+    in one file. Commands are flushed straight away so a capture of a
+    session which crashed still holds what was sent.
+    """
+    def __init__(self, path, **meta):
+        self.path = path
+        self._fh = open(path, "wb")
+        self._started = time.perf_counter()
+        meta = {"started": datetime.now(timezone.utc).isoformat(), **meta}
+        header = json.dumps(meta, default=str).encode()
+        self._fh.write(MAGIC + _LENGTH.pack(len(header)) + header)
+        self.records = 0
+
+    def record(self, kind, data):
+        """
+        Write a record of kind b"R" or b"W" holding data.
+        """
+        self._fh.write(_RECORD.pack(kind, time.perf_counter() - self._started, len(data)))
+        if data:
+            self._fh.write(data)
+        self.records += 1
+        if kind == b"W":
+            self._fh.flush()
+
+    def flush(self):
+        if not self._fh.closed:
+            self._fh.flush()
+
+    def close(self):
+        self._fh.close()
+
+
+class RecordingTransport:
+    """
+    Wraps a serial.Serial-like device and records the session to a
+    CaptureWriter (or a new capture file at `capture` when given a path).
+    Everything else, in_waiting included, is passed through to the device
+    unchanged.
+    """
+    def __init__(self, device, capture):
+        self.device = device
+        self._owned = isinstance(capture, str)
+        self.capture = CaptureWriter(capture) if self._owned else capture
+
+    def __getattr__(self, name):
+        # Only called for attributes not found on the wrapper
+        return getattr(self.__dict__["device"], name)
+
+    @property
+    def timeout(self):
+        return self.device.timeout
+
+    @timeout.setter
+    def timeout(self, value):
+        self.device.timeout = value
+
+    def write(self, data):
+        self.capture.record(b"W", bytes(data))
+        return self.device.write(data)
+
+    def read(self, size=1):
+        data = self.device.read(size)
+        # With timeout=0 an empty read only means nothing was waiting yet
+        if data or getattr(self.device, "timeout", None) != 0:
+            self.capture.record(b"R", data)
+        return data
+
+    def readline(self):
+        data = self.device.readline()
+        self.capture.record(b"R", data)
+        return data
+
+    def close(self):
+        self.device.close()
+        if self._owned:
+            self.capture.close()
+        else:
+            self.capture.flush()
+
+
+def read_capture(path):
+    """
+    The metadata and records of a capture file.
+
+    Returns
+    -------
+    Tuple[dict, List[Tuple[bytes, float, bytes]]]
+        The metadata and (kind, seconds, payload) of every record
+    """
+    with open(path, "rb") as fh:
+        data = fh.read()
+    meta, kinds, times, offsets, lengths = _index(data, path)
+    records = [(kinds[i], times[i], data[offsets[i]:offsets[i] + lengths[i]]) for i in range(len(kinds))]
+    return meta, records
+
+
+def _index(buffer, path):
+    # The metadata and the kind, time, payload offset and length of every record
+    if buffer[:len(MAGIC)] != MAGIC:
+        raise ValueError(f"{path} is not a pysark100 capture file")
+    position = len(MAGIC) + _LENGTH.size
+    (length,) = _LENGTH.unpack_from(buffer, len(MAGIC))
+    meta = json.loads(bytes(buffer[position:position + length]))
+    position += length
+    kinds, times, offsets, lengths = [], [], [], []
+    end = len(buffer)
+    while position + _RECORD.size <= end:
+        kind, seconds, length = _RECORD.unpack_from(buffer, position)
+        position += _RECORD.size
+        if position + length > end:
+            # A record cut short by a crash; keep what was complete
+            break
+        kinds.append(kind)
+        times.append(seconds)
+        offsets.append(position)
+        lengths.append(length)
+        position += length
+    return meta, kinds, times, offsets, lengths
+
+
+class ReplayTransport:
+    """
+    A serial.Serial look-alike which plays back a capture file.
+
+    The data read in the recorded session is handed out in order, and the
+    data which followed each recorded command only once the same number of
+    commands has been written, so a scan sees the replies to its own
+    commands. Reads which timed out in the recording time out again at the
+    same point. With realtime=True data becomes readable as long after
+    the command it answers as it did when recorded, divided by `speed`;
+    otherwise everything up to the next command is readable at once. The
+    file is memory-mapped and payloads are only copied when read.
+
+    `commands` lists the commands written during replay and
+    `recorded_commands` those of the capture. With strict=True a command
+    differing from the recorded one raises ValueError. Like serial.Serial
+    it can be used in a with block, which closes the file and its mapping.
+    """
+    def __init__(self, path, realtime=False, speed=1.0, strict=False, timeout=5):
+        self.path = path
+        self.realtime = realtime
+        self.speed = float(speed)
+        self.strict = strict
+        self.timeout = timeout
+        self.is_open = True
+        self.commands = []
+        self._fh = open(path, "rb")
+        self._map = mmap.mmap(self._fh.fileno(), 0, access=mmap.ACCESS_READ)
+        self.meta, kinds, times, offsets, lengths = _index(self._map, path)
+
+        kinds = np.frombuffer(b"".join(kinds), dtype=np.uint8)
+        read = kinds == ord("R")
+        written = ~read
+        times = np.asarray(times, dtype=np.float64)
+        offsets = np.asarray(offsets, dtype=np.int64)
+        lengths = np.asarray(lengths, dtype=np.int64)
+        self.recorded_commands = [bytes(self._map[o:o + n]).decode("utf-8", "replace").strip()
+                                  for o, n in zip(offsets[written], lengths[written])]
+        self._command_times = times[written]
+        # The read records, each with the number of commands written before it
+        self._times = times[read]
+        self._offsets = offsets[read]
+        self._lengths = lengths[read]
+        self._after = np.cumsum(written)[read]
+        self._ends = np.concatenate(([0], np.cumsum(self._lengths)))
+        # For every read record the index of the next timed out (empty) one
+        count = len(self._lengths)
+        empty = np.flatnonzero(self._lengths == 0)
+        self._next_empty = np.full(count + 1, count, dtype=np.int64)
+        if len(empty):
+            slot = np.searchsorted(empty, np.arange(count), side="left")
+            self._next_empty[:count] = np.append(empty, count)[slot]
+        self._index = 0
+        self._offset = 0
+        self._anchor = (0.0, time.perf_counter())
+
+    @classmethod
+    def from_url(cls, url):
+        """
+        Open a replay from a URL such as ``replay:///tmp/field.cap`` or
+        ``replay://field.cap?realtime=1&speed=4``.
+        """
+        from urllib.parse import urlparse, parse_qsl
+
+        parsed = urlparse(url)
+        if parsed.scheme != "replay":
+            raise ValueError(f"Not a replay URL: {url}")
+        options = {}
+        for key, value in parse_qsl(parsed.query):
+            if key in ("realtime", "strict"):
+                options[key] = value.lower() in ("1", "true", "yes")
+            elif key in ("speed", "timeout"):
+                options[key] = float(value)
+            else:
+                raise ValueError(f"Unknown replay option '{key}' in {url}")
+        return cls(parsed.netloc + parsed.path, **options)
+
+    def __len__(self):
+        # Bytes of data in the capture
+        return int(self._ends[-1])
+
+    def _stop(self):
+        # Index of the first read record which cannot be read yet
+        stop = min(np.searchsorted(self._after, len(self.commands), side="right"), self._next_empty[self._index])
+        if self.realtime:
+            recorded, replayed = self._anchor
+            now = recorded + (time.perf_counter() - replayed) * self.speed
+            stop = min(stop, np.searchsorted(self._times, now, side="right"))
+        return max(int(stop), self._index)
+
+    def _due(self, index):
+        # Seconds until the read record at index is due, None if it waits for a command
+        if index >= len(self._lengths) or self._after[index] > len(self.commands):
+            return None
+        if not self.realtime:
+            return 0.0
+        recorded, replayed = self._anchor
+        return max(0.0, (self._times[index] - recorded) / self.speed - (time.perf_counter() - replayed))
+
+    @property
+    def in_waiting(self):
+        return int(self._ends[self._stop()] - self._ends[self._index]) - self._offset
+
+    def _take(self, size, line=False):
+        # Up to size bytes of the readable records, or up to the first newline
+        stop = self._stop()
+        chunks = []
+        while size > 0 and self._index < stop:
+            start = int(self._offsets[self._index]) + self._offset
+            end = int(self._offsets[self._index] + self._lengths[self._index])
+            end = min(end, start + size)
+            if line:
+                newline = self._map.find(b"\n", start, end)
+                if newline >= 0:
+                    end = newline + 1
+            chunks.append(self._map[start:end])
+            size -= end - start
+            self._offset += end - start
+            if self._offset == self._lengths[self._index]:
+                self._index += 1
+                self._offset = 0
+            if line and chunks[-1].endswith(b"\n"):
+                break
+        return b"".join(chunks)
+
+    def _wait(self):
+        # Wait for the next record. True when the read ends empty: at a recorded
+        # timeout (which is consumed), when nothing comes before the next
+        # command, or when the record is not due yet and timeout is 0
+        due = self._due(self._index)
+        if due is None:
+            # Nothing more until another command is written
+            return True
+        if due:
+            if self.timeout == 0:
+                # Not due yet and the caller does not wait
+                return True
+            time.sleep(due)
+        if self._lengths[self._index] == 0:
+            self._index += 1
+            return True
+        return False
+
+    def read(self, size=1):
+        data = self._take(size)
+        while not data:
+            if self._wait():
+                return b""
+            data = self._take(size)
+        return data
+
+    def readline(self):
+        data = self._take(1 << 62, line=True)
+        while not data.endswith(b"\n"):
+            if self._wait():
+                break
+            data += self._take(1 << 62, line=True)
+        return data
+
+    def write(self, data):
+        # Each write is one command, as it was recorded
+        command = data.decode("utf-8").strip()
+        ordinal = len(self.commands)
+        if self.strict:
+            expected = self.recorded_commands[ordinal] if ordinal < len(self.recorded_commands) else None
+            if command != expected:
+                raise ValueError(f"Command '{command}' does not match the recorded '{expected}' in {self.path}")
+        self.commands.append(command)
+        if ordinal < len(self._command_times):
+            self._anchor = (self._command_times[ordinal], time.perf_counter())
+        return len(data)
+
+    def reset_input_buffer(self):
+        # The capture holds only what the recorded session went on to read,
+        # so there is nothing to discard
+        pass
+
+    def close(self):
+        if self.is_open:
+            self._map.close()
+            self._fh.close()
+            self.is_open = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,222 @@
+"""
+Chunked, resumable sweeps.
+A long range is split into fixed-size chunks, each sent as its own scan
+command. A chunk which ends in an Error line, a timeout or a lost connection
+is retried with backoff, and finished chunks can be checkpointed to disk so
+an interrupted sweep picks up where it left off.
+"""
+import json
+import os
+import time
+import polars as pl
+from pysark100.collector import CollectorResult, Sark100Collector
+
+
+def plan_chunks(start, end, step, chunk_points):
+    """
+    Split the sweep grid start..end (inclusive, in steps of step Hz) into
+    consecutive chunks of at most chunk_points points.
+
+    Returns
+    -------
+    List[Tuple[int, int]]
+        (start, end) of every chunk
+    """
+    if chunk_points < 1:
+        raise ValueError("chunk_points must be at least 1")
+    points = (end - start) // step + 1
+    return [
+        (start + first * step, start + (min(first + chunk_points, points) - 1) * step)
+        for first in range(0, points, chunk_points)
+    ]
+
+
+class sark100ChunkedScan(CollectorResult):
+    """
+    A sweep run as a series of chunks of chunk_points points.
+
+    A chunk is retried up to `retries` more times when the device reports an
+    Error, stops sending, returns too few points, sends malformed lines or
+    the port fails. Points already received are kept and the chunk is
+    rescanned from its first missing frequency. Before retry n the scan
+    waits backoff * 2**(n-1) seconds and clears the input buffer; after a
+    port error the port is reopened.
+
+    `chunks` holds a status dict per chunk with index, start, end, state
+    ("pending", "done" or "failed"), attempts, points and the last error;
+    status() returns the same as a DataFrame. on_chunk, when given, is called
+    with the status dict after every attempt.
+
+    With a checkpoint directory every finished chunk is written there as it
+    completes, and a later scan of the same range with the same checkpoint
+    only sweeps the chunks which are missing.
+    """
+    def __init__(self, parent, start, end, step=1000, chunk_points=500, retries=3, backoff=0.5,
+                 checkpoint=None, progress=False, on_chunk=None):
+        from pysark100 import sark100Scan
+
+        self._scan_class = sark100Scan
+        self.parent = parent
+        self.stats = parent.stats
+        self.start = start
+        self.end = end
+        self.step = step
+        self.chunk_points = chunk_points
+        self.retries = retries
+        self.backoff = backoff
+        self.checkpoint = checkpoint
+        self.progress = progress
+        self.on_chunk = on_chunk
+        self.chunks = [
+            {"index": i, "start": lo, "end": hi, "state": "pending", "attempts": 0, "points": 0, "error": None}
+            for i, (lo, hi) in enumerate(plan_chunks(start, end, step, chunk_points))
+        ]
+        self.data = Sark100Collector()
+        self._frames = {}
+        self._done = False
+        if checkpoint is not None:
+            self._load_checkpoint()
+
+    # ---- checkpointing ----
+
+    def _state_path(self):
+        return os.path.join(self.checkpoint, "checkpoint.json")
+
+    def _chunk_path(self, chunk):
+        return os.path.join(self.checkpoint, f"chunk-{chunk['index']:06d}.parquet")
+
+    def _sweep_key(self):
+        return {"start": self.start, "end": self.end, "step": self.step, "chunk_points": self.chunk_points}
+
+    def _load_checkpoint(self):
+        os.makedirs(self.checkpoint, exist_ok=True)
+        if not os.path.exists(self._state_path()):
+            return
+        with open(self._state_path(), "r", encoding="utf-8") as fh:
+            saved = json.load(fh)
+        if saved["sweep"] != self._sweep_key():
+            raise ValueError(f"Checkpoint in {self.checkpoint} is for a different sweep: {saved['sweep']}")
+        for chunk, state in zip(self.chunks, saved["chunks"]):
+            path = self._chunk_path(chunk)
+            if state["state"] == "done" and os.path.exists(path):
+                chunk.update(state)
+                self._frames[chunk["index"]] = pl.read_parquet(path)
+
+    def _save_checkpoint(self, chunk=None):
+        if self.checkpoint is None:
+            return
+        # Data first, then the state which refers to it, both replaced atomically
+        if chunk is not None:
+            tmp = self._chunk_path(chunk) + ".tmp"
+            self._frames[chunk["index"]].write_parquet(tmp)
+            os.replace(tmp, self._chunk_path(chunk))
+        tmp = self._state_path() + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump({"sweep": self._sweep_key(), "chunks": self.chunks}, fh, indent=1)
+        os.replace(tmp, self._state_path())
+
+    # ---- sweeping ----
+
+    def _attempt(self, chunk, received):
+        # Sweep the chunk from its first missing frequency, returning the new rows and any error
+        have = set(received["freq"].to_list())
+        first = chunk["start"]
+        while first in have:
+            first += self.step
+        scan = None
+        try:
+            scan = self._scan_class(self.parent, first, chunk["end"], self.step, progress=False)
+            scan._ensure_full()
+            error = scan.error
+            if error is None and scan.malformed:
+                error = f"{scan.malformed} malformed lines"
+        except (OSError, ValueError) as e:
+            error = f"{type(e).__name__}: {e}"
+            if isinstance(e, OSError):
+                self.parent.reconnect()
+        rows = scan.data.df if scan is not None else received.clear()
+        return rows, error
+
+    def _run_chunk(self, chunk):
+        expected = (chunk["end"] - chunk["start"]) // self.step + 1
+        received = self.data.df.clear()
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self.stats.count("retries")
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+                self.parent.reader.reset_input_buffer()
+
+            rows, error = self._attempt(chunk, received)
+            received = pl.concat([received, rows]).unique("freq", keep="first").sort("freq")
+            chunk["attempts"] += 1
+            chunk["points"] = len(received)
+            if error is None and len(received) < expected:
+                error = f"Short sweep: {len(received)} of {expected} points"
+            chunk["error"] = error
+
+            if error is None:
+                chunk["state"] = "done"
+                self._frames[chunk["index"]] = received
+                self._save_checkpoint(chunk)
+            else:
+                chunk["state"] = "failed"
+                self._save_checkpoint()
+            if self.on_chunk is not None:
+                self.on_chunk(chunk)
+            if error is None:
+                return
+        # Keep what arrived so the caller still sees the partial chunk
+        self._frames[chunk["index"]] = received
+
+    def run(self):
+        """
+        Sweep every chunk which is not done yet, including ones which failed
+        on an earlier run, and return the merged Sark100Collector.
+        """
+        pending = [c for c in self.chunks if c["state"] != "done"]
+        bar = None
+        if self.progress and pending:
+            from tqdm import tqdm
+            bar = tqdm(total=len(pending), unit="chunk")
+        for chunk in pending:
+            self._run_chunk(chunk)
+            if bar is not None:
+                bar.update(1)
+                bar.set_postfix({"Freqency": chunk["end"], "State": chunk["state"]})
+        if bar is not None:
+            bar.close()
+
+        collectors = []
+        for index in sorted(self._frames):
+            collector = Sark100Collector()
+            collector.df = self._frames[index]
+            collectors.append(collector)
+        self.data = Sark100Collector.concat(collectors)
+        self._done = True
+        return self.data
+
+    def _ensure_full(self):
+        if not self._done:
+            self.run()
+
+    @property
+    def complete(self):
+        return all(c["state"] == "done" for c in self.chunks)
+
+    @property
+    def failed(self):
+        return [c for c in self.chunks if c["state"] == "failed"]
+
+    def status(self):
+        """
+        The status of every chunk as a Polars DataFrame.
+        """
+        return pl.DataFrame(self.chunks, schema={
+            "index": pl.Int64, "start": pl.Int64, "end": pl.Int64, "state": pl.Utf8,
+            "attempts": pl.Int64, "points": pl.Int64, "error": pl.Utf8,
+        })
+
+    def __iter__(self):
+        self._ensure_full()
+        df = self.data.df
+        return iter(df.select(["freq"] + Sark100Collector.value_columns).iter_rows(named=True))
@@ -1,7 +1,9 @@
 #!/usr/bin/env python3
 import argparse
+import os
 import sys
-from pysark100 import sark100, bands
+import time
+from pysark100 import sark100, bands, generate_band_frequencies
 
 
 def plot_options(parser):
@@ -29,6 +31,69 @@ def plot_options(parser):
         default=True,
         help="Show ham bands in plots"
     )
+    parser.add_argument(
+        "--downsample",
+        type=int,
+        default=2000,
+        metavar="BUCKETS",
+        help="Reduce plots to the min/max of this many buckets, 0 draws every point (default: 2000)"
+    )
+
+
+def adaptive_options(parser):
+    parser.add_argument(
+        "--adaptive",
+        action="store_true",
+        help="Coarse sweep first, then rescan only around resonances at --step"
+    )
+    parser.add_argument(
+        "--coarse-factor",
+        type=int,
+        default=10,
+        help="Coarse step as a multiple of --step for --adaptive (default: 10)"
+    )
+
+
+def chunk_options(parser):
+    parser.add_argument(
+        "--chunk-points",
+        type=int,
+        metavar="N",
+        help="Sweep in chunks of N points, retrying chunks which fail"
+    )
+    parser.add_argument(
+        "--retries",
+        type=int,
+        default=3,
+        help="Retries per failed chunk with --chunk-points (default: 3)"
+    )
+    parser.add_argument(
+        "--checkpoint",
+        type=str,
+        metavar="DIR",
+        help="Save finished chunks in DIR and resume from them when run again (needs --chunk-points)"
+    )
+
+
+def average_options(parser):
+    parser.add_argument(
+        "--average",
+        type=int,
+        metavar="N",
+        help="Sweep N times and average per frequency, adding the spread in <name>_std columns"
+    )
+    parser.add_argument(
+        "--average-method",
+        choices=["clipped", "mean", "median"],
+        default="clipped",
+        help="How --average combines the sweeps: mean after rejecting outliers, mean or median (default: clipped)"
+    )
+    parser.add_argument(
+        "--reject-sigma",
+        type=float,
+        default=3.0,
+        help="Reject samples this many robust standard deviations from the median with --average (default: 3)"
+    )
 
 
 def output_options(parser):
@@ -44,19 +109,206 @@ def output_options(parser):
         action="store_true",
         help="Show interactive Plotly chart after scan"
     )
+    parser.add_argument(
+        "--plot-html",
+        nargs="?",
+        const="",
+        type=str,
+        metavar="FILENAME",
+        help="Save the interactive Plotly chart as a self-contained HTML file (optional filename, default: "
+             "scan_plot.html)"
+    )
     parser.add_argument(
         "--show-df",
         action="store_true",
         help="Print the resulting dataframe to console"
     )
+    parser.add_argument(
+        "--band-summary",
+        action="store_true",
+        help="Print min/mean SWR and 2:1 coverage for each band in the scan"
+    )
+    parser.add_argument(
+        "--analyse",
+        action="store_true",
+        help="Print the resonances, lowest SWR, return loss, Q and 2:1 / 1.5:1 bandwidths of the scan"
+    )
     parser.add_argument(
         "--plot-pyqt",
         action="store_true",
         help="Show PyQtGraph chart after scan"
     )
+    parser.add_argument(
+        "--plot-live",
+        action="store_true",
+        help="Show a PyQtGraph chart which updates while the scan runs"
+    )
+    parser.add_argument(
+        "--store",
+        type=str,
+        metavar="DIR",
+        help="Save the sweep to a Parquet sweep store in DIR"
+    )
+    parser.add_argument(
+        "--stream",
+        type=str,
+        metavar="FILE",
+        help="Write measurements to FILE as they arrive (.csv, .parquet or .arrow)"
+    )
+    parser.add_argument(
+        "--stream-batch",
+        type=int,
+        default=4096,
+        help="Rows held in memory between writes to --stream (default: 4096)"
+    )
+    parser.add_argument(
+        "--antenna",
+        type=str,
+        help="Antenna name recorded with the sweep in --store"
+    )
+    parser.add_argument(
+        "--export",
+        type=str,
+        action="append",
+        metavar="FILE",
+        help="Write the sweep to FILE as Touchstone (.s1p), .csv or .parquet; may be repeated"
+    )
+    parser.add_argument(
+        "--z0",
+        type=float,
+        default=50.0,
+        help="Reference impedance in Ohms for S11 in --export .s1p files (default: 50)"
+    )
+    parser.add_argument(
+        "--touchstone-format",
+        choices=["RI", "MA", "DB"],
+        default="RI",
+        help="S11 format of --export .s1p files: real/imaginary, magnitude/angle or dB/angle (default: RI)"
+    )
+
+
+def report_stats(args, s, started):
+    # The --profile breakdown and --metrics file of the device's ScanStats
+    if args.profile:
+        print(s.stats.report(total=time.perf_counter() - started))
+    if args.metrics:
+        with open(args.metrics, "w", encoding="utf-8") as fh:
+            fh.write(s.stats.openmetrics(labels={"device": args.device}))
+
+
+def monitor(args, started):
+    if args.band is None and (args.start is None or args.end is None):
+        print("Error: monitor needs a band or both --start and --end")
+        sys.exit(1)
+
+    def report(event):
+        if event["error"]:
+            print(f"{event['timestamp']:%Y-%m-%d %H:%M:%S} sweep failed: {event['error']}")
+            return
+        resonance = "none" if event["resonance"] is None else f"{event['resonance']:.0f} Hz"
+        print(f"{event['timestamp']:%Y-%m-%d %H:%M:%S} min SWR {event['min_swr']:.2f} at {event['min_swr_freq']} Hz, "
+              f"resonance {resonance}, {event['changed']} points changed, stored: {event['stored'] or 'no'}")
+
+    def alert(event):
+        print(f"ALERT {event['metric']} drifted by {event['drift']:+.3f} to {event['value']:.3f} "
+              f"(baseline {event['baseline']:.3f})")
+
+    s = sark100(port=args.device, capture=args.capture)
+    tolerance = {"swr": args.swr_tolerance, "r": args.ohm_tolerance, "x": args.ohm_tolerance,
+                 "z": args.ohm_tolerance}
+    watch = s.monitor(args.start, args.end, args.step, band=args.band, buffer_pct=args.buffer,
+                      interval=args.interval, log=args.log, baseline=args.baseline, tolerance=tolerance,
+                      resonance_drift=args.resonance_drift, swr_drift=args.swr_drift, on_sweep=report,
+                      on_alert=alert)
+    print(f"Monitoring {watch.start} to {watch.end} every {args.interval:g}s, logging to {args.log}")
+    try:
+        watch.run(count=args.count)
+    except KeyboardInterrupt:
+        pass
+    print(f"{watch.sweeps} sweeps, {len(watch.alerts)} alerts")
+    if s.capture is not None:
+        s.capture.close()
+    report_stats(args, s, started)
+
+
+def serve(args):
+    from pysark100.server import AnalyzerServer
+
+    if args.socket:
+        address = args.socket
+    else:
+        host, _, port = args.listen.rpartition(":")
+        address = (host or "127.0.0.1", int(port))
+    server = AnalyzerServer(args.device, address=address, on_duplicate=args.on_duplicate, max_queue=args.max_queue,
+                            verbose=args.verbose)
+    print(f"Serving {args.device} on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+def compare(args):
+    from pysark100.collector import Sark100Collector
+    from pysark100.compare import SweepComparison
+
+    if not args.files and not args.store:
+        print("Error: compare needs sweep files or --store")
+        sys.exit(1)
+    sweeps, labels = [], []
+    if args.files:
+        sweeps = [Sark100Collector.load(path) for path in args.files]
+        labels = list(args.files)
+    options = {"step": args.step, "span": args.span}
+    if args.store:
+        from pysark100.store import SweepStore
+        store = SweepStore(args.store)
+        ids = store.sweeps(band=args.band, antenna=args.antenna)["sweep_id"].to_list()
+        sweeps += [store.load(sweep_id) for sweep_id in ids]
+        labels += ids
+    if len(sweeps) < 2:
+        print("Error: compare needs at least two sweeps")
+        sys.exit(1)
+
+    comparison = SweepComparison(sweeps, labels=labels, **options)
+    print(f"{len(comparison)} sweeps on {len(comparison.grid)} points, {comparison.start} to {comparison.end} Hz "
+          f"in {comparison.step} Hz steps")
+    print(comparison.summary())
+    print(f"RMS {args.column} deviation:")
+    print(comparison.to_frame(comparison.rms_matrix(args.column)))
+    print("Resonance shift (Hz):")
+    print(comparison.to_frame(comparison.resonance_shift()))
+    if args.plot:
+        comparison.plot(args.column, reference=args.reference, filename=args.plot, downsample=args.downsample)
+        print(f"Saved comparison plot to {args.plot}")
+    if args.plot_interactive:
+        comparison.plot_interactive(args.column, reference=args.reference, downsample=args.downsample)
+    if args.plot_html:
+        comparison.plot_interactive(args.column, reference=args.reference, downsample=args.downsample,
+                                    html=args.plot_html)
+        print(f"Saved comparison chart to {args.plot_html}")
+
+
+def render(args):
+    from pysark100.render import render_batch
+
+    sweeps = {}
+    for path in args.files:
+        sweeps[os.path.splitext(os.path.basename(path.rstrip("/")))[0]] = path
+    if args.store:
+        from pysark100.store import SweepStore
+        sweeps.update(SweepStore(args.store).paths(band=args.band, antenna=args.antenna))
+    if not sweeps:
+        print("Error: render needs sweep files or --store")
+        sys.exit(1)
+    files = render_batch(sweeps, outdir=args.outdir, fmt=args.format, workers=args.workers,
+                         include_r=args.show_r, include_x=args.show_x, include_z=args.show_z,
+                         show_bands=args.show_bands, downsample=args.downsample)
+    print(f"Rendered {len(files)} plots to {args.outdir}")
 
 
 def main():
+    started = time.perf_counter()
     parser = argparse.ArgumentParser(
         description="SARK100 Antenna Analyzer CLI"
     )
@@ -74,6 +326,29 @@ def main():
         action="store_true",
         help="Display a progress bar during the scan"
     )
+    parser.add_argument(
+        "--server",
+        type=str,
+        metavar="URL",
+        help="Run scans on a sark100 server (http://host:port or unix:///path) instead of --device"
+    )
+    parser.add_argument(
+        "--capture",
+        type=str,
+        metavar="FILE",
+        help="Record the raw session with the device to FILE; replay it with --device replay://FILE"
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Print the time spent on the device, reading, parsing, appending, writing and plotting at the end"
+    )
+    parser.add_argument(
+        "--metrics",
+        type=str,
+        metavar="FILE",
+        help="Write the sweep counters and timings to FILE in the Prometheus / OpenMetrics text format"
+    )
 
     subparsers = parser.add_subparsers(dest="command", required=True)
 
@@ -82,6 +357,9 @@ def main():
     scan_parser.add_argument("--start", type=int, required=True, help="Start frequency in Hz")
     scan_parser.add_argument("--end", type=int, required=True, help="End frequency in Hz")
     scan_parser.add_argument("--step", type=int, default=10000, help="Step size in Hz (default: 10 kHz)")
+    adaptive_options(scan_parser)
+    chunk_options(scan_parser)
+    average_options(scan_parser)
     plot_options(scan_parser)
     output_options(scan_parser)
 
@@ -90,14 +368,146 @@ def main():
     scan_band_parser.add_argument("band", type=str, choices=[b for b in bands.keys()], help="Ham band name (e.g. 40m, 20m, 10m)")
     scan_band_parser.add_argument("--buffer", type=float, default=0.01, help="Percentage buffer before/after band edges (default: 1%%)")
     scan_band_parser.add_argument("--step", type=int, default=10000, help="Step size in Hz (default: 10 kHz)")
+    adaptive_options(scan_band_parser)
+    chunk_options(scan_band_parser)
+    average_options(scan_band_parser)
     plot_options(scan_band_parser)
     output_options(scan_band_parser)
 
+    # ---- scan_bands ----
+    scan_bands_parser = subparsers.add_parser("scan_bands", help="Scan several amateur radio bands in one session")
+    scan_bands_parser.add_argument("bands", type=str, nargs="+", choices=[b for b in bands.keys()],
+                                   help="Ham band names (e.g. 80m 40m 20m)")
+    scan_bands_parser.add_argument("--buffer", type=float, default=0.01, help="Percentage buffer before/after band edges (default: 1%%)")
+    scan_bands_parser.add_argument("--step", type=int, default=10000, help="Step size in Hz (default: 10 kHz)")
+    adaptive_options(scan_bands_parser)
+    plot_options(scan_bands_parser)
+    output_options(scan_bands_parser)
+    scan_bands_parser.add_argument("--plot-dir", type=str, metavar="DIR",
+                                   help="Save one PNG plot per band to DIR, rendered in parallel")
+
+    # ---- monitor ----
+    monitor_parser = subparsers.add_parser("monitor", help="Sweep on a schedule and record changes and drifts")
+    monitor_parser.add_argument("band", type=str, nargs="?", choices=[b for b in bands.keys()],
+                                help="Ham band name to watch, instead of --start / --end")
+    monitor_parser.add_argument("--start", type=int, help="Start frequency in Hz")
+    monitor_parser.add_argument("--end", type=int, help="End frequency in Hz")
+    monitor_parser.add_argument("--buffer", type=float, default=0.01, help="Percentage buffer before/after band edges (default: 1%%)")
+    monitor_parser.add_argument("--step", type=int, default=10000, help="Step size in Hz (default: 10 kHz)")
+    monitor_parser.add_argument("--interval", type=float, default=60.0, help="Seconds between sweeps (default: 60)")
+    monitor_parser.add_argument("--count", type=int, help="Stop after this many sweeps (default: run until interrupted)")
+    monitor_parser.add_argument("--baseline", type=int, default=5, help="Sweeps in the rolling baseline (default: 5)")
+    monitor_parser.add_argument("--swr-tolerance", type=float, default=0.05,
+                                help="SWR change per point which counts as a change (default: 0.05)")
+    monitor_parser.add_argument("--ohm-tolerance", type=float, default=1.0,
+                                help="R, X and Z change per point in Ohms which counts as a change (default: 1)")
+    monitor_parser.add_argument("--resonance-drift", type=int, default=50000,
+                                help="Resonance drift in Hz which raises an alert (default: 50 kHz)")
+    monitor_parser.add_argument("--swr-drift", type=float, default=0.3,
+                                help="Lowest SWR drift which raises an alert (default: 0.3)")
+    monitor_parser.add_argument("--log", type=str, metavar="DIR", required=True,
+                                help="Directory for the series, changed sweeps and alerts")
+
+    # ---- compare ----
+    compare_parser = subparsers.add_parser("compare", help="Compare saved sweeps on a common frequency grid")
+    compare_parser.add_argument("files", type=str, nargs="*",
+                                help="Sweep files to compare (.s1p, .csv, .parquet or .arrow)")
+    compare_parser.add_argument("--store", type=str, metavar="DIR", help="Also compare the sweeps of a sweep store")
+    compare_parser.add_argument("--band", type=str, help="Only stored sweeps of this band")
+    compare_parser.add_argument("--antenna", type=str, help="Only stored sweeps of this antenna")
+    compare_parser.add_argument("--column", type=str, default="swr", choices=["swr", "r", "x", "z"],
+                                help="Column compared and plotted (default: swr)")
+    compare_parser.add_argument("--step", type=int, help="Grid step in Hz (default: the coarsest step of the sweeps)")
+    compare_parser.add_argument("--span", type=str, default="overlap", choices=["overlap", "union"],
+                                help="Grid over the range all sweeps or any sweep measured (default: overlap)")
+    compare_parser.add_argument("--reference", type=int, metavar="N",
+                                help="Plot the difference from the Nth sweep instead of the values")
+    compare_parser.add_argument("--plot", nargs="?", const="compare_plot.png", type=str,
+                                help="Save PNG overlay plot (optional filename, default: compare_plot.png)")
+    compare_parser.add_argument("--plot-interactive", action="store_true", help="Show interactive Plotly overlay")
+    compare_parser.add_argument("--plot-html", nargs="?", const="compare_plot.html", type=str,
+                                help="Save the Plotly overlay as a self-contained HTML file (optional filename, "
+                                     "default: compare_plot.html)")
+    compare_parser.add_argument("--downsample", type=int, default=2000, metavar="BUCKETS",
+                                help="Reduce each sweep to the min/max of this many buckets, 0 draws every point "
+                                     "(default: 2000)")
+
+    # ---- render ----
+    render_parser = subparsers.add_parser("render", help="Render saved sweeps to PNG or SVG plots in parallel")
+    render_parser.add_argument("files", type=str, nargs="*",
+                               help="Sweep files to render (.s1p, .csv, .parquet or .arrow)")
+    render_parser.add_argument("--store", type=str, metavar="DIR", help="Also render the sweeps of a sweep store")
+    render_parser.add_argument("--band", type=str, help="Only stored sweeps of this band")
+    render_parser.add_argument("--antenna", type=str, help="Only stored sweeps of this antenna")
+    render_parser.add_argument("--outdir", type=str, default="plots", metavar="DIR",
+                               help="Directory for the plots, one <sweep>.<format> each (default: plots)")
+    render_parser.add_argument("--format", type=str, default="png", choices=["png", "svg"],
+                               help="Image format (default: png)")
+    render_parser.add_argument("--workers", type=int, help="Rendering processes (default: one per CPU)")
+    plot_options(render_parser)
+
+    # ---- serve ----
+    serve_parser = subparsers.add_parser("serve", help="Share the device with other clients through a scan queue")
+    serve_parser.add_argument("--listen", type=str, default="127.0.0.1:8100", metavar="HOST:PORT",
+                              help="Address to serve HTTP on (default: 127.0.0.1:8100)")
+    serve_parser.add_argument("--socket", type=str, metavar="PATH", help="Serve on a Unix socket instead of --listen")
+    serve_parser.add_argument("--on-duplicate", type=str, default="merge", choices=["merge", "reject"],
+                              help="Merge a request identical to a queued or running scan into it, or reject it "
+                                   "(default: merge)")
+    serve_parser.add_argument("--max-queue", type=int, default=64, help="Most scans queued at once (default: 64)")
+    serve_parser.add_argument("--verbose", action="store_true", help="Log every request")
+
     args = parser.parse_args()
 
+    if args.command == "serve":
+        serve(args)
+        return
+    if args.server and args.command not in ("scan", "scan_band"):
+        print("Error: --server can only be used with scan and scan_band")
+        sys.exit(1)
+    if args.capture and (args.server or args.command not in ("scan", "scan_band", "scan_bands", "monitor")):
+        print("Error: --capture can only be used with scan, scan_band, scan_bands and monitor on --device")
+        sys.exit(1)
+    if args.command == "monitor":
+        monitor(args, started)
+        return
+    if args.command == "compare":
+        compare(args)
+        return
+    if args.command == "render":
+        render(args)
+        return
+
     # ---- Validate plot options ----
-    if not (args.plot or args.plot_interactive or args.plot_pyqt or args.show_df):
-        print("Error: You must provide at least one of --show-df, --plot, --plot-interactive, or --plot-pyqt")
+    outputs = [args.plot, args.plot_interactive, args.plot_html is not None, args.plot_pyqt, args.plot_live,
+               args.show_df, args.band_summary, args.analyse, args.store, args.stream, args.export,
+               getattr(args, "plot_dir", None)]
+    if not any(outputs):
+        print("Error: You must provide at least one of --show-df, --band-summary, --analyse, --plot, --plot-interactive, "
+              "--plot-html, --plot-pyqt, --plot-live, --plot-dir, --store, --stream or --export")
+        sys.exit(1)
+    if args.plot_live and (args.adaptive or args.stream):
+        print("Error: --plot-live cannot be combined with --adaptive or --stream")
+        sys.exit(1)
+    if args.command == "scan_bands" and (args.plot_live or args.stream):
+        print("Error: --plot-live and --stream cannot be used with scan_bands")
+        sys.exit(1)
+    chunked = getattr(args, "chunk_points", None)
+    if chunked and (args.adaptive or args.stream or args.plot_live):
+        print("Error: --chunk-points cannot be combined with --adaptive, --stream or --plot-live")
+        sys.exit(1)
+    averaged = getattr(args, "average", None)
+    if averaged and (chunked or args.adaptive or args.stream or args.plot_live):
+        print("Error: --average cannot be combined with --chunk-points, --adaptive, --stream or --plot-live")
+        sys.exit(1)
+    if getattr(args, "checkpoint", None) and not chunked:
+        print("Error: --checkpoint needs --chunk-points")
+        sys.exit(1)
+    if args.adaptive and args.stream:
+        print("Error: --stream cannot be combined with --adaptive")
+        sys.exit(1)
+    if args.server and (args.adaptive or args.stream or args.plot_live or chunked or averaged):
+        print("Error: --server cannot be combined with --adaptive, --stream, --plot-live, --chunk-points or --average")
         sys.exit(1)
 
     # Plot options dictionary
@@ -105,35 +515,158 @@ def main():
         "include_r": args.show_r,
         "include_x": args.show_x,
         "include_z": args.show_z,
-        "show_bands": args.show_bands
+        "show_bands": args.show_bands,
+        "downsample": args.downsample
     }
 
-    s = sark100(port=args.device)
+    if args.server:
+        from pysark100.server import sark100Client
+        s = sark100Client(args.server)
+    else:
+        s = sark100(port=args.device, capture=args.capture)
+
+    scan_opts = {"progress": args.progress}
+    if args.stream:
+        scan_opts.update(sink=args.stream, batch_size=args.stream_batch)
+    if args.adaptive:
+        scan_opts.update(adaptive=True, coarse_factor=args.coarse_factor)
+
+    if chunked:
+        scan_opts = {"progress": args.progress, "chunk_points": args.chunk_points, "retries": args.retries,
+                     "checkpoint": args.checkpoint}
+    if averaged:
+        scan_opts = {"progress": args.progress, "sweeps": args.average, "average": args.average_method,
+                     "sigma": args.reject_sigma}
 
     # ---- scan ----
     if args.command == "scan":
-        data = s.scan(start=args.start, end=args.end, step=args.step, progress=args.progress)
+        if chunked:
+            data = s.scan_chunked(args.start, args.end, args.step, **scan_opts)
+        elif averaged:
+            data = s.scan_averaged(args.start, args.end, args.step, **scan_opts)
+        else:
+            data = s.scan(start=args.start, end=args.end, step=args.step, **scan_opts)
+        if args.plot_live:
+            data.plot_live(**plot_opts)
         if args.plot is not None:
             filename = args.plot or "scan_plot.png"
             data.plot(filename=filename, **plot_opts)
         if args.plot_interactive:
             data.plot_interactive(**plot_opts)
+        if args.plot_html is not None:
+            filename = args.plot_html or "scan_plot.html"
+            data.plot_interactive(html=filename, **plot_opts)
+            print(f"Saved interactive chart to {filename}")
         if args.plot_pyqt:
             data.plot_pyqtgraph(**plot_opts)
         if args.show_df:
             print(data.get_dataframe())
+        if args.band_summary:
+            data.get_dataframe()
+            print(data.data.band_summary())
+        if args.analyse:
+            data.get_dataframe()
+            print(data.data.resonances())
+            print(data.data.analyse())
     # ---- scan_band ----
     elif args.command == "scan_band":
-        data = s.scan_band(args.band, buffer_pct=args.buffer, step=args.step, progress=args.progress)
+        if chunked or averaged:
+            freq_list = generate_band_frequencies(args.band, buffer_pct=args.buffer, step_hz=args.step)
+            sweep = s.scan_chunked if chunked else s.scan_averaged
+            data = sweep(freq_list[0], freq_list[-1], args.step, **scan_opts)
+        else:
+            data = s.scan_band(args.band, buffer_pct=args.buffer, step=args.step, **scan_opts)
+        if args.plot_live:
+            data.plot_live(**plot_opts)
         if args.plot is not None:
             filename = args.plot or f"{args.band}_plot.png"
             data.plot(filename=filename, **plot_opts)
         if args.plot_interactive:
             data.plot_interactive(**plot_opts)
+        if args.plot_html is not None:
+            filename = args.plot_html or f"{args.band}_plot.html"
+            data.plot_interactive(html=filename, **plot_opts)
+            print(f"Saved interactive chart to {filename}")
         if args.plot_pyqt:
             data.plot_pyqtgraph(**plot_opts)
         if args.show_df:
             print(data.get_dataframe())
+        if args.band_summary:
+            data.get_dataframe()
+            print(data.data.band_summary())
+        if args.analyse:
+            data.get_dataframe()
+            print(data.data.resonances())
+            print(data.data.analyse())
+
+    # ---- scan_bands ----
+    elif args.command == "scan_bands":
+        data = s.scan_bands(args.bands, buffer_pct=args.buffer, step=args.step, **scan_opts)
+        if args.plot is not None:
+            filename = args.plot or "bands_plot.png"
+            data.plot(filename=filename, **plot_opts)
+        if args.plot_dir:
+            from pysark100.render import render_batch
+            data.get_dataframe()
+            files = render_batch(data.by_band, outdir=args.plot_dir, **plot_opts)
+            print(f"Saved {len(files)} band plots to {args.plot_dir}")
+        if args.plot_interactive:
+            data.plot_interactive(**plot_opts)
+        if args.plot_html is not None:
+            filename = args.plot_html or "bands_plot.html"
+            data.plot_interactive(html=filename, **plot_opts)
+            print(f"Saved interactive chart to {filename}")
+        if args.plot_pyqt:
+            data.plot_pyqtgraph(**plot_opts)
+        if args.show_df:
+            print(data.get_dataframe())
+        if args.band_summary:
+            data.get_dataframe()
+            print(data.data.band_summary())
+        if args.analyse:
+            from pysark100.analysis import resonances, summary
+            band_df = data.get_band_dataframe()
+            print(resonances(band_df, by="band"))
+            print(summary(band_df, by="band"))
+
+    if chunked:
+        data.get_dataframe()
+        for chunk in data.failed:
+            print(f"Chunk {chunk['start']}-{chunk['end']} failed after {chunk['attempts']} attempts: {chunk['error']}")
+
+    if args.stream:
+        # Run the sweep to the end even if nothing else reads the data back
+        data._ensure_full()
+        print(f"Streamed {len(data.data)} measurements to {args.stream}")
+
+    for filename in args.export or []:
+        options = {"fmt": args.touchstone_format} if filename.lower().endswith(".s1p") else {}
+        data.export(filename, z0=args.z0, **options)
+        print(f"Exported {len(data.data)} measurements to {filename}")
+
+    if args.store and args.command == "scan_bands":
+        from pysark100.store import SweepStore
+        store = SweepStore(args.store)
+        data.get_dataframe()
+        # One stored sweep per band so they can be queried by band
+        for band, collector in data.by_band.items():
+            sweep_id = store.save(collector, device=args.device, antenna=args.antenna, band=band, step=args.step)
+            print(f"Stored {band} sweep {sweep_id} in {args.store}")
+    elif args.store:
+        from pysark100.store import SweepStore
+        sweep_id = SweepStore(args.store).save(
+            data,
+            device=args.device,
+            antenna=args.antenna,
+            band=args.band if args.command == "scan_band" else None,
+            step=args.step
+        )
+        print(f"Stored sweep {sweep_id} in {args.store}")
+
+    if args.capture:
+        s.capture.close()
+        print(f"Captured the session to {args.capture}")
+    report_stats(args, s, started)
 
 
 """
@@ -2,213 +2,436 @@
 Collector module for SARK100 measurements.
 Manages data collection, storage, and visualization.
 """
-import polars as pl
-import matplotlib.pyplot as plt
-import plotly.graph_objects as go
-from pysark100.bands import bands
+import time
+import numpy as np
+from pysark100.bands import band_index
+from pysark100.downsample import DEFAULT_BUCKETS, downsample_frame, minmax_indices
+from pysark100.stats import timed
+
+# Polars and the plotting backends are imported by the methods which use them,
+# so collecting measurements doesn't pay for loading them.
+
+# Points per trace above which Plotly charts are drawn with WebGL
+WEBGL_THRESHOLD = 5000
+# Legend label and colour of each column in Plotly charts
+PLOTLY_SERIES = {"swr": ("SWR", "blue"), "r": ("R", "green"), "x": ("X", "orange"), "z": ("Z", "red")}
+
+
+class _PolarsColumns:
+    """
+    The collector's (name, Polars dtype) columns, resolved on first access so
+    that importing the collector does not import Polars.
+    """
+    def __init__(self, spec):
+        self.spec = spec
+        self.columns = None
+
+    def __get__(self, instance, owner):
+        if self.columns is None:
+            import polars as pl
+            self.columns = [(name, getattr(pl, dtype)) for name, dtype in self.spec]
+        return self.columns
+
+
+class CollectorResult:
+    """
+    Shared accessors for scan results backed by a Sark100Collector in `self.data`.
+    Subclasses fetch any outstanding measurements in `_ensure_full()`.
+    Plotting time is added to `stats`, the device's ScanStats, when set.
+    """
+    stats = None
+
+    def _ensure_full(self):
+        pass
+
+    def get_dataframe(self):
+        self._ensure_full()
+        return self.data.df
+
+    def plot(self, *args, **kwargs):
+        self._ensure_full()
+        with timed(self.stats, "plot"):
+            self.data.plot(*args, **kwargs)
+
+    def plot_interactive(self, *args, **kwargs):
+        self._ensure_full()
+        with timed(self.stats, "plot"):
+            self.data.plot_interactive(*args, **kwargs)
+
+    def plot_pyqtgraph(self, *args, **kwargs):
+        self._ensure_full()
+        with timed(self.stats, "plot"):
+            self.data.plot_pyqtgraph(*args, **kwargs)
+
+    def export(self, *args, **kwargs):
+        self._ensure_full()
+        self.data.export(*args, **kwargs)
 
 
 class Sark100Collector:
-    def __init__(self):
+    columns = _PolarsColumns([
+        ("freq", "Int64"),
+        ("swr", "Float64"),
+        ("r", "Float64"),
+        ("x", "Float64"),
+        ("z", "Float64")
+    ])
+    value_columns = ["swr", "r", "x", "z"]
+
+    def __init__(self, capacity=1024, sink=None, batch_size=4096, stats=None):
         """
-        Initialize an empty Polars DataFrame for measurement data.
+        Initialize empty column buffers for measurement data.
         Columns:
             freq: Frequency in Hz
             swr: Standing Wave Ratio
             r: Resistance (Ohms)
             x: Reactance (Ohms)
             z: Impedance magnitude (Ohms)
+
+        Measurements are appended into preallocated NumPy buffers which grow
+        geometrically; the Polars DataFrame is only built when `df` or
+        `get_data()` is accessed and is cached until the next append.
+
+        With a sink (see pysark100.sink) the buffers are written out every
+        batch_size rows and emptied, so memory stays bounded; `df` then reads
+        the written batches back.
+
+        With stats (a pysark100.stats.ScanStats) the time spent appending
+        and writing to the sink is recorded there.
         """
-        self.df = pl.DataFrame(
-            schema=[
-                ("freq", pl.Int64),
-                ("swr", pl.Float64),
-                ("r", pl.Float64),
-                ("x", pl.Float64),
-                ("z", pl.Float64)
-            ]
-        )
+        self.sink = sink
+        self.stats = stats
+        self.batch_size = batch_size
+        if sink is not None:
+            capacity = min(capacity, batch_size)
+        capacity = max(1, int(capacity))
+        self._freq = np.empty(capacity, dtype=np.int64)
+        self._values = np.empty((capacity, len(self.value_columns)), dtype=np.float64)
+        self._len = 0
+        self._flushed = 0
+        self._df = None
+        # Further float columns aligned with the rows, only given to
+        # from_values. Collectors holding them can't be appended to.
+        self.extra = {}
+
+    def __len__(self):
+        return self._flushed + self._len
+
+    def _appended(self):
+        self._df = None
+        if self.sink is not None and self._len >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Write the buffered rows to the sink and empty the buffers.
+        Does nothing without a sink.
+        """
+        if self.sink is None or self._len == 0:
+            return
+        with timed(self.stats, "sink"):
+            self.sink.write(self._buffer_frame())
+        self._flushed += self._len
+        self._len = 0
+        self._df = None
+
+    def close(self):
+        # Flush any remaining rows and close the sink
+        self.flush()
+        if self.sink is not None:
+            self.sink.close()
+
+    def _reserve(self, count):
+        # Grow the buffers so at least `count` more rows fit, doubling to keep appends amortised O(1)
+        needed = self._len + count
+        capacity = len(self._freq)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        freq = np.empty(capacity, dtype=np.int64)
+        values = np.empty((capacity, len(self.value_columns)), dtype=np.float64)
+        freq[:self._len] = self._freq[:self._len]
+        values[:self._len] = self._values[:self._len]
+        self._freq = freq
+        self._values = values
+
+    @staticmethod
+    def parse_measurement(measurement_str):
+        """
+        Parse a "swr,r,x,z" string into a tuple of floats.
+        Raises ValueError if the string is malformed.
+        """
+        try:
+            swr, r, x, z = map(float, measurement_str.split(","))
+        except ValueError:
+            # Raise error if measurement string is malformed
+            raise ValueError("measurement_str must be in the format 'swr,r,x,z' with numeric values")
+        return swr, r, x, z
 
     def add_measurement(self, freq, measurement_str):
         """
-        Add a single measurement to the DataFrame.
+        Add a single measurement to the collector.
         measurement_str should be in the format: "swr,r,x,z"
         """
+        swr, r, x, z = self.parse_measurement(measurement_str)
+
+        self._reserve(1)
+        self._freq[self._len] = freq
+        self._values[self._len] = (swr, r, x, z)
+        self._len += 1
+        self._appended()
+
+    def add_measurements(self, freqs, lines):
+        """
+        Add a batch of measurements to the collector.
+        freqs is a sequence of frequencies in Hz and lines the matching
+        "swr,r,x,z" strings as returned by the SARK100.
+        """
+        freqs = np.asarray(freqs, dtype=np.int64)
+        if len(freqs) != len(lines):
+            raise ValueError("freqs and lines must have the same length")
+        if len(freqs) == 0:
+            return
+
         try:
-            swr, r, x, z = map(float, measurement_str.split(","))
+            values = np.array([line.split(",") for line in lines], dtype=np.float64)
         except ValueError:
-            # Raise error if measurement string is malformed
             raise ValueError("measurement_str must be in the format 'swr,r,x,z' with numeric values")
+        if values.ndim != 2 or values.shape[1] != len(self.value_columns):
+            raise ValueError("measurement_str must be in the format 'swr,r,x,z' with numeric values")
+
+        self.add_values(freqs, values)
 
-        new_row = {
-            "freq": freq,
-            "swr": swr,
-            "r": r,
-            "x": x,
-            "z": z
-        }
-        self.df = self.df.vstack(pl.DataFrame([new_row], schema=self.df.schema))
+    def add_values(self, freqs, values):
+        """
+        Add a batch of already parsed measurements to the collector.
+        values is a sequence of (swr, r, x, z) rows matching freqs.
+        """
+        if self.extra:
+            raise ValueError("Cannot append to a collector with extra columns")
+        freqs = np.asarray(freqs, dtype=np.int64)
+        values = np.asarray(values, dtype=np.float64).reshape(-1, len(self.value_columns))
+        if len(freqs) != len(values):
+            raise ValueError("freqs and values must have the same length")
+        if len(freqs) == 0:
+            return
+
+        stats = self.stats
+        if stats is not None:
+            started = time.perf_counter()
+        count = len(freqs)
+        self._reserve(count)
+        self._freq[self._len:self._len + count] = freqs
+        self._values[self._len:self._len + count] = values
+        self._len += count
+        if stats is not None:
+            elapsed = time.perf_counter() - started
+            stats.add("append", elapsed)
+            stats.observe("append", elapsed)
+        self._appended()
+
+    def buffers(self):
+        """
+        Views of the rows currently held in the buffers, without copying:
+        (freq, values, n) where values has one column per value_columns entry.
+        Rows below n are never modified, so the views can be read while another
+        thread keeps appending.
+        """
+        n = self._len
+        return self._freq[:n], self._values[:n], n
+
+    def to_grid(self, start, step, points):
+        """
+        The value columns laid onto the frequency grid start, start + step,
+        ... of `points` points, as a (points, 4) array with NaN where the grid
+        has no measurement. Measurements off the grid are left out.
+        """
+        freq, values, n = self.buffers()
+        grid = np.full((points, len(self.value_columns)), np.nan)
+        offset = freq - start
+        index = offset // step
+        inside = (offset % step == 0) & (index >= 0) & (index < points)
+        grid[index[inside]] = values[inside]
+        return grid
+
+    @classmethod
+    def from_values(cls, freqs, values, extra=None):
+        """
+        A collector holding the given (n,) frequencies and (n, 4) values,
+        with optional extra columns given as a dict of (n,) arrays.
+        """
+        collector = cls(capacity=len(freqs))
+        collector.add_values(freqs, values)
+        collector.extra = {name: np.asarray(column, dtype=np.float64) for name, column in (extra or {}).items()}
+        return collector
+
+    def _buffer_frame(self):
+        # The rows currently held in the buffers as a frame
+        import polars as pl
+
+        n = self._len
+        data = {"freq": self._freq[:n].copy()}
+        for i, name in enumerate(self.value_columns):
+            data[name] = self._values[:n, i].copy()
+        schema = list(self.columns)
+        for name, column in self.extra.items():
+            data[name] = column[:n].copy()
+            schema.append((name, pl.Float64))
+        return pl.DataFrame(data, schema=schema)
+
+    @property
+    def df(self):
+        """
+        The collected measurements as a single contiguous Polars DataFrame.
+        """
+        if self._df is None:
+            import polars as pl
+
+            df = self._buffer_frame()
+            if self._flushed:
+                df = pl.concat([self.sink.read().select(df.columns), df], rechunk=True)
+            self._df = df
+        return self._df
+
+    @df.setter
+    def df(self, frame):
+        # Replace the collected data with the contents of an existing frame,
+        # dropping any columns other than the collector's own
+        import polars as pl
+
+        self.extra = {}
+        frame = frame.select([pl.col(name).cast(dtype) for name, dtype in self.columns])
+        n = frame.height
+        self._freq = np.empty(max(1, n), dtype=np.int64)
+        self._values = np.empty((max(1, n), len(self.value_columns)), dtype=np.float64)
+        self._freq[:n] = frame["freq"].to_numpy()
+        self._values[:n] = frame.select(self.value_columns).to_numpy()
+        self._len = n
+        self._flushed = 0
+        self._df = None
 
     def get_data(self):
         # Return the current Polars DataFrame
         return self.df
 
-    def plot(self, include_r=False, include_x=False, include_z=False, show_bands=True, filename="plot.png"):
+    def with_bands(self):
         """
-        Plot measurement data using matplotlib.
-        Optionally overlays ham bands and additional impedance lines.
+        The measurements with band, band_start and band_end columns added
+        from the current band plan; rows outside every band get nulls.
+        """
+        return band_index().label(self.df)
+
+    def band_summary(self, swr_limit=2.0):
+        """
+        Per-band statistics: points, min SWR and its frequency, mean SWR and
+        the fraction of samples at or below swr_limit. See BandIndex.summary.
         """
-        plt.figure(figsize=(12, 6))
+        return band_index().summary(self.df, swr_limit=swr_limit)
 
-        freq_mhz = self.df["freq"].to_numpy() / 1_000_000
+    def resonances(self):
+        """
+        The X zero-crossings of the measurements with their Q.
+        See pysark100.analysis.resonances.
+        """
+        from pysark100.analysis import resonances
+        return resonances(self.df)
 
-        # Plot SWR
-        plt.plot(freq_mhz, self.df["swr"].to_numpy(), label="SWR", color="blue")
+    def analyse(self, limits=(2.0, 1.5)):
+        """
+        One-row summary of the sweep: lowest SWR, return loss, nearest
+        resonance and Q, and the SWR bandwidth at each limit.
+        See pysark100.analysis.summary.
+        """
+        from pysark100.analysis import summary
+        return summary(self.df, limits=limits)
 
-        # Optional plots
-        if include_r:
-            plt.plot(freq_mhz, self.df["r"].to_numpy(), label="R", color="green")
-        if include_x:
-            plt.plot(freq_mhz, self.df["x"].to_numpy(), label="X", color="orange")
-        if include_z:
-            plt.plot(freq_mhz, self.df["z"].to_numpy(), label="Z", color="red")
+    def export(self, path, z0=50.0, **options):
+        """
+        Write the measurements to a Touchstone .s1p (S11 against z0), .csv
+        or .parquet file, chosen by the extension of path.
+        See pysark100.fileio.export for the options.
+        """
+        from pysark100.fileio import export
+        export(self, path, z0=z0, **options)
 
-        # Overlay ham bands
-        if show_bands:
-            min_freq = self.df["freq"].min()
-            max_freq = self.df["freq"].max()
-
-            for band_name, band_info in bands.items():
-                if band_name == "hf":
-                    continue  # Skip 'hf'
-
-                band_start = band_info["start"]
-                band_end = band_info["end"]
-
-                # Only include bands that intersect with the data range
-                if band_end < min_freq or band_start > max_freq:
-                    continue
-
-                start_mhz = band_start / 1_000_000
-                end_mhz = band_end / 1_000_000
-                mid_mhz = (start_mhz + end_mhz) / 2
-
-                # Grey shaded band area
-                plt.axvspan(start_mhz, end_mhz, color="grey", alpha=0.3)
-
-                # Vertical dashed line at mid frequency
-                plt.axvline(x=mid_mhz, color="black", linestyle="--", linewidth=1, alpha=0.6)
-
-                # Band label above the shaded area
-                plt.text(
-                    mid_mhz,
-                    plt.ylim()[1] * 0.95,
-                    band_name,
-                    ha="center",
-                    va="top",
-                    fontsize=8,
-                    color="black"
-                )
-
-        plt.xlabel("Frequency (MHz)")
-        plt.ylabel("SWR / Impedance")
-        plt.title("SARK100 Measurement")
-        plt.legend()
-        plt.grid(True)
-        plt.tight_layout()
-        plt.savefig(filename)
-        plt.close()
-
-    def plot_interactive(self, include_r=False, include_x=False, include_z=False, show_bands=True):
+    @classmethod
+    def load(cls, path, z0=None):
+        """
+        Load measurements from a .s1p, .csv, .parquet or .arrow file, or a
+        sink directory, into a new collector. See pysark100.fileio.load.
+        """
+        from pysark100.fileio import load
+        return load(path, z0=z0)
+
+    @classmethod
+    def concat(cls, collectors):
+        """
+        Merge several collectors into a new one sorted by frequency.
+        Where collectors share a frequency the measurement from the later
+        collector is kept.
+        """
+        import polars as pl
+
+        frames = [c.df for c in collectors if len(c)]
+        merged = cls(capacity=sum(len(f) for f in frames))
+        if frames:
+            merged.df = (
+                pl.concat(frames)
+                .unique(subset="freq", keep="last", maintain_order=True)
+                .sort("freq")
+            )
+        return merged
+
+    @staticmethod
+    def _plotted(include_r, include_x, include_z):
+        # The value columns drawn for the given plot options, SWR always first
+        return ["swr"] + [c for c, wanted in (("r", include_r), ("x", include_x), ("z", include_z)) if wanted]
+
+    def plot(self, include_r=False, include_x=False, include_z=False, show_bands=True, filename="plot.png",
+             downsample=DEFAULT_BUCKETS):
+        """
+        Plot measurement data using matplotlib.
+        Optionally overlays ham bands and additional impedance lines.
+        Large sweeps are reduced to the min/max of `downsample` buckets;
+        pass None or 0 to draw every point.
+
+        The plot is drawn headless on an Agg figure, see
+        pysark100.render.SweepFigure; render_batch() plots many sweeps at once.
+        """
+        from pysark100.render import SweepFigure
+
+        df = self.df
+        SweepFigure().render(df["freq"].to_numpy(), df.select(self.value_columns).to_numpy(), filename,
+                             include_r=include_r, include_x=include_x, include_z=include_z, show_bands=show_bands,
+                             downsample=downsample)
+
+    def plot_interactive(self, include_r=False, include_x=False, include_z=False, show_bands=True,
+                         downsample=DEFAULT_BUCKETS, widget=False, html=None, webgl=None):
         """
         Display an interactive Plotly chart of SWR (always) and optionally R, X, Z.
         Optionally overlay ham bands as shaded regions with labels and center lines.
+
+        Large sweeps are reduced to the min/max of `downsample` buckets; pass
+        None or 0 to send every point. Traces of more than WEBGL_THRESHOLD
+        points are drawn with WebGL (Scattergl) unless webgl is given. With
+        widget=True a go.FigureWidget is returned instead of shown, and it
+        re-decimates the visible range whenever the x axis is zoomed (needs a
+        notebook widget environment). With html the chart is written to that
+        file as a self-contained page instead of being shown.
         """
-        freq_mhz = self.df["freq"].to_numpy() / 1_000_000
-
-        fig = go.Figure()
-
-        # Always add SWR
-        fig.add_trace(go.Scatter(
-            x=freq_mhz,
-            y=self.df["swr"].to_numpy(),
-            mode="lines",
-            name="SWR",
-            line=dict(color="blue")
-        ))
-
-        # Optionally add R, X, Z
-        if include_r:
-            fig.add_trace(go.Scatter(
-                x=freq_mhz,
-                y=self.df["r"].to_numpy(),
-                mode="lines",
-                name="R",
-                line=dict(color="green")
-            ))
-        if include_x:
-            fig.add_trace(go.Scatter(
-                x=freq_mhz,
-                y=self.df["x"].to_numpy(),
-                mode="lines",
-                name="X",
-                line=dict(color="orange")
-            ))
-        if include_z:
-            fig.add_trace(go.Scatter(
-                x=freq_mhz,
-                y=self.df["z"].to_numpy(),
-                mode="lines",
-                name="Z",
-                line=dict(color="red")
-            ))
+        import plotly.graph_objects as go
+
+        columns = self._plotted(include_r, include_x, include_z)
+        full = self.df
+        df = downsample_frame(full, downsample, columns)
+
+        fig = go.FigureWidget() if widget else go.Figure()
+        fig.add_traces(plotly_traces(df["freq"].to_numpy(), [(c, df[c].to_numpy()) for c in columns], webgl))
 
         # Overlay ham bands
         if show_bands:
-            min_freq = self.df["freq"].min()
-            max_freq = self.df["freq"].max()
-
-            for band_name, band_info in bands.items():
-                if band_name == "hf":
-                    continue  # Skip 'hf'
-
-                band_start = band_info["start"]
-                band_end = band_info["end"]
-
-                # Only include bands that intersect with the data range
-                if band_end < min_freq or band_start > max_freq:
-                    continue
-
-                start_mhz = band_start / 1_000_000
-                end_mhz = band_end / 1_000_000
-                mid_mhz = (start_mhz + end_mhz) / 2
-
-                # Grey shaded box
-                fig.add_vrect(
-                    x0=start_mhz,
-                    x1=end_mhz,
-                    fillcolor="lightgrey",
-                    opacity=0.3,
-                    line_width=0
-                )
-
-                # Label above the band
-                fig.add_annotation(
-                    x=mid_mhz,
-                    y=1,
-                    yref="paper",
-                    showarrow=False,
-                    text=band_name,
-                    font=dict(size=10, color="black"),
-                    yshift=10
-                )
-
-                # Vertical dashed line at band midpoint
-                fig.add_vline(
-                    x=mid_mhz,
-                    line=dict(color="black", width=1, dash="dash"),
-                    opacity=0.6
-                )
+            fig.update_layout(**plotly_bands(full["freq"].min(), full["freq"].max()))
 
         # Layout
         fig.update_layout(
@@ -218,85 +441,172 @@ class Sark100Collector:
             template="plotly_white"
         )
 
-        fig.show()
+        if html is not None:
+            write_html(fig, html)
+
+        if widget:
+            if downsample:
+                freq = full["freq"].to_numpy()
+                values = [full[c].to_numpy() for c in columns]
 
-    def plot_pyqtgraph(self, include_r=False, include_x=False, include_z=False, show_bands=True):
+                def redecimate(layout, x_range):
+                    # Re-pick the points for the zoomed range from the full sweep
+                    visible = None if x_range is None else (x_range[0] * 1_000_000, x_range[1] * 1_000_000)
+                    idx = minmax_indices(freq, values, downsample, visible)
+                    with fig.batch_update():
+                        for trace, y in zip(fig.data, values):
+                            trace.x = freq[idx] / 1_000_000
+                            trace.y = y[idx]
+
+                fig.layout.on_change(redecimate, "xaxis.range")
+            return fig
+
+        if html is None:
+            fig.show()
+
+    def plot_pyqtgraph(self, include_r=False, include_x=False, include_z=False, show_bands=True,
+                       downsample=DEFAULT_BUCKETS):
         """
         Display the data using PyQtGraph with interactive panning/zooming.
         Shows SWR, and optionally R, X, and Z.
+        Large sweeps are reduced to the min/max of `downsample` buckets of the
+        visible range, re-picked on every zoom; pass None or 0 to draw every point.
         """
         import pyqtgraph as pg
-        from pyqtgraph.Qt import QtWidgets, QtCore
-        import sys
-
-        app = QtWidgets.QApplication.instance()
-        if app is None:
-            app = QtWidgets.QApplication(sys.argv)
 
         # Prepare data
-        freq_mhz = self.df["freq"].to_numpy() / 1_000_000
-        swr_data = self.df["swr"].to_numpy()
-        r_data = self.df["r"].to_numpy()
-        x_data = self.df["x"].to_numpy()
-        z_data = self.df["z"].to_numpy()
-
-        # Set up plot window
-        win = pg.GraphicsLayoutWidget(title="SARK100 Measurement (PyQtGraph)")
-        plot = win.addPlot(title="SWR / Impedance vs Frequency (MHz)")
-        plot.showGrid(x=True, y=True, alpha=0.3)
-        plot.setLabel("bottom", "Frequency (MHz)")
-        plot.setLabel("left", "SWR / Impedance")
-        plot.setYRange(0, 10)  # ✅ Limit graph to 0–10
-
-        # Plot SWR
-        plot.plot(freq_mhz, swr_data, pen=pg.mkPen("b", width=2), name="SWR")
-
-        # Optional plots
-        if include_r:
-            plot.plot(freq_mhz, r_data, pen=pg.mkPen("g", width=2), name="R")
-        if include_x:
-            plot.plot(freq_mhz, x_data, pen=pg.mkPen("orange", width=2), name="X")
-        if include_z:
-            plot.plot(freq_mhz, z_data, pen=pg.mkPen("r", width=2), name="Z")
-
-        # Add ham band overlays
-        if show_bands:
-            min_freq = self.df["freq"].min()
-            max_freq = self.df["freq"].max()
-
-            for band_name, band_info in bands.items():
-                if band_name == "hf":
-                    continue  # Skip 'hf'
-
-                band_start = band_info["start"]
-                band_end = band_info["end"]
-
-                # Only include bands overlapping with our data range
-                if band_end < min_freq or band_start > max_freq:
-                    continue
-
-                start_mhz = band_start / 1_000_000
-                end_mhz = band_end / 1_000_000
-                mid_mhz = (start_mhz + end_mhz) / 2
-
-                # ✅ Grey shaded rectangle limited to y=0–10
-                rect = QtWidgets.QGraphicsRectItem(start_mhz, 0, end_mhz - start_mhz, 10)
-                rect.setBrush(pg.mkBrush(200, 200, 200, 80))
-                rect.setPen(pg.mkPen(None))
-                plot.addItem(rect)
-
-                # ✅ Vertical dashed line at mid frequency
-                line = pg.InfiniteLine(pos=mid_mhz, angle=90,
-                                       pen=pg.mkPen("k", style=QtCore.Qt.DashLine))
-                plot.addItem(line)
-
-                # ✅ Band label inside visible range
-                text = pg.TextItem(band_name, color="k", anchor=(0.5, 1.0))
-                text.setPos(mid_mhz, 9.8)
-                plot.addItem(text)
+        freq = self.df["freq"].to_numpy()
+        freq_mhz = freq / 1_000_000
+        pens = {"swr": ("b", "SWR"), "r": ("g", "R"), "x": ("orange", "X"), "z": ("r", "Z")}
+        columns = self._plotted(include_r, include_x, include_z)
+        values = [self.df[c].to_numpy() for c in columns]
+
+        app, win, plot = pyqtgraph_window(self.df["freq"].min(), self.df["freq"].max(), show_bands)
+
+        # Plot SWR and the optional R, X and Z lines
+        curves = []
+        for column, y in zip(columns, values):
+            color, name = pens[column]
+            curve = plot.plot(pen=pg.mkPen(color, width=2), name=name)
+            if not downsample:
+                curve.setData(freq_mhz, y)
+            curves.append(curve)
+
+        if downsample:
+            def redecimate(_view=None, x_range=None):
+                # Re-pick the points for the visible range from the full sweep
+                visible = None if x_range is None else (x_range[0] * 1_000_000, x_range[1] * 1_000_000)
+                idx = minmax_indices(freq, values, downsample, visible)
+                for curve, y in zip(curves, values):
+                    curve.setData(freq_mhz[idx], y[idx])
+
+            redecimate()
+            plot.sigXRangeChanged.connect(redecimate)
 
         # Add legend
         plot.addLegend(offset=(30, 30))
 
         win.show()
         app.exec_()
+
+
+def plotly_traces(freq, series, webgl=None):
+    """
+    Plotly line traces of (column, values) pairs against freq (Hz), in the
+    colours the other backends use.
+
+    The arrays are handed over as contiguous NumPy arrays, which Plotly
+    serialises as base64 typed arrays rather than lists of numbers. Above
+    WEBGL_THRESHOLD points, or whenever webgl is True, the traces are
+    Scattergl, with the values as float32.
+    """
+    import plotly.graph_objects as go
+
+    if webgl is None:
+        webgl = len(freq) > WEBGL_THRESHOLD
+    trace = go.Scattergl if webgl else go.Scatter
+    x = np.ascontiguousarray(freq / 1_000_000, dtype=np.float64)
+    dtype = np.float32 if webgl else np.float64
+    return [
+        trace(x=x, y=np.ascontiguousarray(values, dtype=dtype), mode="lines", name=PLOTLY_SERIES[column][0],
+              line=dict(color=PLOTLY_SERIES[column][1]))
+        for column, values in series
+    ]
+
+
+def plotly_bands(min_freq, max_freq):
+    """
+    Layout shapes and annotations overlaying the ham bands between min_freq
+    and max_freq (Hz): a shaded region, a dashed centre line and a label for
+    each. Pass them to fig.update_layout(**plotly_bands(...)) in one call.
+    """
+    shapes, annotations = [], []
+    # Only bands that intersect with the data range, umbrella ranges like 'hf' are skipped
+    for band_name, band_start, band_end in band_index().overlapping(min_freq, max_freq):
+        start_mhz = band_start / 1_000_000
+        end_mhz = band_end / 1_000_000
+        mid_mhz = (start_mhz + end_mhz) / 2
+        shapes.append(dict(type="rect", xref="x", yref="paper", x0=start_mhz, x1=end_mhz, y0=0, y1=1,
+                           fillcolor="lightgrey", opacity=0.3, line_width=0, layer="below"))
+        shapes.append(dict(type="line", xref="x", yref="paper", x0=mid_mhz, x1=mid_mhz, y0=0, y1=1,
+                           line=dict(color="black", width=1, dash="dash"), opacity=0.6))
+        annotations.append(dict(x=mid_mhz, y=1, yref="paper", showarrow=False, text=band_name,
+                                font=dict(size=10, color="black"), yshift=10))
+    return {"shapes": shapes, "annotations": annotations}
+
+
+def write_html(fig, filename):
+    """
+    Write a Plotly figure to a self-contained HTML file, with plotly.js
+    embedded so it opens without network access.
+    """
+    fig.write_html(filename, include_plotlyjs=True, full_html=True)
+
+
+def pyqtgraph_window(min_freq, max_freq, show_bands=True, title="SARK100 Measurement (PyQtGraph)"):
+    """
+    Create the PyQtGraph window used by the Qt plots, with axes, grid and the
+    ham bands between min_freq and max_freq (Hz) overlaid.
+    Returns (app, win, plot).
+    """
+    import pyqtgraph as pg
+    from pyqtgraph.Qt import QtWidgets, QtCore
+    import sys
+
+    app = QtWidgets.QApplication.instance()
+    if app is None:
+        app = QtWidgets.QApplication(sys.argv)
+
+    # Set up plot window
+    win = pg.GraphicsLayoutWidget(title=title)
+    plot = win.addPlot(title="SWR / Impedance vs Frequency (MHz)")
+    plot.showGrid(x=True, y=True, alpha=0.3)
+    plot.setLabel("bottom", "Frequency (MHz)")
+    plot.setLabel("left", "SWR / Impedance")
+    plot.setYRange(0, 10)  # ✅ Limit graph to 0–10
+
+    # Add ham band overlays
+    if show_bands:
+        # Only bands that intersect with the data range, umbrella ranges like 'hf' are skipped
+        for band_name, band_start, band_end in band_index().overlapping(min_freq, max_freq):
+            start_mhz = band_start / 1_000_000
+            end_mhz = band_end / 1_000_000
+            mid_mhz = (start_mhz + end_mhz) / 2
+
+            # ✅ Grey shaded rectangle limited to y=0–10
+            rect = QtWidgets.QGraphicsRectItem(start_mhz, 0, end_mhz - start_mhz, 10)
+            rect.setBrush(pg.mkBrush(200, 200, 200, 80))
+            rect.setPen(pg.mkPen(None))
+            plot.addItem(rect)
+
+            # ✅ Vertical dashed line at mid frequency
+            line = pg.InfiniteLine(pos=mid_mhz, angle=90,
+                                   pen=pg.mkPen("k", style=QtCore.Qt.DashLine))
+            plot.addItem(line)
+
+            # ✅ Band label inside visible range
+            text = pg.TextItem(band_name, color="k", anchor=(0.5, 1.0))
+            text.setPos(mid_mhz, 9.8)
+            plot.addItem(text)
+
+    return app, win, plot
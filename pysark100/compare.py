@@ -0,0 +1,320 @@
+"""
+Comparison of many sweeps on a common frequency grid.
+Sweeps taken with different steps or ranges are resampled onto one grid by
+linear interpolation, stacked into a (sweeps, points, columns) array, and
+compared all at once: pairwise mean difference and RMS deviation matrices
+come from a few matrix products, and the resonance of every sweep from one
+grouped pass of the analysis functions.
+"""
+import numpy as np
+import polars as pl
+from pysark100.analysis import summary
+from pysark100.bands import band_index
+from pysark100.collector import CollectorResult, Sark100Collector
+from pysark100.downsample import DEFAULT_BUCKETS, minmax_indices
+
+SPANS = ("overlap", "union")
+# Sweeps drawn with a legend, beyond this the overlay is left unlabelled
+LEGEND_LIMIT = 20
+
+
+def _arrays(data):
+    # (freq, values) of a collector, scan result or frame, sorted by frequency
+    # with one measurement per frequency, the later one where a frequency repeats
+    if isinstance(data, CollectorResult):
+        data._ensure_full()
+        data = data.data
+    if isinstance(data, Sark100Collector) and not (data.sink is not None and data._flushed):
+        freq, values, _ = data.buffers()
+    else:
+        frame = data.df if isinstance(data, Sark100Collector) else data
+        freq = frame["freq"].to_numpy()
+        values = frame.select(Sark100Collector.value_columns).to_numpy()
+    if len(freq) > 1 and not np.all(freq[1:] > freq[:-1]):
+        order = np.argsort(freq, kind="stable")
+        freq, values = freq[order], values[order]
+        last = np.append(freq[1:] != freq[:-1], True)
+        freq, values = freq[last], values[last]
+    return freq, values
+
+
+def resample(freq, values, grid, max_gap=None):
+    """
+    Linearly interpolate a sweep onto a frequency grid.
+
+    Parameters
+    ----------
+    freq : numpy.ndarray
+        (n,) sorted frequencies of the sweep in Hz
+    values : numpy.ndarray
+        (n, k) values at those frequencies
+    grid : numpy.ndarray
+        (points,) frequencies to interpolate at
+    max_gap : Optional[float]
+        Leave grid points between two samples further apart than this many
+        Hz as NaN, e.g. between the bands of a multi-band sweep
+
+    Returns
+    -------
+    numpy.ndarray
+        (points, k) interpolated values, NaN outside the sweep
+    """
+    grid = np.asarray(grid, dtype=np.float64)
+    out = np.full((len(grid), values.shape[1]), np.nan)
+    n = len(freq)
+    if n == 0:
+        return out
+    f = freq.astype(np.float64)
+    if n == 1:
+        out[grid == f[0]] = values[0]
+        return out
+    i = np.clip(np.searchsorted(f, grid, side="right") - 1, 0, n - 2)
+    span = f[i + 1] - f[i]
+    t = (grid - f[i]) / span
+    inside = (grid >= f[0]) & (grid <= f[-1])
+    if max_gap is not None:
+        inside &= span <= max_gap
+    i, t = i[inside], t[inside, None]
+    out[inside] = values[i] + t * (values[i + 1] - values[i])
+    return out
+
+
+class SweepComparison:
+    """
+    Any number of sweeps resampled onto one frequency grid.
+
+    `values` holds the sweeps as a (sweeps, points, 4) array of swr, r, x
+    and z on `grid`, NaN where a sweep has no data. By default the grid
+    covers the range every sweep measured ("overlap"; "union" covers the
+    range any sweep measured) at the coarsest step of the sweeps, so no
+    sweep is interpolated much finer than it was measured.
+
+    Matrices are indexed [i, j] as sweep j compared with sweep i, over the
+    grid points both sweeps have.
+
+    Parameters
+    ----------
+    sweeps : Sequence[Sark100Collector | CollectorResult | polars.DataFrame]
+        The sweeps to compare
+    labels : Optional[Sequence[str]]
+        A name per sweep, by default its position
+    start, end, step : Optional[int]
+        The grid in Hz, overriding the defaults above
+    span : str
+        "overlap" or "union", the default grid range
+    max_gap : Optional[float]
+        See resample()
+    """
+    def __init__(self, sweeps, labels=None, start=None, end=None, step=None, span="overlap", max_gap=None):
+        if span not in SPANS:
+            raise ValueError(f"span must be one of {', '.join(SPANS)}")
+        self.sweeps = [_arrays(s) for s in sweeps]
+        if not self.sweeps:
+            raise ValueError("No sweeps to compare")
+        self.labels = [str(i) for i in range(len(self.sweeps))] if labels is None else [str(x) for x in labels]
+        if len(self.labels) != len(self.sweeps):
+            raise ValueError("Need one label per sweep")
+
+        measured = [f for f, _ in self.sweeps if len(f)]
+        if not measured:
+            raise ValueError("Every sweep is empty")
+        lows = [int(f[0]) for f in measured]
+        highs = [int(f[-1]) for f in measured]
+        if start is None:
+            start = max(lows) if span == "overlap" else min(lows)
+        if end is None:
+            end = min(highs) if span == "overlap" else max(highs)
+        if end < start:
+            raise ValueError("The sweeps do not overlap, compare them with span='union'")
+        if step is None:
+            steps = [np.median(np.diff(f)) for f in measured if len(f) > 1]
+            step = int(max(steps)) if steps else 1
+        self.start, self.end, self.step = start, end, step
+        self.grid = np.arange(start, end + 1, step, dtype=np.int64)
+        self.max_gap = max_gap
+        self.values = np.stack([resample(f, v, self.grid, max_gap) for f, v in self.sweeps])
+        self._summary = None
+
+    def __len__(self):
+        return len(self.sweeps)
+
+    def column(self, name):
+        """
+        One of swr, r, x or z as a (sweeps, points) array.
+        """
+        return self.values[:, :, Sark100Collector.value_columns.index(name)]
+
+    def difference(self, column="swr", reference=0):
+        """
+        Every sweep minus the sweep at index `reference`, point by point, as
+        a (sweeps, points) array.
+        """
+        values = self.column(column)
+        return values - values[reference]
+
+    def _products(self, column):
+        # Sums over the points shared by each pair of sweeps from matrix products.
+        # Values are centred on the per-point mean first, which leaves the
+        # differences unchanged and keeps the squares small.
+        values = self.column(column)
+        present = ~np.isnan(values)
+        mask = present.astype(np.float64)
+        counts = mask.sum(axis=0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            centre = np.where(counts > 0, np.where(present, values, 0.0).sum(axis=0) / counts, 0.0)
+        a = np.where(present, values - centre, 0.0)
+        shared = mask @ mask.T
+        # total[i, j] is the sum of (b_j - a_i) and squares the sum of its squares
+        total = mask @ a.T - a @ mask.T
+        squares = (a * a) @ mask.T + mask @ (a * a).T - 2 * (a @ a.T)
+        return shared, total, squares
+
+    def difference_matrix(self, column="swr"):
+        """
+        Mean signed difference of `column` between every pair of sweeps, as
+        a (sweeps, sweeps) array; [i, j] is the mean of sweep j minus sweep
+        i. NaN where two sweeps share no point.
+        """
+        shared, total, _ = self._products(column)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(shared > 0, total / shared, np.nan)
+
+    def rms_matrix(self, column="swr"):
+        """
+        RMS deviation of `column` between every pair of sweeps, as a
+        symmetric (sweeps, sweeps) array. NaN where two sweeps share no
+        point.
+        """
+        shared, _, squares = self._products(column)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            rms = np.where(shared > 0, np.sqrt(np.maximum(squares, 0.0) / shared), np.nan)
+        np.fill_diagonal(rms, np.where(np.diag(shared) > 0, 0.0, np.nan))
+        return rms
+
+    def summary(self):
+        """
+        One row per sweep with a label column and the columns of
+        pysark100.analysis.summary: the lowest SWR and its frequency, the
+        resonance nearest to it and its Q, and the 2:1 and 1.5:1
+        bandwidths. Taken from the measured points within the grid range,
+        for all sweeps in one grouped pass.
+        """
+        if self._summary is None:
+            frames = []
+            for i, (freq, values) in enumerate(self.sweeps):
+                inside = (freq >= self.start) & (freq <= self.end)
+                columns = {"sweep": np.full(np.count_nonzero(inside), i, dtype=np.int64), "freq": freq[inside]}
+                for k, name in enumerate(Sark100Collector.value_columns):
+                    columns[name] = values[inside, k]
+                frames.append(pl.DataFrame(columns))
+            found = summary(pl.concat(frames), by="sweep")
+            labels = pl.DataFrame({"sweep": np.arange(len(self), dtype=np.int64), "label": self.labels})
+            self._summary = labels.join(found, on="sweep", how="left").drop("sweep")
+        return self._summary
+
+    def resonance_shift(self):
+        """
+        Shift in Hz of the resonance nearest the lowest SWR between every
+        pair of sweeps, as a (sweeps, sweeps) array; [i, j] is the
+        resonance of sweep j minus that of sweep i. NaN where either sweep
+        has no resonance.
+        """
+        resonance = self.summary()["resonance"].to_numpy().astype(np.float64)
+        return resonance[None, :] - resonance[:, None]
+
+    def to_frame(self, matrix):
+        """
+        A (sweeps, sweeps) matrix as a DataFrame: a label column and one
+        column per sweep.
+        """
+        return pl.DataFrame({"label": self.labels, **{label: matrix[:, j] for j, label in enumerate(self.labels)}})
+
+    @classmethod
+    def from_store(cls, store, sweep_ids=None, **options):
+        """
+        Compare sweeps of a SweepStore, labelled by sweep_id: the given
+        sweep_ids, or every sweep when None. Other options are passed to
+        SweepComparison.
+        """
+        index = store.sweeps()
+        if sweep_ids is not None:
+            missing = set(sweep_ids) - set(index["sweep_id"].to_list())
+            if missing:
+                raise KeyError(f"Sweeps not found in {store.root}: {', '.join(sorted(missing))}")
+            index = index.filter(pl.col("sweep_id").is_in(list(sweep_ids)))
+        ids = index["sweep_id"].to_list()
+        frames = store.query().filter(pl.col("sweep_id").is_in(ids)).collect().partition_by(
+            "sweep_id", as_dict=True
+        )
+        return cls([frames[(i,)] for i in ids], labels=ids, **options)
+
+    def _traces(self, column, reference, downsample):
+        # (label, x in MHz, y) of every sweep to draw, each reduced to the min/max of `downsample` buckets
+        values = self.column(column) if reference is None else self.difference(column, reference)
+        freq = self.grid
+        for label, y in zip(self.labels, values):
+            keep = np.flatnonzero(~np.isnan(y))
+            if downsample:
+                keep = keep[minmax_indices(freq[keep], [y[keep]], downsample)]
+            yield label, freq[keep] / 1_000_000, y[keep]
+
+    def _axis_title(self, column, reference):
+        name = column.upper() if column == "swr" else column.upper() + " (Ohms)"
+        return name if reference is None else f"{name} - {self.labels[reference]}"
+
+    def plot(self, column="swr", reference=None, show_bands=True, filename="compare.png",
+             downsample=DEFAULT_BUCKETS):
+        """
+        Overlay `column` of every sweep with matplotlib, or its difference
+        from the sweep at index `reference`. Each sweep is reduced to the
+        min/max of `downsample` buckets; pass None or 0 to draw every point.
+        """
+        import matplotlib.pyplot as plt
+
+        plt.figure(figsize=(12, 6))
+        for label, x, y in self._traces(column, reference, downsample):
+            plt.plot(x, y, label=label, linewidth=1)
+
+        if show_bands:
+            for band_name, band_start, band_end in band_index().overlapping(self.start, self.end):
+                plt.axvspan(band_start / 1_000_000, band_end / 1_000_000, color="grey", alpha=0.3)
+                plt.text((band_start + band_end) / 2_000_000, plt.ylim()[1] * 0.95, band_name, ha="center",
+                         va="top", fontsize=8, color="black")
+
+        plt.xlabel("Frequency (MHz)")
+        plt.ylabel(self._axis_title(column, reference))
+        plt.title(f"SARK100 Comparison of {len(self)} Sweeps")
+        if len(self) <= LEGEND_LIMIT:
+            plt.legend()
+        plt.grid(True)
+        plt.tight_layout()
+        plt.savefig(filename)
+        plt.close()
+
+    def plot_interactive(self, column="swr", reference=None, show_bands=True, downsample=DEFAULT_BUCKETS, html=None):
+        """
+        Display an interactive Plotly overlay of `column` of every sweep, or
+        of its difference from the sweep at index `reference`. With html the
+        overlay is written to that file as a self-contained page instead.
+        """
+        import plotly.graph_objects as go
+        from pysark100.collector import plotly_bands, write_html
+
+        fig = go.Figure()
+        fig.add_traces([go.Scattergl(x=x, y=y, mode="lines", name=label)
+                        for label, x, y in self._traces(column, reference, downsample)])
+
+        if show_bands:
+            fig.update_layout(**plotly_bands(self.start, self.end))
+
+        fig.update_layout(
+            title=f"SARK100 Comparison of {len(self)} Sweeps",
+            xaxis_title="Frequency (MHz)",
+            yaxis_title=self._axis_title(column, reference),
+            template="plotly_white",
+            showlegend=len(self) <= LEGEND_LIMIT
+        )
+        if html is not None:
+            write_html(fig, html)
+        else:
+            fig.show()
@@ -0,0 +1,76 @@
+"""
+Min/max preserving downsampling for plotting.
+Reduces a sweep to a few points per horizontal pixel while keeping every
+bucket's first, last, minimum and maximum samples, so SWR dips and
+resonances are drawn exactly.
+"""
+import numpy as np
+
+# Roughly the width of a screen in pixels
+DEFAULT_BUCKETS = 2000
+
+
+def minmax_indices(x, ys, buckets=DEFAULT_BUCKETS, x_range=None):
+    """
+    Choose the samples to draw for a line plot.
+
+    x is split into `buckets` equal-width buckets over x_range (or the whole
+    of x) and for every bucket and every series in ys the first, last,
+    minimum and maximum samples are kept. One sample either side of x_range
+    is kept too so lines run off the edge of a zoomed view.
+
+    Parameters
+    ----------
+    x : numpy.ndarray
+        Sorted x values
+    ys : Sequence[numpy.ndarray]
+        Series sharing x whose extremes must be kept
+    buckets : int
+        Number of buckets, about the plot width in pixels
+    x_range : Optional[Tuple[float, float]]
+        Visible x range; samples outside it are dropped
+
+    Returns
+    -------
+    numpy.ndarray
+        Sorted indices into x of the samples to draw
+    """
+    n = len(x)
+    lo, hi = 0, n
+    if x_range is not None and n:
+        lo = max(0, int(np.searchsorted(x, x_range[0], side="left")) - 1)
+        hi = min(n, int(np.searchsorted(x, x_range[1], side="right")) + 1)
+    if hi - lo <= 4 * buckets:
+        return np.arange(lo, hi)
+
+    xs = x[lo:hi]
+    span = xs[-1] - xs[0]
+    edges = xs[0] + span * np.arange(buckets) / buckets
+    starts = np.unique(np.searchsorted(xs, edges, side="left"))
+    ends = np.append(starts[1:], len(xs)) - 1
+    counts = ends - starts + 1
+    bucket_of = np.repeat(np.arange(len(starts)), counts)
+
+    keep = [starts, ends]
+    for y in ys:
+        y = np.asarray(y[lo:hi], dtype=np.float64)
+        for reduce in (np.minimum, np.maximum):
+            extreme = reduce.reduceat(y, starts)
+            hits = np.flatnonzero(y == np.repeat(extreme, counts))
+            # First sample reaching the extreme in each bucket
+            _, first = np.unique(bucket_of[hits], return_index=True)
+            keep.append(hits[first])
+    return np.unique(np.concatenate(keep)) + lo
+
+
+def downsample_frame(df, buckets=DEFAULT_BUCKETS, columns=("swr", "r", "x", "z"), x_range=None):
+    """
+    Return the rows of a collector frame chosen by minmax_indices() over the
+    given value columns. buckets of None or 0 returns df unchanged.
+    """
+    if not buckets:
+        return df
+    indices = minmax_indices(df["freq"].to_numpy(), [df[c].to_numpy() for c in columns], buckets, x_range)
+    if len(indices) == len(df):
+        return df
+    return df[indices]
@@ -0,0 +1,281 @@
+"""
+Import and export of sweeps.
+Writes collectors to Touchstone .s1p, CSV and Parquet a chunk of rows at a
+time, and reads those files, and the CSV / Parquet written by the streaming
+sinks, back into collectors.
+"""
+import os
+import re
+import numpy as np
+from pysark100.collector import Sark100Collector
+
+DEFAULT_CHUNK_ROWS = 65536
+# Touchstone frequency units and their size in Hz
+FREQ_UNITS = {"HZ": 1, "KHZ": 1e3, "MHZ": 1e6, "GHZ": 1e9}
+TOUCHSTONE_FORMATS = ("RI", "MA", "DB")
+_COMMENT = re.compile(rb"!.*")
+_SPACES = re.compile(rb"[ \t\r]+")
+# A line break with any spaces and blank lines around it
+_BREAKS = re.compile(rb" ?\n[ \n]*")
+
+
+def s11(r, x, z0=50.0):
+    """
+    The reflection coefficient S11 = (Z - z0) / (Z + z0) of Z = R + jX.
+
+    Parameters
+    ----------
+    r, x : numpy.ndarray
+        Resistance and reactance in Ohms
+    z0 : float
+        Reference impedance in Ohms
+
+    Returns
+    -------
+    numpy.ndarray
+        Complex S11
+    """
+    z = np.asarray(r, dtype=np.float64) + 1j * np.asarray(x, dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return (z - z0) / (z + z0)
+
+
+def impedance(s, z0=50.0):
+    """
+    The collector values (swr, r, x, z) for complex S11 against z0, the
+    inverse of s11().
+
+    Returns
+    -------
+    numpy.ndarray
+        (n, 4) swr, r, x and |Z|; SWR is infinite at |S11| = 1
+    """
+    s = np.asarray(s, dtype=np.complex128)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        z = z0 * (1 + s) / (1 - s)
+        gamma = np.abs(s)
+        swr = np.where(gamma < 1, (1 + gamma) / (1 - gamma), np.inf)
+    return np.column_stack((swr, z.real, z.imag, np.abs(z)))
+
+
+def _frames(data, chunk_rows):
+    # The measurements of data as successive frames of at most chunk_rows rows.
+    # Collectors are sliced from their buffers, so no full-length frame is built.
+    import polars as pl
+
+    if isinstance(data, pl.DataFrame):
+        for offset in range(0, len(data), chunk_rows):
+            yield data.slice(offset, chunk_rows)
+        return
+    if not isinstance(data, Sark100Collector):
+        # A scan result
+        data._ensure_full()
+        data = data.data
+    if data.sink is not None and data._flushed:
+        yield from _frames(data.df, chunk_rows)
+        return
+    freq, values, n = data.buffers()
+    for offset in range(0, n, chunk_rows):
+        end = min(offset + chunk_rows, n)
+        columns = {"freq": freq[offset:end]}
+        for i, name in enumerate(Sark100Collector.value_columns):
+            columns[name] = values[offset:end, i]
+        for name, column in data.extra.items():
+            columns[name] = column[offset:end]
+        yield pl.DataFrame(columns)
+
+
+def write_touchstone(data, path, z0=50.0, fmt="RI", freq_unit="HZ", chunk_rows=DEFAULT_CHUNK_ROWS,
+                     comments=None):
+    """
+    Write a sweep as a one-port Touchstone (.s1p) file.
+
+    S11 is computed from R and X against z0 for each chunk of rows and
+    written straight to the file, so the whole file is never held as text.
+
+    Parameters
+    ----------
+    data : Sark100Collector | CollectorResult | polars.DataFrame
+        The sweep
+    path : str
+        File to write
+    z0 : float
+        Reference impedance in Ohms, written in the option line
+    fmt : str
+        "RI" (real, imaginary), "MA" (magnitude, angle in degrees) or "DB"
+        (dB magnitude, angle in degrees)
+    freq_unit : str
+        "HZ", "KHZ", "MHZ" or "GHZ"
+    chunk_rows : int
+        Rows computed and written at a time
+    comments : Optional[Sequence[str]]
+        Lines written as ! comments at the top
+    """
+    import polars as pl
+
+    fmt, freq_unit = fmt.upper(), freq_unit.upper()
+    if fmt not in TOUCHSTONE_FORMATS:
+        raise ValueError(f"Unsupported Touchstone format '{fmt}', use RI, MA or DB")
+    if freq_unit not in FREQ_UNITS:
+        raise ValueError(f"Unsupported frequency unit '{freq_unit}', use HZ, KHZ, MHZ or GHZ")
+    scale = FREQ_UNITS[freq_unit]
+
+    with open(path, "wb") as fh:
+        for line in ["Written by pysark100"] + list(comments or []):
+            fh.write(f"! {line}\n".encode())
+        fh.write(f"# {freq_unit} S {fmt} R {z0:g}\n".encode())
+        for frame in _frames(data, chunk_rows):
+            s = s11(frame["r"].to_numpy(), frame["x"].to_numpy(), z0)
+            freq = frame["freq"].to_numpy()
+            if fmt == "RI":
+                a, b = s.real, s.imag
+            else:
+                with np.errstate(divide="ignore"):
+                    a = np.abs(s) if fmt == "MA" else 20 * np.log10(np.abs(s))
+                b = np.degrees(np.angle(s))
+            pl.DataFrame({"f": freq if scale == 1 else freq / scale, "a": a, "b": b}).write_csv(
+                fh, include_header=False, separator=" "
+            )
+
+
+def read_touchstone(path, z0=None):
+    """
+    Read a one-port Touchstone (.s1p) file into a Sark100Collector.
+
+    The option line sets the frequency unit, the data format (RI, MA or DB)
+    and the reference impedance S11 is taken against; the collector values
+    are computed from S11 against that impedance, or against z0 when given.
+    Frequencies are rounded to whole Hz.
+    """
+    with open(path, "rb") as fh:
+        text = fh.read()
+
+    unit, fmt, reference = "GHZ", "MA", 50.0
+    option = re.search(rb"^[ \t]*#(.*)$", text, re.M)
+    if option is not None:
+        words = option.group(1).decode().split("!")[0].upper().split()
+        for i, word in enumerate(words):
+            if word in FREQ_UNITS:
+                unit = word
+            elif word in TOUCHSTONE_FORMATS:
+                fmt = word
+            elif word == "R" and i + 1 < len(words):
+                reference = float(words[i + 1])
+        # Only comments may come before the option line
+        text = text[option.end():]
+
+    freq, a, b = _touchstone_values(text, path)
+    if fmt == "RI":
+        s = a + 1j * b
+    else:
+        magnitude = a if fmt == "MA" else 10 ** (a / 20)
+        s = magnitude * np.exp(1j * np.radians(b))
+    if z0 is not None and z0 != reference:
+        # Renormalise S11 to the requested reference impedance
+        s = s11(*impedance(s, reference)[:, 1:3].T, z0)
+        reference = z0
+
+    collector = Sark100Collector(capacity=len(freq))
+    collector.add_values(np.rint(freq * FREQ_UNITS[unit]).astype(np.int64), impedance(s, reference))
+    return collector
+
+
+def _touchstone_values(body, path):
+    # The frequency and the two S11 values of every data line. Lines with
+    # single spaces between the values, as write_touchstone writes them, are
+    # parsed by Polars in bulk; other spacing is normalised and parsed again.
+    if b"!" in body:
+        body = _COMMENT.sub(b"", body)
+    body = body.strip()
+    if not body:
+        return np.empty(0), np.empty(0), np.empty(0)
+    values = _parse_values(body)
+    if values is None:
+        values = _parse_values(_BREAKS.sub(b"\n", _SPACES.sub(b" ", body)).strip())
+    if values is None:
+        raise ValueError(f"{path} is not a one-port Touchstone file: every data line needs 3 values")
+    return values
+
+
+def _parse_values(body):
+    import polars as pl
+
+    try:
+        frame = pl.read_csv(body, has_header=False, separator=" ",
+                            schema={"f": pl.Float64, "a": pl.Float64, "b": pl.Float64})
+    except pl.exceptions.ComputeError:
+        return None
+    if frame.null_count().sum_horizontal()[0]:
+        return None
+    return tuple(frame[c].to_numpy() for c in ("f", "a", "b"))
+
+
+def write_csv(data, path, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """
+    Write a sweep to CSV with the collector columns, chunk_rows at a time.
+    """
+    with open(path, "wb") as fh:
+        for i, frame in enumerate(_frames(data, chunk_rows)):
+            frame.write_csv(fh, include_header=i == 0)
+
+
+def write_parquet(data, path, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """
+    Write a sweep to Parquet in row groups of chunk_rows rows.
+    """
+    import polars as pl
+
+    if not isinstance(data, pl.DataFrame):
+        data = data.df if isinstance(data, Sark100Collector) else data.get_dataframe()
+    data.write_parquet(path, row_group_size=chunk_rows, statistics=True)
+
+
+def _read_frame(path):
+    import polars as pl
+
+    ext = os.path.splitext(path)[1].lower()
+    if os.path.isdir(path):
+        # The part files written by a .parquet or .arrow sink
+        if ext == ".parquet":
+            return pl.read_parquet(os.path.join(path, "part-*.parquet"))
+        return pl.read_ipc(os.path.join(path, "part-*.arrow"))
+    if ext == ".csv":
+        columns = dict(Sark100Collector.columns)
+        header = pl.read_csv(path, n_rows=0).columns
+        return pl.read_csv(path, schema_overrides={c: columns[c] for c in header if c in columns})
+    if ext == ".parquet":
+        return pl.read_parquet(path)
+    if ext in (".arrow", ".ipc", ".feather"):
+        return pl.read_ipc(path)
+    raise ValueError(f"Unsupported file format '{ext}', use .s1p, .csv, .parquet or .arrow")
+
+
+def export(data, path, z0=50.0, chunk_rows=DEFAULT_CHUNK_ROWS, **options):
+    """
+    Write a sweep to path in the format given by its extension: .s1p
+    (Touchstone, see write_touchstone for the options), .csv or .parquet.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".s1p":
+        return write_touchstone(data, path, z0=z0, chunk_rows=chunk_rows, **options)
+    if options:
+        raise TypeError(f"Unexpected options for {ext}: {', '.join(options)}")
+    if ext == ".csv":
+        return write_csv(data, path, chunk_rows=chunk_rows)
+    if ext == ".parquet":
+        return write_parquet(data, path, chunk_rows=chunk_rows)
+    raise ValueError(f"Unsupported export format '{ext}', use .s1p, .csv or .parquet")
+
+
+def load(path, z0=None):
+    """
+    Load a sweep into a Sark100Collector from a .s1p, .csv, .parquet or
+    .arrow file, or from the directory written by a .parquet / .arrow sink.
+    Columns beyond the collector ones which hold floats are kept as extra
+    columns.
+    """
+    if os.path.splitext(path)[1].lower() == ".s1p":
+        return read_touchstone(path, z0=z0)
+    collector = Sark100Collector()
+    collector.df = _read_frame(path)
+    return collector
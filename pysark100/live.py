@@ -0,0 +1,112 @@
+"""
+Live PyQtGraph plotting of a running sweep.
+The window opens straight away and the curves fill in as measurements arrive.
+"""
+import threading
+import numpy as np
+from pysark100.collector import Sark100Collector, pyqtgraph_window
+
+
+def plot_live(scan, include_r=False, include_x=False, include_z=False, show_bands=True,
+              refresh_ms=100, close_when_done=False, downsample=None):
+    """
+    Show a sark100Scan in PyQtGraph while it runs.
+
+    The scan is read on a background thread. A Qt timer redraws every
+    refresh_ms milliseconds, only when new points have arrived, by pointing
+    the curves at the first n rows of preallocated arrays, so no frame or
+    full-length copy is made per repaint.
+
+    When downsample is set, PyQtGraph's own peak (min/max) downsampling and
+    clipping to the visible range are enabled, as the data is still growing.
+
+    Blocks until the window is closed, or until the sweep finishes when
+    close_when_done is set. Closing the window stops the reader after the
+    line it is waiting for, leaving the sweep unfinished, and the reader
+    is joined before returning. Returns the scan's Sark100Collector.
+    """
+    import pyqtgraph as pg
+    from pyqtgraph.Qt import QtCore
+
+    if scan.data.sink is not None:
+        raise ValueError("Live plotting needs the whole sweep in memory, it cannot be used with a sink")
+
+    last_freq = scan.end - scan.step
+    app, win, plot = pyqtgraph_window(scan.start, last_freq, show_bands,
+                                      title="SARK100 Measurement (PyQtGraph, live)")
+    plot.setXRange(scan.start / 1_000_000, last_freq / 1_000_000)
+    plot.addLegend(offset=(30, 30))
+    if downsample:
+        plot.setDownsampling(auto=True, mode="peak")
+        plot.setClipToView(True)
+
+    # The MHz axis is preallocated for the whole sweep and filled as points arrive
+    total = (last_freq - scan.start) // scan.step + 1
+    freq_mhz = np.empty(max(1, total), dtype=np.float64)
+
+    columns = Sark100Collector.value_columns
+    wanted = [("swr", "b", "SWR")]
+    if include_r:
+        wanted.append(("r", "g", "R"))
+    if include_x:
+        wanted.append(("x", "orange", "X"))
+    if include_z:
+        wanted.append(("z", "r", "Z"))
+    curves = [(columns.index(col), plot.plot(pen=pg.mkPen(color, width=2), name=name))
+              for col, color, name in wanted]
+
+    state = {"shown": 0, "error": None}
+    # Set when the window closes, the reader stops before the next line
+    stop = threading.Event()
+
+    def read():
+        try:
+            for _ in scan:
+                if stop.is_set():
+                    break
+        except Exception as e:
+            # Reported once the window closes
+            state["error"] = e
+
+    reader = threading.Thread(target=read, name="sark100-live-reader", daemon=True)
+
+    def refresh():
+        freq, values, n = scan.data.buffers()
+        shown = state["shown"]
+        if n > shown:
+            if n > len(freq_mhz):
+                # More points than planned, stop extending the axis past the sweep
+                n = len(freq_mhz)
+            freq_mhz[shown:n] = freq[shown:n] / 1_000_000
+            for column, curve in curves:
+                curve.setData(freq_mhz[:n], values[:n, column])
+            state["shown"] = n
+        if close_when_done and not reader.is_alive():
+            timer.stop()
+            win.close()
+            app.quit()
+
+    timer = QtCore.QTimer()
+    timer.timeout.connect(refresh)
+    timer.start(refresh_ms)
+
+    close_event = win.closeEvent
+
+    def closed(event):
+        stop.set()
+        close_event(event)
+
+    win.closeEvent = closed
+
+    win.show()
+    reader.start()
+    try:
+        app.exec_()
+    finally:
+        timer.stop()
+        stop.set()
+        reader.join()
+
+    if state["error"] is not None:
+        raise state["error"]
+    return scan.data
@@ -0,0 +1,307 @@
+"""
+Continuous monitoring of a fixed antenna.
+Repeats a sweep on a schedule, compares each sweep with a rolling baseline of
+the previous ones, and keeps only the sweeps which changed, as keyframes or as
+deltas of the points which moved, next to a small per-sweep time series.
+Drifts of the resonance or the lowest SWR raise alert events.
+"""
+import glob
+import json
+import os
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timezone
+import numpy as np
+import polars as pl
+from pysark100.analysis import resonances
+from pysark100.collector import Sark100Collector
+
+DEFAULT_TOLERANCE = {"swr": 0.05, "r": 1.0, "x": 1.0, "z": 1.0}
+
+
+def compare_sweeps(values, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    Compare a sweep with a baseline point by point.
+
+    Parameters
+    ----------
+    values : numpy.ndarray
+        (points, 4) swr, r, x, z of the sweep on a fixed frequency grid, NaN
+        where a point is missing
+    baseline : numpy.ndarray
+        (points, 4) baseline on the same grid
+    tolerance : Dict[str, float]
+        Largest difference per column which still counts as unchanged
+
+    Returns
+    -------
+    numpy.ndarray
+        Boolean mask of the points where any column differs by more than its
+        tolerance. Points missing from either side never count as changed.
+    """
+    limits = np.array([tolerance[c] for c in Sark100Collector.value_columns], dtype=np.float64)
+    with np.errstate(invalid="ignore"):
+        return (np.abs(values - baseline) > limits).any(axis=1)
+
+
+class MonitorLog:
+    """
+    A directory holding what a SweepMonitor recorded:
+
+        <root>/series/<stamp>.parquet   one row per sweep: timestamp, min_swr,
+                                        min_swr_freq, resonance, changed points,
+                                        what was stored and any error
+        <root>/points/<stamp>.parquet   stored sweeps, as float32
+        <root>/alerts.jsonl             one JSON alert event per line
+
+    A stored sweep is either a keyframe with every point, or a delta with only
+    the points which differ from the latest keyframe by more than the
+    tolerance. load() rebuilds either into a full sweep.
+
+    Every sweep adds its own series file, so appending never rewrites what
+    was recorded before; series() reads them all back as one frame.
+    """
+    series_schema = {
+        "timestamp": pl.Datetime("us", "UTC"),
+        "min_swr": pl.Float64,
+        "min_swr_freq": pl.Int64,
+        "resonance": pl.Float64,
+        "changed": pl.Int64,
+        "stored": pl.Utf8,
+        "path": pl.Utf8,
+        "error": pl.Utf8,
+    }
+
+    def __init__(self, root):
+        self.root = root
+        self.series_dir = os.path.join(root, "series")
+        self.alerts_path = os.path.join(root, "alerts.jsonl")
+        os.makedirs(os.path.join(root, "points"), exist_ok=True)
+        os.makedirs(self.series_dir, exist_ok=True)
+
+    def append(self, row, frame=None):
+        """
+        Add a row to the series as a file of its own, writing frame (freq,
+        swr, r, x, z) to its own file first when the sweep is stored.
+        """
+        row = dict(row)
+        row["path"] = None
+        if frame is not None:
+            row["path"] = os.path.join("points", f"{row['timestamp']:%Y%m%dT%H%M%S%f}-{row['stored']}.parquet")
+            frame.with_columns(pl.col(Sark100Collector.value_columns).cast(pl.Float32)).write_parquet(
+                os.path.join(self.root, row["path"]), statistics=False
+            )
+        new = pl.DataFrame([{name: row.get(name) for name in self.series_schema}], schema=self.series_schema)
+        path = os.path.join(self.series_dir, f"{row['timestamp']:%Y%m%dT%H%M%S%f}-{uuid.uuid4().hex[:8]}.parquet")
+        # Write the part atomically so readers never see a partial file
+        tmp = path + ".tmp"
+        new.write_parquet(tmp)
+        os.replace(tmp, path)
+
+    def alert(self, event):
+        with open(self.alerts_path, "a", encoding="utf-8") as fh:
+            fh.write(json.dumps(event, default=str) + "\n")
+
+    def series(self):
+        """
+        The per-sweep time series as a Polars DataFrame, oldest first.
+        """
+        pattern = os.path.join(self.series_dir, "*.parquet")
+        if not glob.glob(pattern):
+            return pl.DataFrame(schema=self.series_schema)
+        return pl.scan_parquet(pattern).sort("timestamp").collect()
+
+    def alerts(self):
+        """
+        Every alert event recorded, oldest first.
+        """
+        if not os.path.exists(self.alerts_path):
+            return []
+        with open(self.alerts_path, "r", encoding="utf-8") as fh:
+            return [json.loads(line) for line in fh if line.strip()]
+
+    def load(self, timestamp):
+        """
+        Rebuild the sweep stored at timestamp into a Sark100Collector. A delta
+        is applied on top of the keyframe stored before it.
+        """
+        stored = self.series().filter(pl.col("path").is_not_null())
+        at = stored.filter(pl.col("timestamp") == timestamp)
+        if at.is_empty():
+            raise KeyError(f"No sweep stored at {timestamp} in {self.root}")
+        key = stored.filter((pl.col("stored") == "key") & (pl.col("timestamp") <= timestamp)).tail(1)
+        frame = self._read(key["path"][0])
+        if at["stored"][0] == "delta":
+            frame = frame.update(self._read(at["path"][0]), on="freq")
+        collector = Sark100Collector()
+        collector.df = frame
+        return collector
+
+    def _read(self, path):
+        return pl.read_parquet(os.path.join(self.root, path)).with_columns(
+            pl.col(Sark100Collector.value_columns).cast(pl.Float64)
+        )
+
+
+class SweepMonitor:
+    """
+    Repeats a sweep of start..end every `interval` seconds.
+
+    Each sweep is laid onto the fixed frequency grid and compared with the
+    median of the last `baseline` sweeps by compare_sweeps(). A sweep with
+    any point beyond `tolerance` is stored in the MonitorLog: as a keyframe
+    when there is none yet or more than `keyframe_fraction` of the points
+    moved away from the latest keyframe, otherwise as a delta of the points
+    which did. Sweeps within tolerance only add a row to the series.
+
+    An alert event is raised when the resonance nearest the lowest SWR moves
+    by more than `resonance_drift` Hz, or the lowest SWR by more than
+    `swr_drift`, from the median of the baseline sweeps. Alerts are passed
+    to on_alert, written to the log and kept in `alerts`; on_sweep gets the
+    event dict of every sweep.
+
+    Sweeps which end with an Error or a timeout are recorded in the series
+    but left out of the baseline, the comparison and the stored sweeps.
+    """
+    def __init__(self, parent, start, end, step=1000, interval=60.0, baseline=5, tolerance=None,
+                 resonance_drift=50000, swr_drift=0.3, keyframe_fraction=0.5, log=None, on_sweep=None,
+                 on_alert=None):
+        self.parent = parent
+        self.start = start
+        self.end = end
+        self.step = step
+        self.interval = interval
+        self.tolerance = {**DEFAULT_TOLERANCE, **(tolerance or {})}
+        self.resonance_drift = resonance_drift
+        self.swr_drift = swr_drift
+        self.keyframe_fraction = keyframe_fraction
+        self.log = MonitorLog(log) if isinstance(log, str) else log
+        self.on_sweep = on_sweep
+        self.on_alert = on_alert
+        self.points = (end - start) // step + 1
+        # Grid values and (min_swr, resonance) of the last `baseline` good sweeps
+        self._baseline = deque(maxlen=baseline)
+        self._summaries = deque(maxlen=baseline)
+        self._key = None
+        self.sweeps = 0
+        self.alerts = []
+
+    def _summary(self, collector):
+        grid = collector.to_grid(self.start, self.step, self.points)
+        swr = grid[:, 0]
+        if np.isnan(swr).all():
+            return grid, None, None, None
+        best = int(np.nanargmin(swr))
+        min_swr_freq = self.start + best * self.step
+        res = resonances(collector.df)
+        resonance = None
+        if len(res):
+            freqs = res["freq"].to_numpy()
+            resonance = float(freqs[np.argmin(np.abs(freqs - min_swr_freq))])
+        return grid, float(swr[best]), min_swr_freq, resonance
+
+    def _drift(self, timestamp, min_swr, resonance):
+        events = []
+        base_swr = [s for s, _ in self._summaries if s is not None]
+        base_res = [r for _, r in self._summaries if r is not None]
+        checks = [("min_swr", min_swr, base_swr, self.swr_drift),
+                  ("resonance", resonance, base_res, self.resonance_drift)]
+        for metric, value, history, limit in checks:
+            if value is None or not history or limit is None:
+                continue
+            reference = float(np.median(history))
+            if abs(value - reference) > limit:
+                events.append({"timestamp": timestamp.isoformat(), "metric": metric, "value": value,
+                               "baseline": reference, "drift": value - reference})
+        return events
+
+    def sweep(self):
+        """
+        Run one sweep, compare it with the baseline, store it if it changed
+        and raise any alerts.
+
+        Returns
+        -------
+        dict
+            timestamp, min_swr, min_swr_freq, resonance, changed (points
+            beyond tolerance), stored ("key", "delta" or None), error and alerts
+        """
+        timestamp = datetime.now(timezone.utc)
+        error = None
+        collector = Sark100Collector()
+        try:
+            scan = self.parent.scan(self.start, self.end, self.step, progress=False, use_cache=False)
+            scan._ensure_full()
+            collector = scan.data
+            error = scan.error
+        except OSError as e:
+            error = f"{type(e).__name__}: {e}"
+            self.parent.reconnect()
+
+        grid, min_swr, min_swr_freq, resonance = self._summary(collector)
+        event = {"timestamp": timestamp, "min_swr": min_swr, "min_swr_freq": min_swr_freq,
+                 "resonance": resonance, "changed": 0, "stored": None, "error": error, "alerts": []}
+        frame = None
+        if error is None:
+            if self._baseline:
+                reference = np.nanmedian(np.stack(self._baseline), axis=0)
+                changed = compare_sweeps(grid, reference, self.tolerance)
+                event["changed"] = int(np.count_nonzero(changed))
+                store = event["changed"] > 0
+            else:
+                event["changed"] = self.points
+                store = True
+            if store:
+                frame, event["stored"] = self._stored_frame(grid)
+            event["alerts"] = self._drift(timestamp, min_swr, resonance)
+            self._baseline.append(grid)
+            self._summaries.append((min_swr, resonance))
+
+        self.sweeps += 1
+        if self.log is not None:
+            self.log.append(event, frame)
+        for alert in event["alerts"]:
+            self.alerts.append(alert)
+            if self.log is not None:
+                self.log.alert(alert)
+            if self.on_alert is not None:
+                self.on_alert(alert)
+        if self.on_sweep is not None:
+            self.on_sweep(event)
+        return event
+
+    def _stored_frame(self, grid):
+        # A keyframe of every point, or the points which moved away from the latest keyframe
+        present = ~np.isnan(grid).any(axis=1)
+        if self._key is not None:
+            moved = compare_sweeps(grid, self._key, self.tolerance) & present
+            if np.count_nonzero(moved) <= self.keyframe_fraction * self.points:
+                return self._frame(grid, moved), "delta"
+        self._key = grid
+        return self._frame(grid, present), "key"
+
+    def _frame(self, grid, rows):
+        rows = np.flatnonzero(rows)
+        columns = {"freq": self.start + rows.astype(np.int64) * self.step}
+        for i, name in enumerate(Sark100Collector.value_columns):
+            columns[name] = grid[rows, i]
+        return pl.DataFrame(columns)
+
+    def run(self, count=None):
+        """
+        Sweep every `interval` seconds, measured from the start of one sweep
+        to the start of the next, until `count` sweeps have run (for ever
+        when None). A sweep taking longer than the interval is followed
+        straight away by the next. Returns the alerts raised.
+        """
+        next_at = time.monotonic()
+        done = 0
+        while count is None or done < count:
+            wait = next_at - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            next_at = max(next_at + self.interval, time.monotonic())
+            self.sweep()
+            done += 1
+        return self.alerts
@@ -0,0 +1,112 @@
+"""
+Multi-band sweeps.
+Plans the buffered ranges of several bands, merges the ones which overlap or
+touch, and sweeps them back-to-back on one open device.
+"""
+import polars as pl
+from pysark100.collector import CollectorResult, Sark100Collector
+from pysark100.bands import generate_band_frequencies
+
+
+def plan_band_ranges(band_names, buffer_pct=0.15, step=1000):
+    """
+    Plan the sweeps needed to cover several bands.
+
+    Each band's buffered range comes from generate_band_frequencies().
+    Ranges which overlap or are within one step of each other are merged
+    into a single sweep on the grid of the lower range, and the sweeps are
+    ordered by frequency so the device is set up once per merged range.
+
+    Parameters
+    ----------
+    band_names : Sequence[str]
+        Names of bands in the bands dictionary, duplicates are ignored
+    buffer_pct : float
+        Percentage of each band's width to add before and after it
+    step : int
+        Frequency step in Hz
+
+    Returns
+    -------
+    List[Tuple[int, int, List[str]]]
+        (start, end, bands) of every sweep, in the order they will run
+    """
+    ranges = []
+    for name in dict.fromkeys(band_names):
+        freq_list = generate_band_frequencies(name, buffer_pct=buffer_pct, step_hz=step)
+        ranges.append((freq_list[0], freq_list[-1], [name]))
+    ranges.sort(key=lambda r: (r[0], r[1]))
+
+    merged = []
+    for start, end, names in ranges:
+        if merged and start <= merged[-1][1] + step:
+            first, last, covered = merged[-1]
+            # Extend on the lower range's grid far enough to include end
+            points = -(-(end - first) // step)
+            merged[-1] = (first, max(last, first + points * step), covered + names)
+        else:
+            merged.append((start, end, names))
+    return merged
+
+
+class sark100MultiBandScan(CollectorResult):
+    """
+    A sweep of several bands on one device. The ranges planned by
+    plan_band_ranges() are swept one after another the first time the data
+    is requested.
+
+    `data` holds every measurement in one frequency sorted Sark100Collector
+    and `by_band` one Sark100Collector per band covering its buffered range.
+    `plan` holds the (start, end, bands) of each sweep.
+    """
+    def __init__(self, parent, band_names, buffer_pct=0.15, step=1000, progress=False, adaptive=False,
+                 **adaptive_options):
+        if not band_names:
+            raise ValueError("scan_bands needs at least one band")
+        self.parent = parent
+        self.stats = parent.stats
+        self.band_names = list(dict.fromkeys(band_names))
+        self.buffer_pct = buffer_pct
+        self.step = step
+        self.progress = progress
+        self.adaptive = adaptive
+        self.adaptive_options = adaptive_options
+        self.plan = plan_band_ranges(self.band_names, buffer_pct=buffer_pct, step=step)
+        self.data = Sark100Collector()
+        self.by_band = {}
+        self._done = False
+
+    def _ensure_full(self):
+        if self._done:
+            return
+        self._done = True
+
+        results = []
+        for start, end, _ in self.plan:
+            scan = self.parent.scan(start, end, self.step, progress=self.progress, adaptive=self.adaptive,
+                                    **self.adaptive_options)
+            scan._ensure_full()
+            results.append(scan.data)
+        self.data = Sark100Collector.concat(results)
+
+        df = self.data.df
+        for name in self.band_names:
+            freq_list = generate_band_frequencies(name, buffer_pct=self.buffer_pct, step_hz=self.step)
+            collector = Sark100Collector()
+            collector.df = df.filter(pl.col("freq").is_between(freq_list[0], freq_list[-1]))
+            self.by_band[name] = collector
+
+    def get_band_dataframe(self):
+        """
+        The measurements of every band stacked with a band column, ready for
+        per-band grouping such as analysis.summary(df, by="band"). Rows in
+        the buffers of two neighbouring bands appear once for each.
+        """
+        self._ensure_full()
+        frames = [c.df.with_columns(pl.lit(name).alias("band")) for name, c in self.by_band.items()]
+        return pl.concat(frames)
+
+    def __iter__(self):
+        self._ensure_full()
+        df = self.data.df
+        return iter(df.select(["freq"] + Sark100Collector.value_columns).iter_rows(named=True))
@@ -0,0 +1,144 @@
+"""
+Multi-analyzer sweeps.
+Splits one frequency range across several SARK100 units and drives them
+concurrently, merging the results into a single collector.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pysark100.collector import CollectorResult, Sark100Collector
+from pysark100.bands import generate_band_frequencies
+
+
+def partition_range(start, end, step, weights):
+    """
+    Split the sweep grid start..end (inclusive, in steps of step Hz) into
+    contiguous sub-ranges with point counts proportional to weights.
+
+    Returns
+    -------
+    List[Optional[Tuple[int, int]]]
+        One (start, end) per weight, or None where a device gets no points
+    """
+    points = (end - start) // step + 1
+    total = float(sum(weights))
+    if total <= 0:
+        weights = [1.0] * len(weights)
+        total = float(len(weights))
+
+    # Largest remainder allocation so the counts add up to the number of points
+    shares = [points * w / total for w in weights]
+    counts = [int(s) for s in shares]
+    remainders = sorted(range(len(shares)), key=lambda i: shares[i] - counts[i], reverse=True)
+    for i in remainders[:points - sum(counts)]:
+        counts[i] += 1
+
+    ranges = []
+    first = 0
+    for count in counts:
+        if count == 0:
+            ranges.append(None)
+            continue
+        ranges.append((start + first * step, start + (first + count - 1) * step))
+        first += count
+    return ranges
+
+
+class sark100PoolScan(CollectorResult):
+    """
+    A sweep split across the devices of a sark100Pool. The sub-sweeps run
+    concurrently the first time the data is requested and are merged into
+    one Sark100Collector in `data`. `plan` holds the (start, end) given to
+    each device, in pool order.
+    """
+    def __init__(self, pool, start, end, step=1000):
+        self.pool = pool
+        self.start = start
+        self.end = end
+        self.step = step
+        self.plan = partition_range(start, end, step, pool.throughput())
+        self.data = Sark100Collector()
+        self._done = False
+
+    def _ensure_full(self):
+        if self._done:
+            return
+        self._done = True
+
+        jobs = [(device, r) for device, r in zip(self.pool.devices, self.plan) if r is not None]
+        with ThreadPoolExecutor(max_workers=len(jobs)) as executor:
+            results = list(executor.map(lambda job: self.pool._sweep(job[0], job[1][0], job[1][1], self.step), jobs))
+        self.data = Sark100Collector.concat(results)
+
+    def __iter__(self):
+        self._ensure_full()
+        df = self.data.df
+        return iter(df.select(["freq"] + Sark100Collector.value_columns).iter_rows(named=True))
+
+
+class sark100Pool:
+    """
+    Drives several SARK100 analyzers as one. Each port may be anything
+    sark100(port=...) accepts.
+
+    Ranges are split in proportion to each device's measured throughput in
+    points per second. Throughput is measured with a short calibration sweep
+    of calibration_points the first time it is needed, and then updated from
+    every sweep the device completes.
+    """
+    def __init__(self, ports, calibration_points=20, calibration_start=14000000, calibration_step=1000):
+        from pysark100 import sark100
+
+        if not ports:
+            raise ValueError("sark100Pool needs at least one port")
+        self.devices = [sark100(port=port) for port in ports]
+        self.calibration_points = calibration_points
+        self.calibration_start = calibration_start
+        self.calibration_step = calibration_step
+        self.rates = [None] * len(self.devices)
+
+    def _sweep(self, device, start, end, step):
+        from pysark100 import sark100Scan
+
+        began = time.perf_counter()
+        scan = sark100Scan(device, start, end, step, progress=False)
+        scan._ensure_full()
+        elapsed = time.perf_counter() - began
+
+        index = self.devices.index(device)
+        if len(scan.data) and elapsed > 0:
+            rate = len(scan.data) / elapsed
+            previous = self.rates[index]
+            # Smooth so one slow sweep doesn't starve a device of work
+            self.rates[index] = rate if previous is None else 0.5 * previous + 0.5 * rate
+        return scan.data
+
+    def calibrate(self):
+        """
+        Measure every device's throughput with a short concurrent sweep.
+        Returns the points per second of each device.
+        """
+        start = self.calibration_start
+        end = start + self.calibration_step * (self.calibration_points - 1)
+        with ThreadPoolExecutor(max_workers=len(self.devices)) as executor:
+            list(executor.map(lambda d: self._sweep(d, start, end, self.calibration_step), self.devices))
+        return list(self.rates)
+
+    def throughput(self):
+        # Points per second of each device, calibrating the ones not measured yet
+        if any(rate is None for rate in self.rates):
+            self.calibrate()
+        return [rate or 0.0 for rate in self.rates]
+
+    def scan(self, start, end, step=1000):
+        total = (end - start) // step + 1
+        print(f"Getting data between {start} and {end} with a step of {step} for a total of {total} data points "
+              f"across {len(self.devices)} devices.")
+        return sark100PoolScan(self, start, end, step)
+
+    def scan_band(self, band, buffer_pct=0.15, step=1000):
+        freq_list = generate_band_frequencies(band, buffer_pct=buffer_pct, step_hz=step)
+        return self.scan(freq_list[0], freq_list[-1], step)
+
+    def close(self):
+        for device in self.devices:
+            device.device.close()
@@ -0,0 +1,225 @@
+"""
+Bulk reader and parser for the SARK100 scan protocol.
+Reads whatever the port has buffered in one call and parses a whole block of
+"swr,r,x,z" lines at once into a float array, instead of decoding, stripping
+and splitting every line in Python.
+"""
+import re
+import time
+import warnings
+from collections import deque
+import numpy as np
+
+# The line ending a sweep: End, or any line reporting an Error
+_TERMINATOR = re.compile(rb"^(?:End|[^\n]*Error)[^\n]*(?:\n|$)", re.M)
+# Protocol lines carrying no data: Start, the >> prompt and blank lines
+_CONTROL = re.compile(rb"^(?:Start|>>)?\r?\n", re.M)
+
+VALUE_COLUMNS = ["swr", "r", "x", "z"]
+
+
+class LineReader:
+    """
+    Buffered reader over a serial.Serial-like device.
+
+    read_block() moves everything the device has buffered into a reusable
+    bytearray in as few read() calls as possible and hands back all the
+    complete lines at once. readline() splits a whole read into lines in one
+    call and hands them out one at a time. Devices without in_waiting are
+    read a line at a time with their own readline().
+
+    With stats (a pysark100.stats.ScanStats) the bytes and reads are counted
+    and the time blocked waiting for the device is added to its device phase.
+    """
+    def __init__(self, device, stats=None):
+        self.device = device
+        self.stats = stats
+        self.buffer = bytearray()
+        # Lines already split off the buffer by readline(), without their newline
+        self._lines = deque()
+        self._bulk = hasattr(device, "in_waiting") and hasattr(device, "read")
+
+    def _fill(self):
+        # Read at least one byte, waiting up to the device timeout, then
+        # anything else already waiting. Returns the number of bytes read.
+        if self.stats is None:
+            return self._read_device()
+        started = time.perf_counter()
+        count = self._read_device()
+        self.stats.add("device", time.perf_counter() - started)
+        self.stats.count("reads")
+        self.stats.count("bytes", count)
+        return count
+
+    def _read_device(self):
+        if not self._bulk:
+            data = self.device.readline()
+            self.buffer += data
+            return len(data)
+        waiting = self.device.in_waiting
+        data = self.device.read(waiting or 1)
+        self.buffer += data
+        count = len(data)
+        if data and not waiting:
+            waiting = self.device.in_waiting
+            if waiting:
+                data = self.device.read(waiting)
+                self.buffer += data
+                count += len(data)
+        return count
+
+    def _unsplit(self):
+        # Return lines split off by readline() to the front of the buffer
+        if self._lines:
+            self.buffer[:0] = b"\n".join(self._lines) + b"\n"
+            self._lines.clear()
+
+    def readline(self):
+        """
+        Return the next line including its newline, or whatever arrived
+        before the device timed out (b"" if nothing did).
+        """
+        while not self._lines:
+            end = self.buffer.rfind(b"\n")
+            if end >= 0:
+                self._lines.extend(bytes(self.buffer[:end]).split(b"\n"))
+                del self.buffer[:end + 1]
+            elif not self._fill():
+                line = bytes(self.buffer)
+                self.buffer.clear()
+                return line
+        return self._lines.popleft() + b"\n"
+
+    def read_block(self):
+        """
+        Return every complete line available as one bytes block, waiting up
+        to the device timeout for the first. Returns whatever partial line
+        there is, or b"", if the device times out.
+        """
+        self._unsplit()
+        while True:
+            end = self.buffer.rfind(b"\n")
+            if end >= 0:
+                block = bytes(self.buffer[:end + 1])
+                del self.buffer[:end + 1]
+                return block
+            if not self._fill():
+                block = bytes(self.buffer)
+                self.buffer.clear()
+                return block
+
+    def unread(self, data):
+        """
+        Put data back in front of the buffer, to be read again.
+        """
+        self._unsplit()
+        if data:
+            self.buffer[:0] = data
+
+    def reset_input_buffer(self):
+        self._lines.clear()
+        self.buffer.clear()
+        reset = getattr(self.device, "reset_input_buffer", None)
+        if reset is not None:
+            reset()
+
+
+def split_sweep(block):
+    """
+    Split a block of protocol lines at the line ending the sweep.
+
+    Returns
+    -------
+    Tuple[bytes, Optional[str], bytes]
+        The data lines before the terminator with control lines removed,
+        the terminator line ("End" or the Error message) or None if the
+        sweep carries on, and the bytes after the terminator
+    """
+    match = _TERMINATOR.search(block)
+    if match is None:
+        head, terminator, rest = block, None, b""
+    else:
+        head, terminator, rest = block[:match.start()], match.group().decode("utf-8", "replace").strip(), \
+            block[match.end():]
+    return _CONTROL.sub(b"", head), terminator, rest
+
+
+def first_lines(block, count):
+    """
+    The first `count` lines of block and the remainder.
+    """
+    end = -1
+    for _ in range(count):
+        end = block.find(b"\n", end + 1)
+        if end < 0:
+            return block, b""
+    return block[:end + 1], block[end + 1:]
+
+
+def parse_block(block):
+    """
+    Parse a block of "swr,r,x,z" lines in one pass.
+
+    The lines are checked for their comma count on the raw bytes, and the
+    well-formed ones are handed to NumPy's text parser as one comma
+    separated run of numbers. Malformed lines (wrong field count or
+    non-numeric values) are not raised; they are flagged in the returned
+    mask so the caller can count them while keeping each line at its
+    position in the sweep.
+
+    Returns
+    -------
+    Tuple[numpy.ndarray, numpy.ndarray]
+        (n, 4) float64 values, one row per line, and a boolean mask of the
+        rows which parsed
+    """
+    if not block.endswith(b"\n"):
+        block += b"\n"
+    if not block.strip():
+        return np.empty((0, 4), dtype=np.float64), np.empty(0, dtype=bool)
+
+    raw = np.frombuffer(block, dtype=np.uint8)
+    ends = np.flatnonzero(raw == ord("\n"))
+    # Commas before the end of each line, less those before the end of the one before
+    commas = np.searchsorted(np.flatnonzero(raw == ord(",")), ends)
+    good = np.diff(commas, prepend=0) == 3
+    values = np.full((len(ends), 4), np.nan)
+    if not good.any():
+        return values, good
+
+    if good.all():
+        text = block
+    else:
+        # Drop the lines with the wrong field count
+        starts = np.concatenate(([0], ends[:-1] + 1))
+        text = b"".join(block[start:end + 1] for start, end in zip(starts[good], ends[good]))
+    with warnings.catch_warnings():
+        # Older NumPy warns and stops at a non-numeric value instead of raising
+        warnings.simplefilter("ignore", DeprecationWarning)
+        try:
+            # Newlines become separators; the \r left before them is skipped as whitespace
+            parsed = np.fromstring(text.replace(b"\n", b","), sep=",")
+        except ValueError:
+            parsed = None
+    if parsed is None or parsed.size != 4 * good.sum():
+        # A non-numeric value, parse line by line to find it
+        values, good = _parse_lines(block.split(b"\n")[:len(ends)])
+    else:
+        values[good] = parsed.reshape(-1, 4)
+    good &= ~np.isnan(values).any(axis=1)
+    return values, good
+
+
+def _parse_lines(lines):
+    values = np.full((len(lines), 4), np.nan)
+    good = np.zeros(len(lines), dtype=bool)
+    for i, line in enumerate(lines):
+        fields = line.split(b",")
+        if len(fields) != 4:
+            continue
+        try:
+            values[i] = [float(f) for f in fields]
+        except ValueError:
+            continue
+        good[i] = True
+    return values, good
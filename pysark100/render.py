@@ -0,0 +1,214 @@
+"""
+Headless rendering of sweep plots.
+SweepFigure draws sweeps on one reusable Agg Figure through the
+object-oriented API, keeping its lines and band overlays between plots
+instead of rebuilding them. render_batch() renders many sweeps to PNG or SVG
+files in a pool of worker processes, each with its own SweepFigure.
+"""
+import multiprocessing
+import os
+import numpy as np
+from pysark100.bands import band_index
+from pysark100.collector import Sark100Collector
+from pysark100.downsample import DEFAULT_BUCKETS, minmax_indices
+
+# Column, legend label and colour of each line
+SERIES = (("swr", "SWR", "blue"), ("r", "R", "green"), ("x", "X", "orange"), ("z", "Z", "red"))
+FORMATS = ("png", "svg")
+
+# The SweepFigure of a worker process, made on its first task
+_figure = None
+_figure_options = {}
+
+
+class SweepFigure:
+    """
+    A figure for sweep plots which is drawn again for each sweep.
+
+    The four value lines are made once and given new data on every
+    render(). Band overlays (shaded span, centre line and label) are made
+    the first time a band is in range and then only shown or hidden; the
+    labels sit at a fixed height in axes coordinates so they need no
+    repositioning when the y range changes.
+    """
+    def __init__(self, figsize=(12, 6), dpi=100):
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+        self.figure = Figure(figsize=figsize, dpi=dpi, tight_layout=True)
+        FigureCanvasAgg(self.figure)
+        self.axes = self.figure.add_subplot()
+        self.lines = {column: self.axes.plot([], [], label=label, color=color)[0]
+                      for column, label, color in SERIES}
+        self.axes.set_xlabel("Frequency (MHz)")
+        self.axes.set_ylabel("SWR / Impedance")
+        self.axes.grid(True)
+        self.title = self.axes.set_title("SARK100 Measurement")
+        # (name, start, end) of a band to its overlay artists
+        self._bands = {}
+
+    def _band(self, name, start, end):
+        artists = self._bands.get((name, start, end))
+        if artists is None:
+            start_mhz, end_mhz = start / 1_000_000, end / 1_000_000
+            mid_mhz = (start_mhz + end_mhz) / 2
+            artists = (
+                self.axes.axvspan(start_mhz, end_mhz, color="grey", alpha=0.3),
+                self.axes.axvline(x=mid_mhz, color="black", linestyle="--", linewidth=1, alpha=0.6),
+                self.axes.text(mid_mhz, 0.95, name, transform=self.axes.get_xaxis_transform(), ha="center",
+                               va="top", fontsize=8, color="black"),
+            )
+            self._bands[(name, start, end)] = artists
+        return artists
+
+    def render(self, freq, values, filename, include_r=False, include_x=False, include_z=False, show_bands=True,
+               downsample=DEFAULT_BUCKETS, title="SARK100 Measurement", fmt=None):
+        """
+        Draw a sweep and save it to filename.
+
+        Parameters
+        ----------
+        freq : numpy.ndarray
+            (n,) frequencies in Hz
+        values : numpy.ndarray
+            (n, 4) swr, r, x and z
+        filename : str
+            File to write
+        downsample : Optional[int]
+            Reduce the sweep to the min/max of this many buckets, None or 0
+            draws every point
+        fmt : Optional[str]
+            Image format, by default taken from the extension of filename
+        """
+        columns = Sark100Collector.value_columns
+        wanted = Sark100Collector._plotted(include_r, include_x, include_z)
+        if downsample and len(freq):
+            keep = minmax_indices(freq, [values[:, columns.index(c)] for c in wanted], downsample)
+            freq, values = freq[keep], values[keep]
+
+        freq_mhz = freq / 1_000_000
+        for i, column in enumerate(columns):
+            line = self.lines[column]
+            line.set_visible(column in wanted)
+            line.set_data(freq_mhz if column in wanted else [], values[:, i] if column in wanted else [])
+
+        shown = set()
+        if show_bands and len(freq):
+            # Only bands that intersect with the data range, umbrella ranges like 'hf' are skipped
+            for band in band_index().overlapping(freq.min(), freq.max()):
+                self._band(*band)
+                shown.add(band)
+        for band, artists in self._bands.items():
+            for artist in artists:
+                artist.set_visible(band in shown)
+
+        self.axes.relim(visible_only=True)
+        self.axes.autoscale_view()
+        self.axes.legend(handles=[self.lines[c] for c in wanted])
+        self.title.set_text(title)
+        self.figure.savefig(filename, format=fmt)
+
+
+def _arrays(data):
+    # (freq, values) of a collector, scan result or frame
+    if isinstance(data, Sark100Collector):
+        data = data.df
+    elif hasattr(data, "get_dataframe"):
+        data = data.get_dataframe()
+    return data["freq"].to_numpy(), data.select(Sark100Collector.value_columns).to_numpy()
+
+
+def _init_worker(options):
+    global _figure, _figure_options
+    _figure = None
+    _figure_options = options
+
+
+def _render_task(task):
+    # Render one sweep in a worker, loading it first when it is a file
+    global _figure
+    source, filename, title, options = task
+    if _figure is None:
+        _figure = SweepFigure(**_figure_options)
+    if isinstance(source, str):
+        source = _arrays(Sark100Collector.load(source))
+    _figure.render(*source, filename, title=title, **options)
+    return filename
+
+
+def render_batch(sweeps, outdir=".", fmt="png", workers=None, tasks_per_worker=64, figsize=(12, 6), dpi=100,
+                 start_method="spawn", **plot_options):
+    """
+    Render many sweeps to image files, one per sweep, in parallel.
+
+    Sweeps in memory are downsampled before they are handed to a worker,
+    and sweeps given as files are loaded by the worker itself, so little
+    data crosses between processes. Each worker draws on one SweepFigure,
+    and is replaced after tasks_per_worker sweeps so its memory stays
+    bounded. With one worker, or one sweep, everything runs in this process.
+
+    Parameters
+    ----------
+    sweeps : Mapping[str, Any] | Sequence[Any]
+        Sweeps by name, or a sequence named after the file or by position.
+        Each is a Sark100Collector, a scan result, a DataFrame with the
+        collector columns, or a file Sark100Collector.load() reads
+    outdir : str
+        Directory for the images, written as <name>.<fmt>
+    fmt : str
+        "png" or "svg"
+    workers : Optional[int]
+        Worker processes, by default one per CPU
+    tasks_per_worker : Optional[int]
+        Sweeps a worker renders before it is replaced, None to keep it
+    start_method : Optional[str]
+        multiprocessing start method. Workers are spawned by default, as
+        Polars' thread pool does not survive a fork; None uses the platform's
+    plot_options
+        include_r, include_x, include_z, show_bands and downsample as for
+        Sark100Collector.plot
+
+    Returns
+    -------
+    List[str]
+        The files written, in the order of sweeps
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"fmt must be one of {', '.join(FORMATS)}")
+    if not hasattr(sweeps, "items"):
+        sweeps = {
+            os.path.splitext(os.path.basename(s.rstrip("/")))[0] if isinstance(s, str) else str(i): s
+            for i, s in enumerate(sweeps)
+        }
+    os.makedirs(outdir, exist_ok=True)
+    downsample = plot_options.get("downsample", DEFAULT_BUCKETS)
+    wanted = Sark100Collector._plotted(plot_options.get("include_r"), plot_options.get("include_x"),
+                                       plot_options.get("include_z"))
+    columns = [Sark100Collector.value_columns.index(c) for c in wanted]
+
+    tasks = []
+    for name, source in sweeps.items():
+        if not isinstance(source, str):
+            freq, values = _arrays(source)
+            if downsample and len(freq):
+                keep = minmax_indices(freq, [values[:, i] for i in columns], downsample)
+                freq, values = freq[keep], values[keep]
+            source = (freq, np.ascontiguousarray(values))
+        filename = os.path.join(outdir, f"{name}.{fmt}")
+        tasks.append((source, filename, f"SARK100 Measurement - {name}", plot_options))
+
+    figure_options = {"figsize": figsize, "dpi": dpi}
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = min(workers, len(tasks))
+    if workers <= 1:
+        _init_worker(figure_options)
+        try:
+            return [_render_task(task) for task in tasks]
+        finally:
+            _init_worker({})
+
+    context = multiprocessing.get_context(start_method)
+    with context.Pool(workers, initializer=_init_worker, initargs=(figure_options,),
+                      maxtasksperchild=tasks_per_worker) as pool:
+        return pool.map(_render_task, tasks, chunksize=1)
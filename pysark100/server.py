@@ -0,0 +1,690 @@
+"""
+Shared-device analyzer server.
+One process owns the SARK100 and runs the sweeps its clients ask for one at
+a time, highest priority first, streaming each sweep's measurements to every
+client waiting on it as they arrive. Clients talk HTTP over TCP or a Unix
+socket; sark100Client mirrors sark100.scan / scan_band.
+"""
+import heapq
+import http.client
+import json
+import os
+import socket
+import socketserver
+import stat
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+import numpy as np
+from pysark100.collector import CollectorResult, Sark100Collector
+from pysark100.bands import generate_band_frequencies
+from pysark100.stats import ScanStats
+
+DEFAULT_ADDRESS = ("127.0.0.1", 8100)
+DUPLICATE_POLICIES = ("merge", "reject")
+FINISHED = ("done", "failed", "cancelled")
+# Rows sent per line of a data stream
+STREAM_ROWS = 8192
+# Seconds between checks of a running sweep for new rows to stream
+POLL_INTERVAL = 0.05
+# Seconds without new rows after which a blank keep-alive line is sent
+KEEPALIVE = 10.0
+
+
+class ScanConflict(ValueError):
+    """
+    A scan request clashing with the queue: a duplicate of a sweep already
+    queued or running when duplicates are rejected, or a cancel of a sweep
+    which has already started.
+    """
+
+
+class QueueFull(RuntimeError):
+    """
+    The server already holds its maximum number of queued sweeps.
+    """
+
+
+class ScanJob:
+    """
+    One sweep requested from an AnalyzerServer.
+
+    `state` moves from "queued" to "running" and then to "done", or to
+    "failed" (with `error` set) when the device reports an Error, times out
+    or the port fails; queued jobs may be "cancelled". The sweep is read
+    into `data` a block at a time, and clients read the rows below its
+    length from the buffers while it grows, as the live plot does, so any
+    number of them can follow the sweep without slowing it down. State
+    changes wake them through `changed`.
+    """
+    def __init__(self, start, end, step, priority, seq):
+        self.id = uuid.uuid4().hex[:12]
+        self.start = start
+        self.end = end
+        self.step = step
+        self.priority = priority
+        self.seq = seq
+        self.state = "queued"
+        self.error = None
+        self.total = (end - start) // step + 1
+        # Replaced by the sweep's own collector when it starts
+        self.data = Sark100Collector()
+        # Clients streaming the data and requests merged into this job
+        self.clients = 0
+        self.requests = 1
+        self.submitted = datetime.now(timezone.utc)
+        self.started = None
+        self.finished = None
+        self.changed = threading.Condition()
+
+    @property
+    def key(self):
+        return self.start, self.end, self.step
+
+    @property
+    def done(self):
+        return self.state in FINISHED
+
+    def _update(self, **fields):
+        # Change the job and wake everyone waiting on it
+        with self.changed:
+            for name, value in fields.items():
+                setattr(self, name, value)
+            self.changed.notify_all()
+
+    def rows(self, offset, limit=STREAM_ROWS, timeout=POLL_INTERVAL):
+        """
+        Return copies of (freq, values) from row offset, at most limit rows,
+        waiting up to timeout seconds or until the job changes state if
+        there are none yet. Both are empty when nothing new arrived.
+        """
+        with self.changed:
+            if len(self.data) <= offset and not self.done:
+                self.changed.wait(timeout)
+            data = self.data
+        freq, values, n = data.buffers()
+        end = min(n, offset + limit)
+        return freq[offset:end].copy(), values[offset:end].copy()
+
+    def status(self):
+        """
+        The job as a JSON-serialisable dict.
+        """
+        def stamp(value):
+            return None if value is None else value.isoformat()
+
+        return {
+            "id": self.id,
+            "start": self.start,
+            "end": self.end,
+            "step": self.step,
+            "priority": self.priority,
+            "state": self.state,
+            "points": len(self.data),
+            "total": self.total,
+            "clients": self.clients,
+            "requests": self.requests,
+            "error": self.error,
+            "submitted": stamp(self.submitted),
+            "started": stamp(self.started),
+            "finished": stamp(self.finished),
+        }
+
+
+class AnalyzerServer:
+    """
+    Owns one SARK100 and shares it between clients.
+
+    Sweeps are queued by submit() and run one at a time on a worker thread,
+    highest `priority` first and in order of submission within a priority,
+    so the port is only ever used by one sweep. A request for the same
+    start, end and step as a sweep already queued or running is merged into
+    it, raising its priority if the new request's is higher, and every
+    client receives the whole sweep; with on_duplicate="reject" it raises
+    ScanConflict instead. The last `keep` finished jobs stay readable.
+
+    The HTTP API, served over TCP for an (host, port) address or over a
+    Unix socket for a path:
+
+        POST   /scans             {"start", "end", "step", "priority"}, returns the job
+        GET    /scans             every queued, running and kept job
+        GET    /scans/<id>        one job
+        GET    /scans/<id>/data   the measurements as newline-delimited JSON
+        DELETE /scans/<id>        cancel a queued job
+        GET    /status            the device, running job and queue length
+        GET    /metrics           the device's ScanStats in the OpenMetrics format
+
+    A data stream starts and ends with a {"job": {...}} line; the lines in
+    between hold batches of rows as {"freq": [...], "swr": [...], "r": [...],
+    "x": [...], "z": [...]}, and blank lines keep the connection alive while
+    no rows arrive, e.g. while the job waits in the queue.
+
+    Parameters
+    ----------
+    port : str | sark100
+        Anything sark100(port=...) accepts, or an open sark100
+    address : Tuple[str, int] | str
+        (host, port) to listen on, port 0 for any free port, or a Unix socket path
+    on_duplicate : str
+        "merge" or "reject"
+    max_queue : int
+        Largest number of queued jobs, further submissions raise QueueFull
+    keep : int
+        Finished jobs kept for late readers
+    """
+    def __init__(self, port="/dev/ttyUSB0", address=DEFAULT_ADDRESS, on_duplicate="merge", max_queue=64, keep=32,
+                 verbose=False):
+        from pysark100 import sark100
+
+        if on_duplicate not in DUPLICATE_POLICIES:
+            raise ValueError(f"on_duplicate must be one of {', '.join(DUPLICATE_POLICIES)}")
+        self.analyzer = port if isinstance(port, sark100) else sark100(port=port)
+        self.on_duplicate = on_duplicate
+        self.max_queue = max_queue
+        self.verbose = verbose
+        self.running = None
+        self._cond = threading.Condition()
+        self._heap = []
+        self._seq = 0
+        self._queued = 0
+        self._jobs = {}
+        # Queued and running jobs by (start, end, step), for merging duplicates
+        self._active = {}
+        self._kept = deque()
+        self._keep = keep
+        self._closed = False
+
+        if isinstance(address, str):
+            if os.path.exists(address) and stat.S_ISSOCK(os.stat(address).st_mode):
+                # Left behind by a server which did not shut down cleanly
+                os.unlink(address)
+            self.httpd = _UnixHTTPServer(address, _Handler)
+            self.url = f"unix://{address}"
+        else:
+            self.httpd = _TCPHTTPServer(address, _Handler)
+            host, bound = self.httpd.server_address[:2]
+            self.url = f"http://{host}:{bound}"
+        self.httpd.analyzer_server = self
+        self._worker = threading.Thread(target=self._work, name="sark100-server-worker", daemon=True)
+        self._http_thread = None
+
+    def submit(self, start, end, step=1000, priority=0):
+        """
+        Queue a sweep of start..end (Hz) in steps of step Hz, or merge the
+        request into an identical sweep already queued or running.
+        Returns the ScanJob.
+        """
+        start, end, step, priority = int(start), int(end), int(step), int(priority)
+        if step <= 0 or end < start:
+            raise ValueError("A scan needs step > 0 and end >= start")
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("The server is closed")
+            job = self._active.get((start, end, step))
+            if job is not None:
+                if self.on_duplicate == "reject":
+                    raise ScanConflict(f"Scan {start}-{end} step {step} is already {job.state} as job {job.id}")
+                job.requests += 1
+                if job.state == "queued" and priority > job.priority:
+                    # The old heap entry is skipped when it comes up
+                    job.priority = priority
+                    heapq.heappush(self._heap, (-priority, job.seq, job))
+                return job
+            if self._queued >= self.max_queue:
+                raise QueueFull(f"{self._queued} scans are already queued")
+            self._seq += 1
+            job = ScanJob(start, end, step, priority, self._seq)
+            self._jobs[job.id] = job
+            self._active[job.key] = job
+            heapq.heappush(self._heap, (-priority, job.seq, job))
+            self._queued += 1
+            self._cond.notify_all()
+            return job
+
+    def job(self, job_id):
+        """
+        The queued, running or kept job with this id, KeyError if there is none.
+        """
+        with self._cond:
+            try:
+                return self._jobs[job_id]
+            except KeyError:
+                raise KeyError(f"No scan job '{job_id}'") from None
+
+    def jobs(self):
+        """
+        Every queued, running and kept job, in order of submission.
+        """
+        with self._cond:
+            return sorted(self._jobs.values(), key=lambda job: job.seq)
+
+    def queue(self):
+        """
+        The queued jobs in the order they will run.
+        """
+        with self._cond:
+            queued = [job for job in self._jobs.values() if job.state == "queued"]
+        return sorted(queued, key=lambda job: (-job.priority, job.seq))
+
+    def cancel(self, job_id):
+        """
+        Cancel a queued job. Running and finished jobs raise ScanConflict.
+        """
+        with self._cond:
+            job = self.job(job_id)
+            if job.state != "queued":
+                raise ScanConflict(f"Job {job_id} is {job.state}, only queued scans can be cancelled")
+            self._retire(job)
+        job._update(state="cancelled", finished=datetime.now(timezone.utc))
+        return job
+
+    def _retire(self, job):
+        # Take a job out of the queue and the duplicates, keeping it readable for a while
+        if job.state == "queued":
+            self._queued -= 1
+        self._active.pop(job.key, None)
+        self._kept.append(job.id)
+        while len(self._kept) > self._keep:
+            self._jobs.pop(self._kept.popleft(), None)
+
+    def _next(self):
+        # The highest priority queued job, None once the server closes
+        with self._cond:
+            while True:
+                if self._closed:
+                    return None
+                while self._heap:
+                    priority, _, job = heapq.heappop(self._heap)
+                    if job.state == "queued" and -priority == job.priority:
+                        self._queued -= 1
+                        self.running = job
+                        return job
+                self._cond.wait()
+
+    def _work(self):
+        from pysark100 import sark100Scan
+
+        while True:
+            job = self._next()
+            if job is None:
+                return
+            error = None
+            try:
+                scan = sark100Scan(self.analyzer, job.start, job.end, job.step, progress=False)
+                job._update(state="running", started=datetime.now(timezone.utc), data=scan.data)
+                scan._ensure_full()
+                error = scan.error
+            except OSError as e:
+                error = f"{type(e).__name__}: {e}"
+                try:
+                    self.analyzer.reconnect()
+                except OSError:
+                    # Tried again before the next sweep
+                    pass
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+            with self._cond:
+                self.running = None
+                self._retire(job)
+            job._update(state="failed" if error else "done", error=error, finished=datetime.now(timezone.utc))
+
+    def status(self):
+        """
+        The device, the running job and the number of queued jobs.
+        """
+        running = self.running
+        return {
+            "device": str(self.analyzer.port),
+            "running": None if running is None else running.status(),
+            "queued": self._queued,
+            "on_duplicate": self.on_duplicate,
+        }
+
+    def start(self):
+        """
+        Start the worker and serve requests on a background thread.
+        Returns the server.
+        """
+        self._worker.start()
+        self._http_thread = threading.Thread(target=self.httpd.serve_forever, name="sark100-server-http",
+                                             daemon=True)
+        self._http_thread.start()
+        return self
+
+    def serve_forever(self):
+        """
+        Start the worker and serve requests until interrupted.
+        """
+        self._worker.start()
+        try:
+            self.httpd.serve_forever()
+        finally:
+            self.close()
+
+    def close(self):
+        """
+        Stop serving, cancel the queued jobs and close the device once any
+        running sweep has finished.
+        """
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            queued = [job for job in self._jobs.values() if job.state == "queued"]
+            for job in queued:
+                self._retire(job)
+            self._cond.notify_all()
+        for job in queued:
+            job._update(state="cancelled", finished=datetime.now(timezone.utc))
+        if self._http_thread is not None:
+            self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._worker.is_alive():
+            self._worker.join()
+        if isinstance(self.httpd, _UnixHTTPServer):
+            try:
+                os.unlink(self.httpd.server_address)
+            except OSError:
+                pass
+        self.analyzer.device.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class _TCPHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "pysark100"
+
+    @property
+    def service(self):
+        return self.server.analyzer_server
+
+    def address_string(self):
+        # Unix socket clients have no address
+        return self.client_address[0] if isinstance(self.client_address, tuple) else "unix"
+
+    def log_message(self, format, *args):
+        if self.service.verbose:
+            super().log_message(format, *args)
+
+    def _send(self, code, body, content_type="application/json"):
+        data = body.encode() if isinstance(body, str) else json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _route(self, method):
+        parts = [p for p in urlparse(self.path).path.split("/") if p]
+        try:
+            if method == "GET" and parts == ["status"]:
+                return self._send(200, self.service.status())
+            if method == "GET" and parts == ["metrics"]:
+                text = self.service.analyzer.stats.openmetrics(labels={"device": str(self.service.analyzer.port)})
+                return self._send(200, text, "application/openmetrics-text; version=1.0.0; charset=utf-8")
+            if parts[:1] == ["scans"]:
+                if method == "POST" and len(parts) == 1:
+                    length = int(self.headers.get("Content-Length") or 0)
+                    request = json.loads(self.rfile.read(length) or b"{}")
+                    job = self.service.submit(request["start"], request["end"], request.get("step", 1000),
+                                              request.get("priority", 0))
+                    return self._send(202, job.status())
+                if method == "GET" and len(parts) == 1:
+                    return self._send(200, [job.status() for job in self.service.jobs()])
+                if method == "GET" and len(parts) == 2:
+                    return self._send(200, self.service.job(parts[1]).status())
+                if method == "GET" and parts[2:] == ["data"]:
+                    return self._stream(self.service.job(parts[1]))
+                if method == "DELETE" and len(parts) == 2:
+                    return self._send(200, self.service.cancel(parts[1]).status())
+            self._send(404, {"error": f"No route for {method} {self.path}"})
+        except KeyError as e:
+            code = 400 if method == "POST" else 404
+            self._send(code, {"error": f"Missing field {e}" if code == 400 else e.args[0]})
+        except ScanConflict as e:
+            self._send(409, {"error": str(e)})
+        except QueueFull as e:
+            self._send(503, {"error": str(e)})
+        except (ValueError, TypeError) as e:
+            self._send(400, {"error": str(e)})
+
+    def _line(self, event):
+        self.wfile.write(json.dumps(event).encode() + b"\n")
+        self.wfile.flush()
+
+    def _stream(self, job):
+        # Send the rows as they arrive until the job finishes; the connection closes at the end
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+        with job.changed:
+            job.clients += 1
+        try:
+            self._line({"job": job.status()})
+            offset = 0
+            sent = time.monotonic()
+            while True:
+                done = job.done
+                freq, values = job.rows(offset)
+                if len(freq):
+                    batch = {"freq": freq.tolist()}
+                    for i, name in enumerate(Sark100Collector.value_columns):
+                        batch[name] = values[:, i].tolist()
+                    self._line(batch)
+                    offset += len(freq)
+                    sent = time.monotonic()
+                elif done:
+                    break
+                elif time.monotonic() - sent > KEEPALIVE:
+                    self.wfile.write(b"\n")
+                    self.wfile.flush()
+                    sent = time.monotonic()
+            self._line({"job": job.status()})
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            with job.changed:
+                job.clients -= 1
+
+    def do_GET(self):
+        self._route("GET")
+
+    def do_POST(self):
+        self._route("POST")
+
+    def do_DELETE(self):
+        self._route("DELETE")
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path, timeout):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+class sark100RemoteScan(CollectorResult):
+    """
+    A sweep run by an AnalyzerServer. The request is queued when the scan
+    is created; iterating yields each measurement as a dict with freq, swr,
+    r, x and z as the server streams it, and the measurements are added to
+    `data` like those of a sark100Scan. `job` holds the server's job status
+    and `error` the reason a sweep failed or was cancelled.
+    """
+    def __init__(self, client, start, end, step=1000, priority=0, progress=False):
+        self.client = client
+        self.stats = client.stats
+        self.stats.count("scans")
+        self.start = start
+        self.end = end
+        self.step = step
+        self.progress = progress
+        self.job = client._call("POST", "/scans", {"start": start, "end": end, "step": step, "priority": priority})
+        self.data = Sark100Collector(capacity=self.job["total"] + 1, stats=self.stats)
+        self.error = None
+        self.finished = False
+        self._batches = self._stream()
+
+    def _stream(self):
+        # Read the job's data stream, adding each batch to self.data as it arrives
+        stats = self.stats
+        bar = None
+        if self.progress:
+            from tqdm import tqdm
+            bar = tqdm(total=self.job["total"])
+        connection, response = self.client._open("GET", f"/scans/{self.job['id']}/data")
+        try:
+            while True:
+                started = time.perf_counter()
+                line = response.readline()
+                stats.add("device", time.perf_counter() - started)
+                if not line:
+                    break
+                stats.count("bytes", len(line))
+                stats.count("reads")
+                if not line.strip():
+                    continue
+                with stats.timer("parse", "parse"):
+                    event = json.loads(line)
+                if "job" in event:
+                    self.job = event["job"]
+                    continue
+                freqs = np.asarray(event["freq"], dtype=np.int64)
+                values = np.column_stack([event[name] for name in Sark100Collector.value_columns])
+                self.data.add_values(freqs, values)
+                stats.count("samples", len(freqs))
+                if bar is not None:
+                    bar.update(len(freqs))
+                yield freqs, values
+        finally:
+            response.close()
+            connection.close()
+            if bar is not None:
+                bar.close()
+        self.finished = True
+        if self.job["state"] != "done":
+            self.error = self.job["error"] or f"Scan {self.job['state']}"
+            self.stats.count("errors")
+            print(self.error)
+
+    def _ensure_full(self):
+        for _ in self._batches:
+            pass
+
+    def __iter__(self):
+        columns = Sark100Collector.value_columns
+        for freqs, values in self._batches:
+            for freq, row in zip(freqs.tolist(), values.tolist()):
+                yield {"freq": freq, **dict(zip(columns, row))}
+
+
+class sark100Client:
+    """
+    Client of an AnalyzerServer with the scan API of sark100.
+
+    url is the server's http://host:port or unix:///path/to/socket. Sweeps
+    are run by the server, so they queue behind other clients' sweeps
+    rather than clashing with them on the port. `stats` counts the scans,
+    samples and bytes received, with the time spent waiting for the server
+    in the device phase and decoding its batches in the parse phase.
+    """
+    def __init__(self, url="http://127.0.0.1:8100", timeout=60.0):
+        self.url = url
+        self.timeout = timeout
+        parsed = urlparse(url)
+        if parsed.scheme == "unix":
+            self._connect = lambda: _UnixHTTPConnection(parsed.path, timeout)
+        elif parsed.scheme == "http":
+            self._connect = lambda: http.client.HTTPConnection(parsed.hostname, parsed.port or 80, timeout=timeout)
+        else:
+            raise ValueError(f"Unsupported server URL '{url}', use http://host:port or unix:///path")
+        self.stats = ScanStats()
+
+    def _open(self, method, path, body=None):
+        # Send a request and return the connection and response, raising for error statuses
+        connection = self._connect()
+        try:
+            data = None if body is None else json.dumps(body).encode()
+            headers = {} if data is None else {"Content-Type": "application/json"}
+            connection.request(method, path, body=data, headers=headers)
+            response = connection.getresponse()
+        except BaseException:
+            connection.close()
+            raise
+        if response.status >= 400:
+            try:
+                message = json.loads(response.read()).get("error", response.reason)
+            except ValueError:
+                message = response.reason
+            finally:
+                connection.close()
+            exception = {400: ValueError, 404: KeyError, 409: ScanConflict, 503: QueueFull}.get(response.status,
+                                                                                                ConnectionError)
+            raise exception(message)
+        return connection, response
+
+    def _call(self, method, path, body=None, text=False):
+        connection, response = self._open(method, path, body)
+        try:
+            data = response.read()
+        finally:
+            connection.close()
+        return data.decode() if text else json.loads(data)
+
+    def scan(self, start, end, step=1000, priority=0, progress=False):
+        """
+        Queue a sweep from start to end (Hz) in steps of step Hz on the
+        server. Sweeps with a higher priority run first.
+        """
+        total = (end - start) // step + 1
+        print(f"Getting data between {start} and {end} with a step of {step} for a total of {total} data points "
+              f"from {self.url}.")
+        return sark100RemoteScan(self, start, end, step, priority=priority, progress=progress)
+
+    def scan_band(self, band, buffer_pct=0.15, step=1000, priority=0, progress=False):
+        freq_list = generate_band_frequencies(band, buffer_pct=buffer_pct, step_hz=step)
+        return self.scan(freq_list[0], freq_list[-1], step, priority=priority, progress=progress)
+
+    def jobs(self):
+        """
+        The status of every job the server holds.
+        """
+        return self._call("GET", "/scans")
+
+    def job(self, job_id):
+        return self._call("GET", f"/scans/{job_id}")
+
+    def cancel(self, job_id):
+        """
+        Cancel a queued job.
+        """
+        return self._call("DELETE", f"/scans/{job_id}")
+
+    def status(self):
+        return self._call("GET", "/status")
+
+    def metrics(self):
+        """
+        The server device's ScanStats in the OpenMetrics text format.
+        """
+        return self._call("GET", "/metrics", text=True)
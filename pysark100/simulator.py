@@ -0,0 +1,210 @@
+"""
+Simulated SARK100 device.
+Speaks the same serial protocol as the analyzer so scans can be tested and
+benchmarked without hardware attached.
+"""
+import math
+import random
+import time
+from collections import deque
+from urllib.parse import urlparse, parse_qsl
+
+
+class SimulatedSark100:
+    """
+    A serial.Serial look-alike which answers `scan <start> <end> <step>`
+    commands with the same Start / data / End / Error lines as a SARK100.
+
+    The antenna is modelled as a series RLC circuit resonant at `resonance` Hz
+    with radiation resistance `resistance` and quality factor `q`. Each data
+    point becomes available `latency` seconds after the previous one, and
+    gaussian noise with a standard deviation of `noise` Ohms is added to R and X.
+
+    Faults can be injected for testing recovery: before each data point a
+    sweep is aborted with an Error line with probability `error_rate`, or
+    stops sending altogether, as if the USB link dropped, with probability
+    `stall_rate`.
+    """
+    min_freq = 1000000
+    max_freq = 60000000
+    # Options accepted in a sim:// URL query string and how to convert them
+    url_options = {
+        "resonance": float,
+        "resistance": float,
+        "q": float,
+        "z0": float,
+        "latency": float,
+        "noise": float,
+        "seed": int,
+        "timeout": float,
+        "error_rate": float,
+        "stall_rate": float,
+    }
+
+    def __init__(self, resonance=14200000, resistance=50.0, q=10.0, z0=50.0,
+                 latency=0.0, noise=0.0, seed=None, timeout=5, error_rate=0.0, stall_rate=0.0):
+        self.resonance = float(resonance)
+        self.resistance = float(resistance)
+        self.q = float(q)
+        self.z0 = float(z0)
+        self.latency = float(latency)
+        self.noise = float(noise)
+        self.timeout = timeout
+        self.error_rate = float(error_rate)
+        self.stall_rate = float(stall_rate)
+        self.is_open = True
+        self.commands = []
+        self._random = random.Random(seed)
+        self._buffer = bytearray()
+        self._lines = deque()
+        self._ready_at = time.monotonic()
+
+    @classmethod
+    def from_url(cls, url):
+        """
+        Build a simulator from a URL such as
+        ``sim://?resonance=7100000&latency=0.001&noise=0.5&seed=1``.
+        """
+        parsed = urlparse(url)
+        if parsed.scheme != "sim":
+            raise ValueError(f"Not a simulator URL: {url}")
+        options = {}
+        for key, value in parse_qsl(parsed.query):
+            if key not in cls.url_options:
+                raise ValueError(f"Unknown simulator option '{key}' in {url}")
+            try:
+                options[key] = cls.url_options[key](value)
+            except ValueError:
+                raise ValueError(f"Invalid value '{value}' for simulator option '{key}' in {url}")
+        return cls(**options)
+
+    def measure(self, freq):
+        """
+        Return the (swr, r, x, z) tuple the modelled antenna shows at `freq` Hz.
+        """
+        r = self.resistance
+        x = self.q * self.resistance * (freq / self.resonance - self.resonance / freq)
+        if self.noise:
+            r = max(0.0, r + self._random.gauss(0.0, self.noise))
+            x += self._random.gauss(0.0, self.noise)
+        z = math.hypot(r, x)
+        gamma = abs(complex(r - self.z0, x) / complex(r + self.z0, x))
+        swr = (1 + gamma) / (1 - gamma) if gamma < 1 else float("inf")
+        return swr, r, x, z
+
+    def _scan_lines(self, start, end, step):
+        # Yields (delay, line) pairs, the delay modelling the time to measure each point
+        yield 0.0, b"Start\r\n"
+        freq = start
+        while freq <= end:
+            if self.error_rate and self._random.random() < self.error_rate:
+                yield self.latency, b"Error: measurement failed\r\n"
+                yield 0.0, b">>\r\n"
+                return
+            if self.stall_rate and self._random.random() < self.stall_rate:
+                return
+            swr, r, x, z = self.measure(freq)
+            yield self.latency, f"{swr:.2f},{r:.2f},{x:.2f},{z:.2f}\r\n".encode()
+            freq += step
+        yield 0.0, b"End\r\n"
+        yield 0.0, b">>\r\n"
+
+    def _command(self, command):
+        parts = command.split()
+        if not parts:
+            return
+        self.commands.append(command)
+        if parts[0] != "scan":
+            self._lines.append(iter([(0.0, b"Error: unknown command\r\n"), (0.0, b">>\r\n")]))
+            return
+        try:
+            start, end, step = (int(p) for p in parts[1:])
+        except ValueError:
+            start = end = step = None
+        valid = start is not None and 0 < step and start <= end
+        if not valid or start < self.min_freq or end > self.max_freq:
+            self._lines.append(iter([(0.0, b"Error: parameter error\r\n"), (0.0, b">>\r\n")]))
+            return
+        self._lines.append(self._scan_lines(start, end, step))
+
+    def write(self, data):
+        if not self._lines:
+            self._ready_at = max(self._ready_at, time.monotonic())
+        for command in data.decode("utf-8").replace("\r", "\n").split("\n"):
+            self._command(command.strip())
+        return len(data)
+
+    def _fill(self, block, deadline=None, chunk=65536):
+        """
+        Move lines which the modelled device has finished measuring into the
+        input buffer. When `block` is set, wait for at least one line unless
+        `deadline` passes first.
+        """
+        now = time.monotonic()
+        produced = False
+        while self._lines and len(self._buffer) < chunk:
+            try:
+                delay, line = next(self._lines[0])
+            except StopIteration:
+                self._lines.popleft()
+                continue
+            ready = self._ready_at + delay
+            if ready > now:
+                if produced or not block:
+                    # Not measured yet, hold it until the next read
+                    self._lines.appendleft(iter([(delay, line)]))
+                    break
+                if deadline is not None and ready > deadline:
+                    time.sleep(max(0.0, deadline - now))
+                    self._lines.appendleft(iter([(ready - deadline, line)]))
+                    self._ready_at = deadline
+                    break
+                time.sleep(ready - now)
+                now = time.monotonic()
+            self._ready_at = ready
+            self._buffer += line
+            produced = True
+
+    def _deadline(self):
+        if self.timeout is None:
+            return None
+        return time.monotonic() + self.timeout
+
+    @property
+    def in_waiting(self):
+        self._fill(block=False)
+        return len(self._buffer)
+
+    def readline(self):
+        deadline = self._deadline()
+        while b"\n" not in self._buffer:
+            if not self._lines:
+                # Nothing more will arrive, wait out the timeout like a serial port would
+                if deadline is not None:
+                    time.sleep(max(0.0, deadline - time.monotonic()))
+                break
+            self._fill(block=True, deadline=deadline)
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+        end = self._buffer.find(b"\n") + 1 or len(self._buffer)
+        line = bytes(self._buffer[:end])
+        del self._buffer[:end]
+        return line
+
+    def read(self, size=1):
+        if not self._buffer:
+            if self.timeout == 0:
+                self._fill(block=False)
+            elif self._lines:
+                self._fill(block=True, deadline=self._deadline())
+            elif self.timeout is not None:
+                time.sleep(self.timeout)
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    def reset_input_buffer(self):
+        self._buffer.clear()
+
+    def close(self):
+        self.is_open = False
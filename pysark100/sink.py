@@ -0,0 +1,134 @@
+"""
+Streaming sinks for sweep measurements.
+A collector with a sink writes each full batch of measurements straight to
+disk, keeping memory bounded and leaving a readable file if a sweep is
+interrupted.
+"""
+import glob
+import os
+import polars as pl
+
+
+class SweepSink:
+    """
+    Base class for sinks. write() receives successive DataFrame batches with
+    the collector columns; read() returns everything written so far.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.batches = 0
+        self.rows = 0
+
+    def write(self, df):
+        self._write(df)
+        self.batches += 1
+        self.rows += len(df)
+
+    def _write(self, df):
+        raise NotImplementedError
+
+    def scan(self):
+        raise NotImplementedError
+
+    def read(self):
+        return self.scan().collect()
+
+    def close(self):
+        pass
+
+
+class CsvSink(SweepSink):
+    """
+    Appends batches to a single CSV file, flushed to disk after every batch.
+    """
+    def __init__(self, path):
+        super().__init__(path)
+        self._fh = open(path, "w", encoding="utf-8", newline="")
+
+    def _write(self, df):
+        df.write_csv(self._fh, include_header=self.batches == 0)
+        self._fh.flush()
+        os.fsync(self._fh.fileno())
+
+    def scan(self):
+        from pysark100.collector import Sark100Collector
+        if self.rows == 0:
+            return pl.LazyFrame(schema=dict(Sark100Collector.columns))
+        return pl.scan_csv(self.path, schema=dict(Sark100Collector.columns))
+
+    def close(self):
+        if not self._fh.closed:
+            self._fh.close()
+
+
+class PartsSink(SweepSink):
+    """
+    Writes each batch as its own file, part-000000.<ext>, in the directory
+    `path`. Parquet and Arrow files are only readable once complete, so each
+    part is written under a temporary name and renamed into place; an
+    interrupted sweep leaves every finished batch readable.
+    """
+    extension = None
+
+    def __init__(self, path):
+        super().__init__(path)
+        os.makedirs(path, exist_ok=True)
+        for old in glob.glob(os.path.join(path, f"part-*.{self.extension}")):
+            os.remove(old)
+
+    def _write(self, df):
+        final = os.path.join(self.path, f"part-{self.batches:06d}.{self.extension}")
+        tmp = final + ".tmp"
+        self._write_file(df, tmp)
+        os.replace(tmp, final)
+
+    def _write_file(self, df, filename):
+        raise NotImplementedError
+
+    def _pattern(self):
+        return os.path.join(self.path, f"part-*.{self.extension}")
+
+
+class ParquetSink(PartsSink):
+    extension = "parquet"
+
+    def _write_file(self, df, filename):
+        df.write_parquet(filename)
+
+    def scan(self):
+        from pysark100.collector import Sark100Collector
+        if self.rows == 0:
+            return pl.LazyFrame(schema=dict(Sark100Collector.columns))
+        return pl.scan_parquet(self._pattern())
+
+
+class IpcSink(PartsSink):
+    extension = "arrow"
+
+    def _write_file(self, df, filename):
+        df.write_ipc(filename)
+
+    def scan(self):
+        from pysark100.collector import Sark100Collector
+        if self.rows == 0:
+            return pl.LazyFrame(schema=dict(Sark100Collector.columns))
+        return pl.scan_ipc(self._pattern())
+
+
+def open_sink(path):
+    """
+    Open a sink for `path`, chosen by its extension: .csv writes one CSV file,
+    .parquet a directory of Parquet parts and .arrow / .ipc / .feather a
+    directory of Arrow IPC parts. An existing SweepSink is returned as is.
+    """
+    if isinstance(path, SweepSink):
+        return path
+
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".csv":
+        return CsvSink(path)
+    if ext == ".parquet":
+        return ParquetSink(path)
+    if ext in (".arrow", ".ipc", ".feather"):
+        return IpcSink(path)
+    raise ValueError(f"Unsupported sink format '{ext}', use .csv, .parquet or .arrow")
@@ -0,0 +1,246 @@
+"""
+Performance counters for sweeps.
+A ScanStats collects where the time of a sweep goes (reading from the port,
+splitting lines, parsing, appending, writing to a sink and plotting), together with
+counters and latency histograms, and renders them as a text report or in the
+Prometheus / OpenMetrics text format.
+"""
+import time
+from array import array
+from bisect import bisect_left
+from contextlib import contextmanager
+from itertools import accumulate
+import numpy as np
+
+# Upper bounds in seconds of the latency histogram buckets, the last one is +Inf
+LATENCY_BUCKETS = (1e-6, 1e-5, 1e-4, 1e-3, 0.01, 0.1, 1.0, 10.0)
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram of durations in seconds, cumulative on output as
+    Prometheus expects.
+
+    Single observations are appended to a float array and sorted into the
+    buckets in bulk, which keeps observe() cheap enough to call per sample.
+    """
+    fold_every = 4096
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._counts = np.zeros(len(self.buckets) + 1, dtype=np.int64)
+        self._pending = array("d")
+        self._sum = 0.0
+        self._count = 0
+
+    def observe(self, value, count=1):
+        """
+        Record `count` observations of value.
+        """
+        if count == 1:
+            self._pending.append(value)
+            if len(self._pending) >= self.fold_every:
+                self._fold()
+        else:
+            self._counts[bisect_left(self.buckets, value)] += count
+            self._sum += value * count
+            self._count += count
+
+    def _fold(self):
+        if self._pending:
+            values = np.frombuffer(self._pending, dtype=np.float64)
+            self._counts += np.bincount(np.searchsorted(self.buckets, values), minlength=len(self._counts))
+            self._sum += float(values.sum())
+            self._count += len(values)
+            self._pending = array("d")
+
+    @property
+    def counts(self):
+        self._fold()
+        return self._counts.tolist()
+
+    @property
+    def sum(self):
+        self._fold()
+        return self._sum
+
+    @property
+    def count(self):
+        self._fold()
+        return self._count
+
+    def cumulative(self):
+        # (upper bound, observations at or below it) including +Inf
+        return list(zip(self.buckets + (float("inf"),), accumulate(self.counts)))
+
+    def quantile(self, q):
+        """
+        Upper bound of the bucket holding the q quantile, None when empty.
+        """
+        if not self.count:
+            return None
+        index = bisect_left(list(accumulate(self.counts)), q * self.count)
+        return (self.buckets + (float("inf"),))[index]
+
+
+class ScanStats:
+    """
+    Timings, counters and histograms of the sweeps run on one device.
+
+    `time` holds the seconds spent in each phase:
+
+    device
+        In reads from the port, mostly waiting for the analyzer to send
+    read
+        Buffering the received bytes and splitting them into lines
+    parse
+        Parsing "swr,r,x,z" lines
+    append
+        Appending measurements to the Sark100Collector
+    sink
+        Writing batches to a streaming sink
+    plot
+        Rendering plots
+
+    `counters` holds samples, bytes, reads, malformed lines, errors,
+    timeouts, retries, reconnects and the scans answered from, or missing,
+    a SweepCache. `histograms` holds the per-sample read
+    latency, the time parsing each block and the time of each append.
+    """
+    phases = ("device", "read", "parse", "append", "sink", "plot")
+    counter_names = ("scans", "samples", "bytes", "reads", "malformed", "errors", "timeouts", "retries",
+                     "reconnects", "cache_hits", "cache_misses")
+    histogram_names = ("sample_latency", "parse", "append")
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.time = dict.fromkeys(self.phases, 0.0)
+        self.counters = dict.fromkeys(self.counter_names, 0)
+        self.histograms = {name: Histogram() for name in self.histogram_names}
+        self.started = time.perf_counter()
+
+    def add(self, phase, seconds):
+        self.time[phase] += seconds
+
+    def count(self, name, n=1):
+        self.counters[name] += n
+
+    def observe(self, name, seconds, count=1):
+        self.histograms[name].observe(seconds, count)
+
+    @contextmanager
+    def timer(self, phase, histogram=None):
+        """
+        Add the time spent in the with block to phase, and to a histogram
+        when one is named.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.time[phase] += elapsed
+            if histogram is not None:
+                self.histograms[histogram].observe(elapsed)
+
+    @property
+    def bytes_per_second(self):
+        """
+        Bytes received per second spent waiting on and reading from the port.
+        """
+        seconds = self.time["device"] + self.time["read"]
+        return self.counters["bytes"] / seconds if seconds else 0.0
+
+    def as_dict(self):
+        """
+        The timings, counters and histogram summaries as plain values.
+        """
+        return {
+            "time": dict(self.time),
+            "counters": dict(self.counters),
+            "bytes_per_second": self.bytes_per_second,
+            "histograms": {
+                name: {"count": h.count, "sum": h.sum, "p50": h.quantile(0.5), "p99": h.quantile(0.99)}
+                for name, h in self.histograms.items()
+            },
+        }
+
+    def report(self, total=None):
+        """
+        A text breakdown of the time per phase. total is the wall time of the
+        run in seconds, by default the time since the stats were created or
+        reset; what is not in any phase is shown as other.
+        """
+        if total is None:
+            total = time.perf_counter() - self.started
+        rows = list(self.time.items())
+        rows.append(("other", max(total - sum(self.time.values()), 0.0)))
+        lines = [f"{'phase':<8} {'seconds':>10} {'share':>7}"]
+        for phase, seconds in rows:
+            share = seconds / total * 100 if total else 0.0
+            lines.append(f"{phase:<8} {seconds:>10.4f} {share:>6.1f}%")
+        lines.append(f"{'total':<8} {total:>10.4f}")
+        c = self.counters
+        lines.append(
+            f"{c['samples']} samples in {c['scans']} scans, {c['bytes']} bytes in {c['reads']} reads "
+            f"({self.bytes_per_second / 1000:.1f} kB/s), {c['malformed']} malformed, {c['errors']} errors, "
+            f"{c['timeouts']} timeouts, {c['retries']} retries"
+        )
+        if c["cache_hits"] or c["cache_misses"]:
+            lines.append(f"cache: {c['cache_hits']} hits, {c['cache_misses']} misses")
+        latency = self.histograms["sample_latency"]
+        if latency.count:
+            lines.append(f"read latency per sample: mean {latency.sum / latency.count * 1e6:.1f} us, "
+                         f"p99 <= {latency.quantile(0.99) * 1e6:g} us")
+        return "\n".join(lines)
+
+    def openmetrics(self, prefix="sark100", labels=None):
+        """
+        The stats in the OpenMetrics text format, which Prometheus also
+        reads, e.g. for a node_exporter textfile collector.
+
+        Parameters
+        ----------
+        prefix : str
+            Prefix of every metric name
+        labels : Optional[Dict[str, str]]
+            Labels added to every sample, e.g. {"device": "/dev/ttyUSB0"}
+        """
+        def fmt(extra=None):
+            pairs = {**(labels or {}), **(extra or {})}
+            if not pairs:
+                return ""
+            quoted = (str(v).replace("\\", "\\\\").replace('"', '\\"') for v in pairs.values())
+            return "{" + ",".join(f'{k}="{v}"' for k, v in zip(pairs, quoted)) + "}"
+
+        lines = [
+            f"# TYPE {prefix}_phase_seconds counter",
+            f"# UNIT {prefix}_phase_seconds seconds",
+            f"# HELP {prefix}_phase_seconds Time spent in each phase of the sweeps.",
+        ]
+        lines += [f"{prefix}_phase_seconds_total{fmt({'phase': p})} {s!r}" for p, s in self.time.items()]
+        for name, value in self.counters.items():
+            lines += [f"# TYPE {prefix}_{name} counter", f"{prefix}_{name}_total{fmt()} {value}"]
+        for name, h in self.histograms.items():
+            metric = f"{prefix}_{name}_seconds"
+            lines += [f"# TYPE {metric} histogram", f"# UNIT {metric} seconds"]
+            for bound, count in h.cumulative():
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{metric}_bucket{fmt({'le': le})} {count}")
+            lines += [f"{metric}_sum{fmt()} {h.sum!r}", f"{metric}_count{fmt()} {h.count}"]
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+
+@contextmanager
+def timed(stats, phase):
+    """
+    stats.timer(phase), or nothing when stats is None.
+    """
+    if stats is None:
+        yield
+    else:
+        with stats.timer(phase):
+            yield
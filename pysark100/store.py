@@ -0,0 +1,190 @@
+"""
+Persistent on-disk storage of sweeps.
+Each sweep is written to its own Parquet file and described by a row in a
+Parquet index, so queries only open the sweeps and row groups they need.
+"""
+import glob
+import os
+import uuid
+from datetime import datetime, timezone
+import polars as pl
+from pysark100.collector import Sark100Collector
+
+
+class SweepStore:
+    """
+    A directory of sweeps:
+
+        <root>/index/<id>.parquet     one row of metadata for one sweep
+        <root>/sweeps/<id>.parquet    the measurements of one sweep
+
+    Saving a sweep adds its own index file and never rewrites the others;
+    the index is read by scanning them all lazily. Sweep files are sorted by frequency and written in row groups of
+    row_group_size rows, so frequency filters are pushed down to the row
+    group statistics by Polars' scan_parquet.
+    """
+    index_schema = {
+        "sweep_id": pl.Utf8,
+        "path": pl.Utf8,
+        "timestamp": pl.Datetime("us", "UTC"),
+        "device": pl.Utf8,
+        "antenna": pl.Utf8,
+        "band": pl.Utf8,
+        "start": pl.Int64,
+        "end": pl.Int64,
+        "step": pl.Int64,
+        "points": pl.Int64,
+    }
+
+    def __init__(self, root, row_group_size=65536):
+        self.root = root
+        self.row_group_size = row_group_size
+        self.index_dir = os.path.join(root, "index")
+        self.index_pattern = os.path.join(self.index_dir, "*.parquet")
+        os.makedirs(os.path.join(root, "sweeps"), exist_ok=True)
+        os.makedirs(self.index_dir, exist_ok=True)
+
+    @staticmethod
+    def _frame(data):
+        # Accept a collector, a scan result or a frame
+        if isinstance(data, pl.DataFrame):
+            return data
+        if isinstance(data, Sark100Collector):
+            return data.df
+        return data.get_dataframe()
+
+    def save(self, data, device=None, antenna=None, band=None, start=None, end=None, step=None, timestamp=None):
+        """
+        Store a sweep and return its sweep_id.
+
+        data may be a Sark100Collector, a scan result or a DataFrame with the
+        collector columns. start, end and step default to the lowest and
+        highest frequency and the smallest frequency step in the data, and
+        timestamp to the current UTC time.
+        """
+        df = self._frame(data).select([name for name, _ in Sark100Collector.columns]).sort("freq")
+        if timestamp is None:
+            timestamp = datetime.now(timezone.utc)
+        elif timestamp.tzinfo is None:
+            timestamp = timestamp.replace(tzinfo=timezone.utc)
+
+        freq = df["freq"]
+        if start is None:
+            start = freq.min()
+        if end is None:
+            end = freq.max()
+        if step is None and len(df) > 1:
+            step = freq.diff().drop_nulls().min()
+
+        sweep_id = f"{timestamp:%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}"
+        path = os.path.join("sweeps", f"{sweep_id}.parquet")
+        (
+            df.with_columns(pl.lit(sweep_id).alias("sweep_id"))
+            .write_parquet(os.path.join(self.root, path), row_group_size=self.row_group_size, statistics=True)
+        )
+
+        row = pl.DataFrame([{
+            "sweep_id": sweep_id,
+            "path": path,
+            "timestamp": timestamp,
+            "device": None if device is None else str(device),
+            "antenna": antenna,
+            "band": band,
+            "start": start,
+            "end": end,
+            "step": step,
+            "points": len(df),
+        }], schema=self.index_schema)
+
+        # Write the index row atomically so readers never see a partial file
+        index_path = os.path.join(self.index_dir, f"{sweep_id}.parquet")
+        tmp = index_path + ".tmp"
+        row.write_parquet(tmp)
+        os.replace(tmp, index_path)
+        return sweep_id
+
+    def _index_query(self, band=None, antenna=None, device=None, since=None, until=None,
+                     min_freq=None, max_freq=None):
+        index = pl.scan_parquet(self.index_pattern)
+        filters = []
+        if band is not None:
+            filters.append(pl.col("band").is_in([band] if isinstance(band, str) else list(band)))
+        if antenna is not None:
+            filters.append(pl.col("antenna") == antenna)
+        if device is not None:
+            filters.append(pl.col("device") == str(device))
+        if since is not None:
+            filters.append(pl.col("timestamp") >= self._utc(since))
+        if until is not None:
+            filters.append(pl.col("timestamp") < self._utc(until))
+        # Only sweeps overlapping the requested frequency range
+        if min_freq is not None:
+            filters.append(pl.col("end") >= min_freq)
+        if max_freq is not None:
+            filters.append(pl.col("start") <= max_freq)
+        for f in filters:
+            index = index.filter(f)
+        return index
+
+    @staticmethod
+    def _utc(value):
+        return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+    def sweeps(self, **filters):
+        """
+        Return the index rows of the sweeps matching the filters as a DataFrame.
+        Accepts the same filters as query().
+        """
+        if not glob.glob(self.index_pattern):
+            return pl.DataFrame(schema=self.index_schema)
+        return self._index_query(**filters).sort("timestamp").collect()
+
+    def paths(self, **filters):
+        """
+        Return {sweep_id: path of its Parquet file} for the sweeps matching
+        the filters, oldest first. Accepts the same filters as query().
+        """
+        rows = self.sweeps(**filters)
+        return {sweep_id: os.path.join(self.root, path)
+                for sweep_id, path in zip(rows["sweep_id"].to_list(), rows["path"].to_list())}
+
+    def query(self, band=None, antenna=None, device=None, since=None, until=None, min_freq=None, max_freq=None):
+        """
+        Lazily query stored measurements.
+
+        The index is filtered by band (a name or list of names), antenna,
+        device and timestamp range, and only the matching sweep files are
+        scanned. min_freq / max_freq are pushed down into those scans so only
+        the row groups holding that range are read.
+
+        Returns
+        -------
+        polars.LazyFrame
+            Measurements with a sweep_id column; join with sweeps() for metadata
+        """
+        paths = self.sweeps(
+            band=band, antenna=antenna, device=device, since=since, until=until,
+            min_freq=min_freq, max_freq=max_freq
+        )["path"].to_list()
+        if not paths:
+            schema = dict(Sark100Collector.columns)
+            schema["sweep_id"] = pl.Utf8
+            return pl.LazyFrame(schema=schema)
+
+        lazy = pl.scan_parquet([os.path.join(self.root, p) for p in paths])
+        if min_freq is not None:
+            lazy = lazy.filter(pl.col("freq") >= min_freq)
+        if max_freq is not None:
+            lazy = lazy.filter(pl.col("freq") <= max_freq)
+        return lazy
+
+    def load(self, sweep_id):
+        """
+        Load one stored sweep back into a Sark100Collector.
+        """
+        rows = self.sweeps().filter(pl.col("sweep_id") == sweep_id)
+        if rows.is_empty():
+            raise KeyError(f"Sweep '{sweep_id}' not found in {self.root}")
+        collector = Sark100Collector()
+        collector.df = pl.read_parquet(os.path.join(self.root, rows["path"][0]))
+        return collector
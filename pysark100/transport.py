@@ -0,0 +1,33 @@
+"""
+Transport module for SARK100 connections.
+Opens the serial port, or an alternative transport, that a sark100 talks to.
+"""
+
+
+def open_device(port='/dev/ttyUSB0'):
+    """
+    Open the transport for `port`.
+
+    `port` may be a serial device name (e.g. '/dev/ttyUSB0' or 'COM1'),
+    a ``sim://`` URL for the built-in simulated analyzer, a ``replay://``
+    URL of a capture file to play back, or an already opened transport
+    object providing write(), readline() and close().
+    """
+    if not isinstance(port, str):
+        return port
+
+    if port.startswith("sim://"):
+        from pysark100.simulator import SimulatedSark100
+        return SimulatedSark100.from_url(port)
+    if port.startswith("replay://"):
+        from pysark100.capture import ReplayTransport
+        return ReplayTransport.from_url(port)
+
+    import serial
+    return serial.Serial(
+        port=port,  # Replace with your port name (e.g., 'COM1' on Windows)
+        baudrate=57600,
+        bytesize=8,
+        timeout=5,
+        stopbits=serial.STOPBITS_ONE
+    )
@@ -1,3 +1,4 @@
+import os
 import pytest
 
 def test_imports():
@@ -24,3 +25,886 @@ def test_data_collector():
     assert len(df) == 1
     assert df["freq"][0] == 14200000
     assert abs(df["swr"][0] - 1.5) < 0.001
+
+
+def test_data_collector_bulk():
+    from pysark100.collector import Sark100Collector
+    collector = Sark100Collector(capacity=2)
+    collector.add_measurements(
+        [14000000, 14010000, 14020000],
+        ["1.5,50.0,25.0,55.9", "1.2,48.0,5.0,48.3", "1.9,60.0,-30.0,67.1"]
+    )
+    collector.add_measurement(14030000, "2.5,70.0,-40.0,80.6")
+    df = collector.get_data()
+    assert len(collector) == 4
+    assert df["freq"].to_list() == [14000000, 14010000, 14020000, 14030000]
+    assert df["x"].to_list() == [25.0, 5.0, -30.0, -40.0]
+    assert df.n_chunks() == 1
+    # The frame is cached until the next append
+    assert collector.df is df
+    collector.add_measurement(14040000, "3.0,80.0,-50.0,94.3")
+    assert collector.df is not df
+    assert len(collector.df) == 5
+
+    with pytest.raises(ValueError):
+        collector.add_measurements([1], ["1.0,2.0"])
+
+
+def test_simulated_scan():
+    from pysark100 import sark100
+    device = sark100(port="sim://?resonance=14200000&seed=1")
+    scan = device.scan(14000000, 14350000, step=10000)
+    df = scan.get_dataframe()
+    assert df["freq"].to_list() == list(range(14000000, 14350001, 10000))
+    # The modelled antenna is matched at resonance
+    best = df.filter(df["swr"] == df["swr"].min())
+    assert best["freq"][0] == 14200000
+    assert abs(best["swr"][0] - 1.0) < 0.01
+
+    # The device session can be reused for another sweep
+    measurements = list(device.scan(7000000, 7020000, step=10000))
+    assert len(measurements) == 3
+    assert set(measurements[0]) == {"swr", "r", "x", "z"}
+
+
+def test_simulated_scan_error():
+    from pysark100 import sark100
+    from pysark100.simulator import SimulatedSark100
+    sim = SimulatedSark100(timeout=0)
+    device = sark100(port=sim)
+    assert device.device is sim
+    assert list(device.scan(100, 200, step=10)) == []
+    assert sim.commands == ["scan 100 200 10"]
+
+
+def test_simulator_url_options():
+    from pysark100.simulator import SimulatedSark100
+    sim = SimulatedSark100.from_url("sim://?resonance=7100000&seed=3")
+    assert sim.resonance == 7100000
+    with pytest.raises(ValueError, match="bogus"):
+        SimulatedSark100.from_url("sim://?bogus=1")
+    with pytest.raises(ValueError, match="seed"):
+        SimulatedSark100.from_url("sim://?seed=1.5")
+
+
+def test_scan_counts_malformed_lines():
+    import io
+    from pysark100 import sark100
+
+    class CapturedDevice(io.BytesIO):
+        def write(self, data):
+            return len(data)
+
+    class BufferedDevice(CapturedDevice):
+        # Everything captured is already waiting, like a port with a backlog
+        @property
+        def in_waiting(self):
+            return len(self.getbuffer()) - self.tell()
+
+    raw = (b"Start\r\n1.5,50.0,25.0,55.9\r\n1.2,48.0,5.0,48.3\r\ngarbage\r\n1.9,60.0,-30.0,67.1\r\n"
+           b"1,2,3,4,5\r\n\"1.1,50,0,50\r\nEnd\r\n>>\r\n")
+    for device in (CapturedDevice, BufferedDevice):
+        scan = sark100(port=device(raw)).scan(14000000, 14050000, step=10000)
+        df = scan.get_dataframe()
+        # Malformed lines are counted and their frequencies skipped
+        assert df["freq"].to_list() == [14000000, 14010000, 14030000]
+        assert df["x"].to_list() == [25.0, 5.0, -30.0]
+        assert scan.malformed == 3
+        assert scan.finished and scan.error is None
+
+        scan = sark100(port=device(raw)).scan(14000000, 14050000, step=10000)
+        assert [m["x"] for m in scan] == ["25.0", "5.0", "-30.0"]
+        assert scan.malformed == 3
+
+
+def test_protocol_parser():
+    from pysark100.protocol import parse_block, split_sweep
+
+    data, terminator, rest = split_sweep(b">>\r\nStart\r\n1,2,3,4\r\n\r\n5,6,7,8\r\nEnd\r\n>>\r\n")
+    assert (data, terminator, rest) == (b"1,2,3,4\r\n5,6,7,8\r\n", "End", b">>\r\n")
+    assert split_sweep(b"1,2,3,4\r\nError: parameter error\r\n")[1] == "Error: parameter error"
+    assert split_sweep(b"1,2,3,4\r\n")[1] is None
+
+    values, good = parse_block(b"1,2,3,4\r\n1,x,3,4\r\n1,2,3\r\n5,6,-7.5,8\r\n")
+    assert good.tolist() == [True, False, False, True]
+    assert values[good].tolist() == [[1, 2, 3, 4], [5, 6, -7.5, 8]]
+    assert len(parse_block(b"")[0]) == 0
+    # Extra fields, empty fields, NaN and a last line without its newline
+    values, good = parse_block(b"1,2,3,4,5\r\n1,,3,4\r\n\r\nnan,2,3,4\r\n1e3, 2 ,3,4")
+    assert good.tolist() == [False, False, False, False, True]
+    assert values[4].tolist() == [1000, 2, 3, 4]
+
+
+def test_adaptive_scan():
+    from pysark100 import sark100
+    from pysark100.simulator import SimulatedSark100
+    sim = SimulatedSark100(resonance=14203000, q=40)
+    device = sark100(port=sim)
+    scan = device.scan(13500000, 15000000, step=1000, adaptive=True, coarse_factor=50)
+    df = scan.get_dataframe()
+
+    full_points = (15000000 - 13500000) // 1000 + 1
+    assert len(df) < full_points / 3
+    assert df["freq"].is_sorted()
+    assert df["freq"].n_unique() == len(df)
+    # The resonance is found at the fine step
+    best = df.filter(df["swr"] == df["swr"].min())
+    assert best["freq"][0] == 14203000
+    assert scan.passes[0] == (13500000, 15000000, 50000)
+    assert all(step == 1000 for _, _, step in scan.passes[1:])
+    assert len(sim.commands) == len(scan.passes)
+
+    # Noise along a broad resonance does not send the whole range to the fine step,
+    # and the end is measured when the coarse grid stops short of it
+    device = sark100(port="sim://?resonance=14175000&noise=2&seed=1")
+    scan = device.scan(13947000, 14403000, step=1000, adaptive=True)
+    df = scan.get_dataframe()
+    assert sum((hi - lo) // step + 1 for lo, hi, step in scan.passes) < 457 / 3
+    assert df["freq"][-1] == 14403000
+
+
+def test_pool_scan():
+    from pysark100.pool import sark100Pool, partition_range
+    from pysark100.simulator import SimulatedSark100
+
+    assert partition_range(0, 9, 1, [1, 1]) == [(0, 4), (5, 9)]
+    assert partition_range(0, 9, 1, [3, 1]) == [(0, 7), (8, 9)]
+    assert partition_range(0, 2, 1, [1, 0]) == [(0, 2), None]
+
+    pool = sark100Pool([SimulatedSark100(latency=0.0004), SimulatedSark100(latency=0.0012)])
+    scan = pool.scan(14000000, 14300000, step=1000)
+    df = scan.get_dataframe()
+    assert df["freq"].to_list() == list(range(14000000, 14300001, 1000))
+    # The faster analyzer gets the larger share
+    (lo0, hi0), (lo1, hi1) = scan.plan
+    assert hi0 - lo0 > hi1 - lo1
+    assert hi0 + 1000 == lo1
+
+
+def test_async_scan():
+    import asyncio
+    from pysark100.aio import async_sark100
+    from pysark100.simulator import SimulatedSark100
+
+    async def sweep_two():
+        a = async_sark100(port=SimulatedSark100(resonance=7100000, latency=0.001))
+        b = async_sark100(port=SimulatedSark100(resonance=14200000, latency=0.001))
+        return await asyncio.gather(
+            a.scan(7000000, 7100000, step=1000).collect(),
+            b.scan_band("20m", buffer_pct=0, step=10000).collect()
+        )
+
+    first, second = asyncio.run(sweep_two())
+    assert first.get_data()["freq"].to_list() == list(range(7000000, 7100001, 1000))
+    assert len(second) == 36
+
+    async def iterate():
+        device = async_sark100(port="sim://")
+        return [m async for m in device.scan(14000000, 14020000, step=10000)]
+
+    measurements = asyncio.run(iterate())
+    assert len(measurements) == 3
+    assert set(measurements[0]) == {"swr", "r", "x", "z"}
+
+
+def test_async_scan_timeout_and_cancel():
+    import asyncio
+    from pysark100.aio import async_sark100
+    from pysark100.simulator import SimulatedSark100
+
+    async def run():
+        device = async_sark100(port=SimulatedSark100(latency=0.01))
+        with pytest.raises(asyncio.TimeoutError):
+            await device.scan(14000000, 14100000, step=1000, sweep_timeout=0.1).collect()
+
+        task = asyncio.ensure_future(device.scan(14000000, 14100000, step=1000).collect())
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+        # Later sweeps skip what is left of the abandoned ones
+        device.transport.device.latency = 0.0
+        return await device.scan(7000000, 7010000, step=1000).collect()
+
+    df = asyncio.run(run()).get_data()
+    assert df["freq"].to_list() == list(range(7000000, 7010001, 1000))
+    # Readings are from the 7 MHz sweep, not left over 14 MHz lines
+    assert (df["x"] < -500).all()
+
+
+def test_async_scan_early_exit_and_malformed():
+    import asyncio
+    from pysark100.aio import async_sark100
+    from pysark100.simulator import SimulatedSark100
+
+    class Corrupting(SimulatedSark100):
+        # Garbles the second data line of every sweep
+        def _scan_lines(self, start, end, step):
+            for i, (delay, line) in enumerate(super()._scan_lines(start, end, step)):
+                yield delay, b"\xff\xfe,oops\r\n" if i == 2 else line
+
+    async def run():
+        device = async_sark100(port=Corrupting())
+        async with device.scan(14000000, 14100000, step=1000) as scan:
+            async for _ in scan:
+                break
+        assert not device.transport.lock.locked()
+
+        # The next sweep neither deadlocks nor dies on the corrupt line
+        scan = device.scan(7000000, 7010000, step=1000)
+        df = (await asyncio.wait_for(scan.collect(), 5)).df
+        return scan, df
+
+    scan, df = asyncio.run(run())
+    assert scan.malformed == 1
+    assert df["freq"].to_list() == [7000000] + list(range(7002000, 7010001, 1000))
+
+
+def test_sweep_store(tmp_path):
+    from datetime import datetime, timedelta, timezone
+    from pysark100 import sark100
+    from pysark100.store import SweepStore
+
+    device = sark100(port="sim://?seed=1")
+    store = SweepStore(str(tmp_path), row_group_size=10)
+    old = datetime.now(timezone.utc) - timedelta(days=60)
+    first = store.save(device.scan_band("20m", buffer_pct=0, step=10000), band="20m", antenna="dipole", timestamp=old)
+    second = store.save(device.scan_band("20m", buffer_pct=0, step=10000), band="20m", antenna="dipole")
+    store.save(device.scan_band("40m", buffer_pct=0, step=10000), band="40m", antenna="dipole")
+
+    assert store.sweeps()["sweep_id"].to_list()[:2] == [first, second]
+    assert len(os.listdir(store.index_dir)) == 3
+    recent = store.sweeps(band="20m", antenna="dipole", since=datetime.now(timezone.utc) - timedelta(days=30))
+    assert recent["sweep_id"].to_list() == [second]
+    assert recent["step"][0] == 10000
+
+    df = store.query(band="20m", min_freq=14100000, max_freq=14200000).collect()
+    assert set(df["sweep_id"]) == {first, second}
+    assert df["freq"].min() == 14100000 and df["freq"].max() == 14200000
+
+    assert store.query(band="6m").collect().is_empty()
+    assert len(store.load(second)) == 36
+
+
+@pytest.mark.parametrize("filename", ["sweep.csv", "sweep.parquet", "sweep.arrow"])
+def test_streaming_sink(tmp_path, filename):
+    import polars as pl
+    from pysark100 import sark100
+
+    path = str(tmp_path / filename)
+    device = sark100(port="sim://?seed=1")
+    scan = device.scan(14000000, 14099000, step=1000, sink=path, batch_size=16)
+    for i, _ in enumerate(scan):
+        # Memory holds at most one batch while the sweep runs
+        assert scan.data._len < 16
+        if i == 40:
+            # The batches written so far are readable mid sweep
+            assert len(scan.data.sink.read()) == 32
+    df = scan.get_dataframe()
+    assert df["freq"].to_list() == list(range(14000000, 14099001, 1000))
+    assert scan.data.sink.batches == 7
+
+    reference = sark100(port="sim://?seed=1").scan(14000000, 14099000, step=1000).get_dataframe()
+    assert df.equals(reference)
+    if filename.endswith(".csv"):
+        assert pl.read_csv(path).height == 100
+
+
+def test_plot_live():
+    import os
+    import threading
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    pytest.importorskip("pyqtgraph")
+    from pysark100 import sark100
+
+    scan = sark100(port="sim://?latency=0.001").scan(14000000, 14200000, step=1000)
+    collector = scan.plot_live(include_x=True, refresh_ms=20, close_when_done=True)
+    assert collector.get_data()["freq"].to_list() == list(range(14000000, 14200001, 1000))
+
+    # Closing the window stops the reader part way through the sweep
+    from pyqtgraph.Qt import QtCore, QtWidgets
+
+    def close():
+        for widget in QtWidgets.QApplication.topLevelWidgets():
+            widget.close()
+
+    scan = sark100(port="sim://?latency=0.01").scan(14000000, 14200000, step=1000)
+    QtCore.QTimer.singleShot(200, close)
+    collector = scan.plot_live(refresh_ms=20)
+    assert 0 < len(collector) < 201 and not scan.finished
+    assert not any(t.name == "sark100-live-reader" for t in threading.enumerate())
+
+
+def test_minmax_downsample():
+    import numpy as np
+    from pysark100.downsample import minmax_indices, downsample_frame
+    from pysark100.collector import Sark100Collector
+
+    x = np.arange(1000000, dtype=np.int64)
+    swr = 3.0 + np.sin(x / 5000.0)
+    swr[123457] = 1.01  # a sharp dip between samples of any regular decimation
+    idx = minmax_indices(x, [swr], buckets=500)
+    assert len(idx) <= 4 * 500
+    assert 123457 in idx
+    assert idx[0] == 0 and idx[-1] == len(x) - 1
+
+    # Zoomed to a range, one sample either side is kept
+    zoomed = minmax_indices(x, [swr], buckets=500, x_range=(1000, 1999))
+    assert zoomed.tolist() == list(range(999, 2001))
+
+    collector = Sark100Collector()
+    collector.add_values(x[:10], np.ones((10, 4)))
+    assert downsample_frame(collector.df, buckets=0) is collector.df
+    assert len(downsample_frame(collector.df, buckets=3)) == 10
+    assert len(downsample_frame(collector.df, buckets=2)) < 10
+
+
+def test_band_index(tmp_path):
+    import json
+    import polars as pl
+    from pysark100.bands import BandIndex, band_index, load_band_plan
+    from pysark100.collector import Sark100Collector
+
+    index = band_index()
+    assert "hf" not in index.names
+    assert [b[0] for b in index.overlapping(13000000, 19000000)] == ["20m", "17m"]
+
+    collector = Sark100Collector()
+    collector.add_measurements(
+        [7000000, 7100000, 7200000, 9000000, 14100000, 14200000],
+        ["1.2,50,5,50.2", "1.9,60,10,60.8", "3.0,80,30,85.4", "5.0,90,40,98.5", "2.5,70,20,72.8", "1.1,52,2,52.0"]
+    )
+    labelled = collector.with_bands()
+    assert labelled["band"].to_list() == ["40m", "40m", "40m", None, "20m", "20m"]
+
+    summary = collector.band_summary()
+    assert summary["band"].to_list() == ["40m", "20m"]
+    forty = summary.row(0, named=True)
+    assert forty["points"] == 3
+    assert forty["min_swr"] == 1.2 and forty["min_swr_freq"] == 7000000
+    assert abs(forty["coverage"] - 2 / 3) < 1e-9
+    assert summary.filter(pl.col("band") == "20m")["min_swr_freq"][0] == 14200000
+
+    plan_file = tmp_path / "plan.json"
+    plan_file.write_text(json.dumps({"40m": {"start": 7000000, "end": 7200000}}))
+    plan = load_band_plan(str(plan_file))
+    assert BandIndex(plan).label(collector.df)["band"].to_list() == ["40m", "40m", "40m", None, None, None]
+
+    # Two names for the same range are kept once rather than dropping both as each other's umbrella
+    plan = {"40m": {"start": 7000000, "end": 7200000}, "7MHz": {"start": 7000000, "end": 7200000},
+            "hf": {"start": 1800000, "end": 29700000}}
+    assert BandIndex(plan).names == ["40m"]
+
+
+def test_analysis():
+    import numpy as np
+    import polars as pl
+    from pysark100 import analysis
+    from pysark100.simulator import SimulatedSark100
+
+    sim = SimulatedSark100(resonance=7100000, q=10.0)
+
+    def sweep(start, end, step):
+        freqs = np.arange(start, end + 1, step)
+        swr, r, x, z = zip(*(sim.measure(int(f)) for f in freqs))
+        return pl.DataFrame({"freq": freqs, "swr": swr, "r": r, "x": x, "z": z})
+
+    df = sweep(6500000, 7700000, 1000)
+    res = analysis.resonances(df)
+    assert len(res) == 1
+    assert abs(res["freq"][0] - 7100000) < 1000
+    assert res["kind"][0] == "series"
+    assert abs(res["q"][0] - 10.0) < 0.1
+
+    minima = analysis.swr_minima(df, max_swr=1.5)
+    assert minima["freq"].to_list() == [7100000]
+
+    bw = analysis.bandwidths(df)
+    two = bw.filter(pl.col("limit") == 2.0).row(0, named=True)
+    # A matched series RLC has a 2:1 bandwidth of f0 / (Q sqrt(2))
+    assert abs(two["bandwidth"] - 7100000 / (10 * np.sqrt(2))) < 2000
+    assert two["complete"] and abs(two["q"] - 10.0) < 0.1
+    # Cut off by the end of the sweep
+    assert not analysis.bandwidths(df.filter(pl.col("freq") >= 7000000), limits=[2.0])["complete"][0]
+
+    refl = analysis.reflection(df, z0=50.0).filter(pl.col("freq") == 7100000)
+    assert refl["gamma"][0] < 1e-6 and refl["return_loss"][0] > 100
+    assert abs(analysis.reflection(df, z0=75.0).filter(pl.col("freq") == 7100000)["gamma"][0] - 0.2) < 1e-6
+
+    # Two sweeps analysed together, shuffled, must not be paired across
+    both = pl.concat([
+        df.with_columns(pl.lit("a").alias("sweep_id")),
+        df.with_columns(pl.lit("b").alias("sweep_id"), pl.col("freq") + 200000),
+    ]).sample(fraction=1.0, shuffle=True, seed=1)
+    summary = analysis.summary(both.lazy(), by="sweep_id")
+    assert summary["sweep_id"].to_list() == ["a", "b"]
+    assert summary["min_swr_freq"].to_list() == [7100000, 7300000]
+    assert abs(summary["resonance"][1] - 7300000) < 1000
+    assert analysis.resonances(both, by="sweep_id").height == 2
+    assert summary["bw_1.5"].null_count() == 0
+
+
+def test_scan_bands(monkeypatch):
+    from pysark100 import sark100, bands
+    from pysark100.multiband import plan_band_ranges
+
+    # Ranges one step apart are merged, hf swallows everything below 30 MHz
+    monkeypatch.setitem(bands, "low", {"start": 5000000, "end": 5100000})
+    monkeypatch.setitem(bands, "high", {"start": 5101000, "end": 5200000})
+    assert plan_band_ranges(["high", "low"], buffer_pct=0.0, step=1000) == [(5000000, 5200000, ["low", "high"])]
+    assert [names for _, _, names in plan_band_ranges(["hf", "40m", "6m"], step=1000)] == [["hf", "40m"], ["6m"]]
+    plan = plan_band_ranges(["20m", "40m", "20m"], buffer_pct=0.0, step=10000)
+    assert plan == [(7000000, 7300000, ["40m"]), (14000000, 14350000, ["20m"])]
+
+    analyzer = sark100(port="sim://?resonance=14200000")
+    scan = analyzer.scan_bands(["20m", "30m", "40m"], buffer_pct=0.0, step=10000)
+    df = scan.get_dataframe()
+    assert len(analyzer.device.commands) == 3
+    assert df["freq"].is_sorted() and df["freq"].n_unique() == len(df)
+    assert set(scan.by_band) == {"20m", "30m", "40m"}
+    assert scan.by_band["20m"].df["freq"].to_list() == list(range(14000000, 14350001, 10000))
+    assert len(df) == sum(len(c) for c in scan.by_band.values())
+    assert set(scan.get_band_dataframe()["band"].unique()) == {"20m", "30m", "40m"}
+
+    # The device is left ready for the next command
+    assert len(analyzer.scan(14000000, 14010000, 10000).get_dataframe()) == 2
+
+
+def test_chunked_scan(tmp_path):
+    from pysark100 import sark100
+    from pysark100.chunked import plan_chunks
+
+    assert plan_chunks(1000000, 1009000, 1000, 4) == [(1000000, 1003000), (1004000, 1007000), (1008000, 1009000)]
+
+    # A flaky device: errors and stalls, with a short timeout so stalls fail quickly
+    analyzer = sark100(port="sim://?error_rate=0.02&stall_rate=0.01&timeout=0.02&seed=7")
+    seen = []
+    scan = analyzer.scan_chunked(14000000, 14199000, 1000, chunk_points=25, retries=10, backoff=0.0,
+                                 checkpoint=str(tmp_path / "ck"), on_chunk=lambda c: seen.append(dict(c)))
+    df = scan.get_dataframe()
+    assert scan.complete and not scan.failed
+    assert df["freq"].to_list() == list(range(14000000, 14200000, 1000))
+    status = scan.status()
+    assert len(status) == 8 and status["attempts"].max() > 1
+    assert any(c["state"] == "failed" for c in seen)
+
+    # A fresh session resumes from the checkpoint without sweeping again
+    other = sark100(port="sim://")
+    resumed = other.scan_chunked(14000000, 14199000, 1000, chunk_points=25, checkpoint=str(tmp_path / "ck"))
+    assert resumed.complete
+    assert resumed.get_dataframe().equals(df)
+    assert other.device.commands == []
+
+    with pytest.raises(ValueError):
+        other.scan_chunked(14000000, 14199000, 1000, chunk_points=50, checkpoint=str(tmp_path / "ck"))
+
+    # Chunks which run out of retries are reported and keep what arrived
+    broken = sark100(port="sim://?error_rate=0.5&seed=1")
+    scan = broken.scan_chunked(14000000, 14099000, 1000, chunk_points=50, retries=1, backoff=0.0)
+    scan.get_dataframe()
+    assert not scan.complete
+    assert scan.failed and all(c["attempts"] == 2 and "Error" in c["error"] for c in scan.failed)
+    assert len(scan.data) == sum(c["points"] for c in scan.chunks)
+
+
+def test_monitor(tmp_path):
+    import numpy as np
+    from pysark100 import sark100
+    from pysark100.monitor import compare_sweeps
+
+    base = np.zeros((4, 4))
+    moved = base.copy()
+    moved[1, 0] = 0.1
+    moved[2] = np.nan
+    assert compare_sweeps(moved, base).tolist() == [False, True, False, False]
+
+    analyzer = sark100(port="sim://?resonance=14150000")
+    alerts = []
+    watch = analyzer.monitor(band="20m", step=5000, interval=0, log=str(tmp_path / "log"), baseline=3,
+                             on_alert=alerts.append)
+    watch.run(count=3)
+    # The first sweep is a keyframe, identical sweeps after it are only counted
+    series = watch.log.series()
+    assert series["stored"].to_list() == ["key", None, None]
+    assert series["changed"].to_list()[1:] == [0, 0]
+    # Each sweep adds its own series file
+    assert len(os.listdir(watch.log.series_dir)) == 3
+
+    # Water in the coax: the resonance moves and the sweep is stored
+    analyzer.device.resonance = 14250000
+    assert watch.sweep()["stored"] == "key"
+    assert [a["metric"] for a in alerts] == ["resonance"] and alerts[0]["drift"] == 100000
+    assert watch.log.alerts()[0]["metric"] == "resonance"
+    # A smaller move is stored as a delta on top of that keyframe
+    analyzer.device.resonance = 14260000
+    event = watch.sweep()
+    assert event["stored"] == "delta"
+
+    # Stored sweeps rebuild to within the tolerance
+    rebuilt = watch.log.load(event["timestamp"]).df
+    fresh = analyzer.scan(watch.start, watch.end, watch.step).get_dataframe()
+    assert rebuilt["freq"].to_list() == fresh["freq"].to_list()
+    assert (rebuilt["swr"] - fresh["swr"]).abs().max() <= watch.tolerance["swr"]
+
+
+def test_scan_stats(tmp_path):
+    from pysark100 import sark100
+
+    analyzer = sark100(port="sim://?seed=3")
+    swept = analyzer.scan(14000000, 14099000, 1000)
+    df = swept.get_dataframe()
+    swept.plot(filename=str(tmp_path / "plot.png"))
+    # The line by line path, ended by an Error
+    analyzer.device.error_rate = 0.2
+    rows = list(analyzer.scan(14000000, 14099000, 1000))
+
+    stats = analyzer.stats
+    assert stats.counters["scans"] == 2
+    assert stats.counters["samples"] == len(df) + len(rows)
+    assert stats.counters["bytes"] > 0 and stats.counters["reads"] > 0
+    assert stats.counters["errors"] == 1 and len(rows) < 100
+    assert stats.histograms["sample_latency"].count == stats.counters["samples"]
+    assert all(stats.time[phase] > 0 for phase in ("device", "parse", "append", "plot"))
+    assert "plot" in stats.report() and "samples in 2 scans" in stats.report()
+
+    analyzer.device.error_rate = 0.02
+    chunked = analyzer.scan_chunked(14000000, 14099000, 1000, chunk_points=20, retries=10, backoff=0.0)
+    chunked.get_dataframe()
+    assert stats.counters["retries"] == sum(c["attempts"] - 1 for c in chunked.chunks)
+
+    text = stats.openmetrics(labels={"device": "sim"})
+    assert text.endswith("# EOF\n")
+    assert f'sark100_samples_total{{device="sim"}} {stats.counters["samples"]}' in text
+    assert f'sark100_sample_latency_seconds_bucket{{device="sim",le="+Inf"}} {stats.counters["samples"]}' in text
+
+
+def test_averaged_scan():
+    import numpy as np
+    from pysark100 import sark100
+    from pysark100.averaging import SweepAverager
+    from pysark100.collector import Sark100Collector
+
+    # Streaming reductions over several blocks match NumPy over the whole stack
+    rng = np.random.default_rng(0)
+    truth = rng.normal(size=(50, 4))
+    stack = truth + rng.normal(scale=0.1, size=(20, 50, 4))
+    stack[::7, 10] = 50.0
+    stack[:, 5] = np.nan
+    stack[3, 6] = np.nan
+    averager = SweepAverager(50, block=6)
+    for grid in stack:
+        averager.add(grid)
+    result = averager.result()
+    measured = np.arange(50) != 5
+    assert np.allclose(result["mean"][measured], np.nanmean(stack[:, measured], axis=0))
+    assert np.allclose(result["std"][measured], np.nanstd(stack[:, measured], axis=0, ddof=1))
+    assert np.isnan(result["mean"][5]).all() and result["count"][6, 0] == 19
+    assert result["rejected"][10] >= 3
+    assert np.abs(result["clipped"][10] - truth[10]).max() < 0.1
+
+    analyzer = sark100(port="sim://?noise=1&seed=2")
+    scan = analyzer.scan_averaged(14000000, 14049000, 1000, sweeps=10, block=4)
+    df = scan.get_dataframe()
+    assert len(df) == 50 and (df["samples"] == 10).all()
+    assert {"swr_std", "r_std", "x_std", "z_std", "rejected"} <= set(df.columns)
+    assert (df["r_std"] > 0).all()
+    exact = sark100(port="sim://").scan(14000000, 14049000, 1000).get_dataframe()
+    assert (df["r"] - exact["r"]).abs().max() < 1.5
+    stats = scan.statistics()
+    assert stats["r_mean"].to_list() != stats["r_clipped"].to_list() or (stats["rejected"] == 0).all()
+    assert analyzer.stats.counters["scans"] == 10
+
+    # Setting df keeps only the collector's own columns; extras come from from_values alone
+    collector = Sark100Collector()
+    collector.df = df
+    assert collector.df.columns == [name for name, _ in Sark100Collector.columns] and not collector.extra
+
+
+def test_export_and_load(tmp_path):
+    import numpy as np
+    from pysark100 import sark100
+    from pysark100.analysis import reflection
+    from pysark100.collector import Sark100Collector
+    from pysark100.fileio import s11
+
+    scan = sark100(port="sim://").scan(14000000, 14099000, 1000)
+    df = scan.get_dataframe()
+    gamma = reflection(df)["gamma"].to_numpy()
+    assert np.allclose(np.abs(s11(df["r"].to_numpy(), df["x"].to_numpy())), gamma)
+
+    for name, options in [("ri.s1p", {}), ("ma.s1p", {"fmt": "MA", "freq_unit": "MHZ"}),
+                          ("db.s1p", {"fmt": "DB", "z0": 75.0}), ("sweep.csv", {}), ("sweep.parquet", {})]:
+        path = str(tmp_path / name)
+        scan.export(path, chunk_rows=7, **options)
+        loaded = Sark100Collector.load(path, z0=50.0 if name.endswith(".s1p") else None).df
+        assert loaded["freq"].to_list() == df["freq"].to_list()
+        for column in ("r", "x"):
+            assert np.allclose(loaded[column].to_numpy(), df[column].to_numpy())
+        if name.endswith(".s1p"):
+            # SWR and |Z| are recomputed from S11 against 50 Ohms, not rounded like the device's
+            assert np.allclose(loaded["swr"].to_numpy(), (1 + gamma) / (1 - gamma))
+            assert np.allclose(loaded["z"].to_numpy(), np.hypot(df["r"].to_numpy(), df["x"].to_numpy()))
+        else:
+            assert loaded.equals(df)
+
+    text = (tmp_path / "db.s1p").read_text().splitlines()
+    assert text[1] == "# HZ S DB R 75" and len(text) == 102
+
+    # Sweeps streamed to a sink directory load back too
+    streamed = sark100(port="sim://").scan(14000000, 14099000, 1000, sink=str(tmp_path / "parts.parquet"),
+                                           batch_size=16)
+    streamed.get_dataframe()
+    assert Sark100Collector.load(str(tmp_path / "parts.parquet")).df.equals(df)
+
+
+def test_compare_sweeps(tmp_path):
+    import numpy as np
+    from pysark100 import sark100
+    from pysark100.compare import SweepComparison, resample
+    from pysark100.store import SweepStore
+
+    freq = np.array([0, 10, 20])
+    values = np.array([[0.0], [10.0], [40.0]])
+    assert np.allclose(resample(freq, values, [5, 15, 25]).ravel(), [5.0, 25.0, np.nan], equal_nan=True)
+
+    # The same antenna swept at different steps and ranges, and after its resonance moved
+    fine = sark100(port="sim://?resonance=14150000").scan(14000000, 14300000, 1000)
+    coarse = sark100(port="sim://?resonance=14150000").scan(14050000, 14350000, 5000)
+    moved = sark100(port="sim://?resonance=14200000").scan(14000000, 14300000, 2000)
+    comparison = SweepComparison([fine, coarse, moved], labels=["fine", "coarse", "moved"])
+    assert (comparison.start, comparison.end, comparison.step) == (14050000, 14300000, 5000)
+    assert comparison.values.shape == (3, 51, 4)
+
+    rms = comparison.rms_matrix()
+    swr = comparison.column("swr")
+    assert np.allclose(rms, rms.T) and np.allclose(np.diag(rms), 0)
+    assert np.isclose(rms[0, 2], np.sqrt(np.mean((swr[2] - swr[0]) ** 2)))
+    assert rms[0, 1] < 0.05 < rms[0, 2]
+    assert np.isclose(comparison.difference_matrix("x")[0, 2], np.mean(comparison.difference("x")[2]))
+    shift = comparison.resonance_shift()
+    assert abs(shift[0, 2] - 50000) < 5000 and abs(shift[0, 1]) < 5000
+    assert comparison.to_frame(rms).columns == ["label", "fine", "coarse", "moved"]
+    comparison.plot(reference=0, filename=str(tmp_path / "compare.png"))
+    assert (tmp_path / "compare.png").exists()
+
+    store = SweepStore(str(tmp_path / "store"))
+    ids = [store.save(scan, band="20m") for scan in (fine, moved)]
+    stored = SweepComparison.from_store(store, ids)
+    assert stored.labels == ids and np.allclose(stored.rms_matrix()[0, 1], rms[0, 2], atol=0.05)
+
+
+def test_server(tmp_path):
+    import time
+    from pysark100 import sark100
+    from pysark100.server import AnalyzerServer, ScanConflict, sark100Client
+
+    expected = sark100(port="sim://").scan(14000000, 14099000, 1000).get_dataframe()
+    with AnalyzerServer("sim://?latency=0.001", address=("127.0.0.1", 0)) as server:
+        client = sark100Client(server.url)
+        first = client.scan(14000000, 14099000, 1000)
+        # An identical request while the sweep is in flight joins it
+        second = client.scan(14000000, 14099000, 1000)
+        assert second.job["id"] == first.job["id"] and second.job["requests"] == 2
+        low = client.scan(7000000, 7019000, 1000)
+        high = client.scan(21000000, 21019000, 1000, priority=5)
+        dropped = client.scan(28000000, 28009000, 1000)
+        assert client.cancel(dropped.job["id"])["state"] == "cancelled"
+        with pytest.raises(ScanConflict):
+            client.cancel(first.job["id"])
+
+        rows = list(first)
+        assert [row["freq"] for row in rows] == expected["freq"].to_list()
+        assert second.get_dataframe().equals(expected) and first.get_dataframe().equals(expected)
+        low.get_dataframe()
+        high.get_dataframe()
+        assert high.job["started"] < low.job["started"]
+        dropped.get_dataframe()
+        assert dropped.error == "Scan cancelled" and len(dropped.data) == 0
+        with pytest.raises(KeyError):
+            client.job("missing")
+        assert "sark100_samples_total" in client.metrics()
+
+    # Over a Unix socket, rejecting duplicates
+    path = str(tmp_path / "sark100.sock")
+    with AnalyzerServer("sim://?latency=0.001", address=path, on_duplicate="reject") as server:
+        client = sark100Client(server.url)
+        scan = client.scan_band("20m", buffer_pct=0.0, step=10000)
+        with pytest.raises(ScanConflict):
+            client.scan_band("20m", buffer_pct=0.0, step=10000)
+        assert scan.get_dataframe()["freq"].to_list() == list(range(14000000, 14350001, 10000))
+        time.sleep(0.01)
+        assert client.status()["queued"] == 0
+    assert not os.path.exists(path)
+
+
+def test_sweep_cache(monkeypatch):
+    import time
+    from pysark100 import sark100
+    from pysark100.cache import SweepCache
+
+    cache = SweepCache(ttl=60, max_points=500)
+    analyzer = sark100(port="sim://", cache=cache)
+    band = analyzer.scan_band("20m", buffer_pct=0.0, step=1000)
+    full = band.get_dataframe()
+    commands = len(analyzer.device.commands)
+
+    # Sub-ranges on the same or a coarser grid are sliced without device traffic
+    narrow = analyzer.scan(14000000, 14100000, 1000)
+    coarse = analyzer.scan(14010000, 14300000, 5000)
+    assert len(analyzer.device.commands) == commands
+    assert narrow.get_dataframe().equals(full.filter(full["freq"] <= 14100000))
+    assert coarse.get_dataframe()["freq"].to_list() == list(range(14010000, 14300001, 5000))
+    assert coarse.get_dataframe()["swr"].to_list() == full.filter(
+        full["freq"].is_in(range(14010000, 14300001, 5000)))["swr"].to_list()
+
+    # A finer grid, an offset grid or a wider range has to be swept
+    for start, end, step in [(14000000, 14100000, 500), (14000500, 14100500, 1000), (13990000, 14100000, 1000)]:
+        analyzer.scan(start, end, step).get_dataframe()
+    assert len(analyzer.device.commands) == commands + 3
+    assert analyzer.scan(14000000, 14100000, 1000, use_cache=False).get_dataframe().equals(narrow.get_dataframe())
+    assert cache.counters["hits"] == 2 and cache.counters["misses"] == 4
+    assert analyzer.stats.counters["cache_hits"] == 2 and "cache: 2 hits" in analyzer.stats.report()
+
+    # Least recently used sweeps go first once max_points is passed
+    assert cache.points <= 500 and cache.counters["evictions"] > 0
+
+    # Expired sweeps are swept again
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now + 120)
+    analyzer.scan(14000000, 14100000, 1000).get_dataframe()
+    assert cache.counters["expired"] > 0 and len(analyzer.device.commands) == commands + 5
+
+    # Neither the stored collector nor the slices handed out share buffers with the cache
+    cache = SweepCache()
+    collector = analyzer.scan(14000000, 14010000, 1000).data
+    cache.put("sim", 14000000, 14010000, 1000, collector)
+    collector.buffers()[1][:] = 0
+    served, _ = cache.lookup("sim", 14000000, 14010000, 1000)
+    served.buffers()[1][:] = -1
+    assert (cache.lookup("sim", 14000000, 14010000, 1000)[0].buffers()[1][:, 0] >= 1).all()
+
+
+def test_render_batch(tmp_path):
+    from pysark100 import sark100
+    from pysark100.render import SweepFigure, render_batch
+    from pysark100.store import SweepStore
+
+    scans = {name: sark100(port=f"sim://?resonance={resonance}").scan(13900000, 14450000, 1000)
+             for name, resonance in (("low", 14100000), ("high", 14300000))}
+    files = render_batch(scans, outdir=str(tmp_path / "png"), workers=1, include_x=True)
+    assert files == [str(tmp_path / "png" / "low.png"), str(tmp_path / "png" / "high.png")]
+    assert all((tmp_path / "png" / f"{name}.png").stat().st_size for name in scans)
+
+    # Stored sweeps are loaded by the worker processes
+    store = SweepStore(str(tmp_path / "store"))
+    ids = [store.save(scan, band="20m") for scan in scans.values()]
+    files = render_batch(store.paths(band="20m"), outdir=str(tmp_path / "svg"), fmt="svg", workers=2)
+    assert [f.endswith(f"{sweep_id}.svg") for f, sweep_id in zip(files, ids)] == [True, True]
+    assert all(open(f).read().lstrip().startswith("<?xml") for f in files)
+
+    # Lines and band overlays are reused between renders
+    figure = SweepFigure()
+    for scan in scans.values():
+        df = scan.get_dataframe()
+        figure.render(df["freq"].to_numpy(), df.select(["swr", "r", "x", "z"]).to_numpy(), str(tmp_path / "one.png"))
+    assert len(figure.axes.lines) == 4 + len(figure._bands)
+    assert not figure.lines["r"].get_visible() and figure.lines["swr"].get_visible()
+
+
+def test_capture_replay(tmp_path):
+    import pytest
+    from pysark100 import sark100
+    from pysark100.capture import ReplayTransport, read_capture
+
+    path = str(tmp_path / "session.cap")
+    analyzer = sark100(port="sim://?resonance=14150000&noise=0.5&seed=4&latency=0.0002", capture=path)
+    first = analyzer.scan(14000000, 14300000, 2000).get_dataframe()
+    second = analyzer.scan_band("20m", step=5000).get_dataframe()
+    analyzer.__end__()
+    meta, records = read_capture(path)
+    assert meta["port"].startswith("sim://") and [kind for kind, _, _ in records].count(b"W") == 2
+
+    # Fast and timed replays give back the same sweeps without a device
+    for url in (f"replay://{path}", f"replay://{path}?realtime=1&speed=4"):
+        replay = sark100(port=url)
+        assert replay.scan(14000000, 14300000, 2000).get_dataframe().equals(first)
+        assert replay.scan_band("20m", step=5000).get_dataframe().equals(second)
+        assert replay.device.commands == replay.device.recorded_commands
+        replay.__end__()
+        assert not replay.device.is_open
+
+    strict = sark100(port=f"replay://{path}?strict=1")
+    with pytest.raises(ValueError, match="does not match"):
+        strict.scan(14000000, 14300000, 1000)
+
+    # A sweep which stalled times out at the same point when replayed
+    path = str(tmp_path / "stall.cap")
+    analyzer = sark100(port="sim://?stall_rate=0.02&seed=1&timeout=0.05", capture=path)
+    stalled = analyzer.scan(14000000, 14300000, 1000)
+    stalled.get_dataframe()
+    analyzer.__end__()
+    replayed = sark100(port=f"replay://{path}").scan(14000000, 14300000, 1000)
+    assert replayed.get_dataframe().equals(stalled.get_dataframe())
+    assert replayed.error == stalled.error == "Timeout waiting for the SARK100"
+
+    with ReplayTransport(path) as transport:
+        assert transport.recorded_commands == ["scan 14000000 14300000 1000"]
+    assert not transport.is_open
+
+
+def test_plot_html(tmp_path):
+    import numpy as np
+    from pysark100 import sark100
+    from pysark100.collector import WEBGL_THRESHOLD, plotly_bands, plotly_traces
+    from pysark100.compare import SweepComparison
+
+    freq = np.arange(WEBGL_THRESHOLD + 1) * 100 + 14000000
+    dense = plotly_traces(freq, [("swr", np.ones(len(freq))), ("x", np.zeros(len(freq)))])
+    assert [t.type for t in dense] == ["scattergl", "scattergl"] and dense[0].y.dtype == np.float32
+    assert [t.type for t in plotly_traces(freq[:100], [("swr", np.ones(100))])] == ["scatter"]
+    # 20m is overlaid as one shaded region, one centre line and one label
+    bands = plotly_bands(13900000, 14450000)
+    assert [s["type"] for s in bands["shapes"]] == ["rect", "line"]
+    assert [a["text"] for a in bands["annotations"]] == ["20m"]
+
+    scan = sark100(port="sim://?resonance=14150000&noise=0.3&seed=2").scan(13900000, 14450000, 1000)
+    scan.plot_interactive(include_x=True, html=str(tmp_path / "scan.html"))
+    SweepComparison([scan, scan]).plot_interactive(html=str(tmp_path / "compare.html"))
+    for name in ("scan.html", "compare.html"):
+        page = (tmp_path / name).read_text()
+        # Self-contained: plotly.js is embedded rather than loaded from a CDN
+        assert "<script src=" not in page and "Plotly.newPlot" in page
+
+
+# Third-party modules importing pysark100 and its CLI may load; plotting, Polars,
+# tqdm and pyserial must wait until a feature needs them
+IMPORT_ALLOWED = {"pysark100", "numpy"}
+IMPORT_BUDGET = float(os.environ.get("PYSARK100_IMPORT_BUDGET", "1.0"))
+
+
+def test_import_is_lazy():
+    import json
+    import subprocess
+    import sys
+
+    script = (
+        "import json, sys, time\n"
+        "before = set(sys.modules)\n"
+        "start = time.perf_counter()\n"
+        "import pysark100, pysark100.cli.sark100\n"
+        "elapsed = time.perf_counter() - start\n"
+        "new = sorted({m.split('.')[0] for m in set(sys.modules) - before})\n"
+        "print(json.dumps({'elapsed': elapsed, 'modules': new}))\n"
+    )
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    out = subprocess.run([sys.executable, "-c", script], cwd=root, capture_output=True, text=True, check=True)
+    result = json.loads(out.stdout.strip().splitlines()[-1])
+
+    assert result["elapsed"] < IMPORT_BUDGET, f"Import took {result['elapsed']:.2f}s"
+
+    stdlib = getattr(sys, "stdlib_module_names", None)
+    if stdlib is None:
+        pytest.skip("sys.stdlib_module_names needs Python 3.10")
+    third_party = {m for m in result["modules"] if m not in stdlib and not m.startswith("_")}
+    assert third_party <= IMPORT_ALLOWED, f"Imported eagerly: {sorted(third_party - IMPORT_ALLOWED)}"